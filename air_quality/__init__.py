@@ -0,0 +1,5 @@
+"""Building blocks for the air quality pipelines, dashboard and notebooks.
+
+Submodules are imported explicitly (e.g. ``from air_quality import feature_store``)
+so that importing the package itself stays cheap.
+"""
@@ -0,0 +1,188 @@
+"""Streaming ingestion of historical air quality exports (aqicn.org CSV downloads).
+
+An export has one row per day, padded columns, newest day first and blank
+cells for missing values::
+
+    date, pm25, pm10, o3, no2
+    2025/11/1, 27, 13, , 1
+
+`stream_exports` parses any number of exports with pyarrow's streaming CSV
+reader and an explicit schema: `date` is parsed as yyyy/m/d by the parser,
+`pm25` as float32 and blank cells as nulls, so no cleaning passes are needed
+afterwards. Files are parsed in parallel threads (pyarrow releases the GIL),
+every block of at most `block_size` bytes becomes one chunk with the location
+columns of its station, and chunks are validated before they are yielded. A
+bounded queue between the parsers and the consumer keeps at most
+`max_pending` chunks in memory, however many years of exports are read.
+"""
+import glob
+import os
+import queue
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from pandas.api.types import union_categoricals
+
+from air_quality import tracing, validation
+from air_quality.ingestion import sensor_locations
+
+DATE_FORMAT = "%Y/%m/%d"    # also accepts the unpadded 2025/11/1 of the exports
+NULL_VALUES = ["", " ", "  ", "-"]
+BLOCK_SIZE = 1 << 20
+MAX_WORKERS = os.cpu_count() or 4
+MAX_PENDING = 16
+LOCATION_COLUMNS = ["country", "city", "street"]
+
+
+def clean_column_name(name: str) -> str:
+    """Strips the padding of an export header and makes it a valid Hopsworks feature name."""
+    name = name.strip().lower().replace(" ", "_")
+    return name if name[:1].isalpha() else f"f_{name.lstrip('_')}"
+
+
+def read_header(path: str) -> list:
+    with open(path, encoding="utf-8-sig") as f:
+        return [clean_column_name(c) for c in f.readline().rstrip("\r\n").split(",")]
+
+
+def _slug(text: str) -> str:
+    ascii_text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return "-".join("".join(c if c.isalnum() else " " for c in ascii_text.lower()).split())
+
+
+def match_files(pattern: str, city_config: dict) -> list:
+    """
+    (path, location) pairs for the exports matching the glob `pattern`. A file
+    belongs to the sensor whose `aq_csv` entry names it, otherwise to the sensor
+    whose display name, id or street appears in the file name (e.g.
+    goteborg-femman-air-quality.csv for "Göteborg Femman"). A single file of a
+    single-sensor config always belongs to that sensor.
+    """
+    files = sorted(glob.glob(pattern))
+    locations = sensor_locations(city_config)
+    sensors = list(zip(city_config["sensors"], locations[LOCATION_COLUMNS].to_dict("records")))
+    if len(files) == 1 and len(sensors) == 1:
+        return [(files[0], sensors[0][1])]
+
+    matched = []
+    for path in files:
+        name = _slug(os.path.splitext(os.path.basename(path))[0])
+        for sensor, location in sensors:
+            explicit = sensor.get("aq_csv")
+            if explicit is not None:
+                if os.path.basename(explicit) == os.path.basename(path):
+                    break
+                continue
+            candidates = [_slug(sensor.get("display_name", "")), _slug(sensor["id"]), _slug(location["street"])]
+            if any(c and c in name for c in candidates):
+                break
+        else:
+            print(f"Skipping {path}: no sensor in the city config matches it")
+            continue
+        matched.append((path, location))
+    return matched
+
+
+def read_export(path: str, location: dict, block_size: int = BLOCK_SIZE):
+    """Yields the rows of one export with a PM2.5 value as DataFrames of at most one block each."""
+    columns = read_header(path)
+    if "date" not in columns or "pm25" not in columns:
+        raise ValueError(f"{path} has no date and pm25 columns: {columns}")
+    reader = pa_csv.open_csv(
+        path,
+        read_options=pa_csv.ReadOptions(column_names=columns, skip_rows=1, block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=["date", "pm25"],
+            column_types={"date": pa.timestamp("ns"), "pm25": pa.float32()},
+            timestamp_parsers=[DATE_FORMAT],
+            null_values=NULL_VALUES,
+        ),
+    )
+    for batch in reader:
+        df = batch.to_pandas().rename(columns={"pm25": "pm2_5"}).dropna()
+        if df.empty:
+            continue
+        df = df.reset_index(drop=True)
+        codes = np.zeros(len(df), dtype="int8")
+        for column in LOCATION_COLUMNS:
+            # One station per file: a single-category column, without building a column of strings first
+            df[column] = pd.Categorical.from_codes(codes, categories=[location[column]])
+        yield df
+
+
+_DONE = object()
+
+
+def stream_exports(files: list, rules=None, block_size: int = BLOCK_SIZE, max_workers: int = MAX_WORKERS,
+                   max_pending: int = MAX_PENDING):
+    """
+    Yields validated chunks of all `files` ((path, location) pairs, see
+    `match_files`) as they are parsed. Chunks of different files interleave.
+    Raises the first parse or validation error.
+    """
+    if not files:
+        return
+    rules = rules if rules is not None else validation.DEFAULT_RULES["air_quality"]
+    chunks = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    def put(item):
+        # Gives up when the consumer stopped reading, instead of blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def parse(path, location):
+        try:
+            for chunk in read_export(path, location, block_size):
+                report = validation.validate(chunk, rules, name=f"air quality data {os.path.basename(path)}")
+                if not report.success:
+                    report.raise_if_failed()
+                if not put(chunk):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_DONE)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as pool:
+        for path, location in files:
+            pool.submit(parse, path, location)
+        try:
+            remaining = len(files)
+            while remaining:
+                item = chunks.get()
+                if item is _DONE:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+
+
+def concat_chunks(frames: list) -> pd.DataFrame:
+    """Streamed chunks in one frame (categorical location keys, float32 pm2_5), sorted by sensor and date."""
+    if not frames:
+        return pd.DataFrame(columns=["date", "pm2_5"] + LOCATION_COLUMNS)
+    # pd.concat turns categoricals with different categories into strings, union_categoricals keeps the codes
+    df = pd.concat([f.drop(columns=LOCATION_COLUMNS) for f in frames], ignore_index=True)
+    for column in LOCATION_COLUMNS:
+        df[column] = union_categoricals([f[column] for f in frames], sort_categories=True)
+    return df.sort_values(LOCATION_COLUMNS[1:] + ["date"]).reset_index(drop=True)
+
+
+@tracing.traced(kind="read")
+def read_exports(files: list, rules=None, **kwargs) -> pd.DataFrame:
+    """All rows of `files` in one frame, see `concat_chunks`."""
+    return concat_chunks(list(stream_exports(files, rules, **kwargs)))
@@ -0,0 +1,258 @@
+"""In-process pipeline runner.
+
+A pipeline is a list of `Stage`s, each a function with declared inputs and
+outputs (artifact names)::
+
+    Stage("validate", validate, inputs=("air_quality", "weather"), outputs=("validated",))
+
+`Pipeline.run` starts every stage as soon as all its inputs are available, so
+independent stages (e.g. the air quality, archive weather and forecast
+fetches) run in parallel threads, all in one Python process.
+
+Every artifact gets a fingerprint (a content hash of a DataFrame, otherwise of
+the value's JSON), and a stage's fingerprint combines its name, `params` and
+the fingerprints of its inputs. An output's fingerprint also includes the
+fingerprint of the stage that produced it, so a stage that writes somewhere
+(e.g. an insert returning row counts) still passes on a change of its inputs
+to the stages after it. Outputs of a stage are kept under
+.cache/pipeline_runs/<pipeline>/ with that fingerprint; when a later run
+computes the same fingerprint, the stage is skipped and its outputs are read
+back from there. Each stage runs inside a `tracing.stage` and `run` returns a
+`RunReport` with the status, wall time and output rows of every stage, which
+is also appended to runs.jsonl next to the stored outputs.
+"""
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from air_quality import tracing
+
+DEFAULT_STATE_DIR = str(Path(__file__).resolve().parent.parent / ".cache" / "pipeline_runs")
+MAX_WORKERS = 4
+STATE_FILE = "state.json"
+RUNS_FILE = "runs.jsonl"
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: object = field(repr=False)
+    inputs: tuple = ()
+    outputs: tuple = ()
+    params: dict = field(default_factory=dict)
+    kind: str = None
+    # Skip the stage when its fingerprint did not change since its last successful run
+    cache: bool = True
+
+
+@dataclass
+class StageRecord:
+    stage: str
+    status: str
+    seconds: float = 0.0
+    rows: int = None
+    fingerprint: str = None
+    error: str = None
+
+
+@dataclass
+class RunReport:
+    pipeline: str
+    records: list
+    seconds: float
+
+    def table(self) -> pd.DataFrame:
+        return pd.DataFrame([asdict(r) for r in self.records]).drop(columns=["fingerprint"])
+
+    def __str__(self):
+        lines = [f"{self.pipeline}: {self.seconds:.1f} s"]
+        for r in self.records:
+            rows = "" if r.rows is None else f"{r.rows} rows"
+            lines.append(f"  {r.stage:<20} {r.status:<12} {r.seconds:>8.2f} s  {rows}")
+        return "\n".join(lines)
+
+
+def fingerprint(value) -> str:
+    """Content hash of an artifact: DataFrames by their columns, types and values, anything else by its JSON."""
+    h = hashlib.sha256()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        h.update(json.dumps([list(map(str, frame.columns)), list(map(str, frame.dtypes))]).encode("utf-8"))
+        try:
+            h.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+        except TypeError:    # unhashable cells (lists, dicts)
+            h.update(frame.to_json(date_format="iso").encode("utf-8"))
+    else:
+        h.update(json.dumps(value, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    return None
+
+
+class Pipeline:
+    def __init__(self, name: str, stages: list, state_dir: str = DEFAULT_STATE_DIR):
+        names = [s.name for s in stages]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate stage names in {name}: {names}")
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"{output} is produced by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+        missing = {i for s in stages for i in s.inputs} - set(producers)
+        if missing:
+            raise ValueError(f"No stage of {name} produces {sorted(missing)}")
+        self.name = name
+        self.stages = list(stages)
+        self.path = Path(state_dir) / name
+
+    # -- stored state ----------------------------------------------------------
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.path / STATE_FILE, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self, state: dict):
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path / f".{STATE_FILE}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path / STATE_FILE)
+
+    def _artifact_path(self, name: str) -> Path:
+        return self.path / "artifacts" / f"{name}.pkl"
+
+    def _save_outputs(self, outputs: dict):
+        (self.path / "artifacts").mkdir(parents=True, exist_ok=True)
+        for name, (value, _) in outputs.items():
+            tmp_path = self._artifact_path(name).with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._artifact_path(name))
+
+    def _load_outputs(self, stage: Stage, stored: dict):
+        """The stored outputs of `stage` as {name: (value, fingerprint)}, None if any is missing."""
+        outputs = {}
+        for name in stage.outputs:
+            try:
+                with open(self._artifact_path(name), "rb") as f:
+                    outputs[name] = (pickle.load(f), stored["outputs"][name])
+            except (OSError, KeyError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+                return None
+        return outputs
+
+    # -- running ---------------------------------------------------------------
+
+    def stage_fingerprint(self, stage: Stage, input_fingerprints: dict) -> str:
+        key = json.dumps({"stage": stage.name, "params": stage.params, "inputs": input_fingerprints},
+                         sort_keys=True, default=str)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _run_stage(self, stage: Stage, inputs: dict, stored: dict, force: bool):
+        """Runs (or skips) one stage. Returns ({output: (value, fingerprint)}, StageRecord)."""
+        start = time.perf_counter()
+        input_fingerprints = {name: fp for name, (_, fp) in inputs.items()}
+        key = self.stage_fingerprint(stage, input_fingerprints)
+        known_inputs = all(fp is not None for fp in input_fingerprints.values())
+        if stage.cache and not force and known_inputs and stored and stored.get("fingerprint") == key:
+            outputs = self._load_outputs(stage, stored)
+            if outputs is not None:
+                rows = next((_rows(v) for v, _ in outputs.values() if _rows(v) is not None), None)
+                return outputs, StageRecord(stage.name, "skipped", time.perf_counter() - start, rows, key)
+
+        with tracing.stage(stage.name, kind=stage.kind) as s:
+            result = stage.fn(**{name: value for name, (value, _) in inputs.items()})
+            if len(stage.outputs) == 0:
+                values = []
+            elif len(stage.outputs) == 1:
+                values = [result]
+            else:
+                values = [result[name] for name in stage.outputs] if isinstance(result, dict) else list(result)
+            outputs = {name: (value, fingerprint([key, fingerprint(value)])) for name, value in zip(stage.outputs, values)}
+            rows = next((_rows(v) for v in values if _rows(v) is not None), None)
+            s.rows_out = rows
+        if stage.cache:
+            self._save_outputs(outputs)
+        return outputs, StageRecord(stage.name, "ran", time.perf_counter() - start, rows, key)
+
+    def run(self, only=None, skip=None, force: bool = False, max_workers: int = MAX_WORKERS) -> RunReport:
+        """
+        Runs the stages in `only` (default: all) except those in `skip`. Inputs
+        produced by stages that are not run are read from the last run that
+        stored them (None if there is none). `force` runs stages even if their
+        fingerprint did not change. Raises the first stage error after the
+        stages already running have finished.
+        """
+        names = {s.name for s in self.stages}
+        unknown = (set(only or ()) | set(skip or ())) - names
+        if unknown:
+            raise ValueError(f"Unknown stages of {self.name}: {sorted(unknown)}")
+        selected = (set(only) if only else names) - set(skip or ())
+
+        started = time.perf_counter()
+        state = self._load_state()
+        artifacts, records, error = {}, {}, None
+        for stage in self.stages:
+            if stage.name not in selected:
+                stored = state.get(stage.name)
+                outputs = self._load_outputs(stage, stored) if stored else None
+                artifacts.update(outputs or {name: (None, None) for name in stage.outputs})
+                records[stage.name] = StageRecord(stage.name, "not selected")
+
+        pending = [s for s in self.stages if s.name in selected]
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                if error is None:
+                    for stage in [s for s in pending if all(i in artifacts for i in s.inputs)]:
+                        pending.remove(stage)
+                        inputs = {name: artifacts[name] for name in stage.inputs}
+                        future = pool.submit(self._run_stage, stage, inputs, state.get(stage.name), force)
+                        running[future] = stage
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        outputs, record = future.result()
+                    except Exception as e:
+                        error = error or e
+                        records[stage.name] = StageRecord(stage.name, "failed", error=f"{type(e).__name__}: {e}")
+                        print(f"Stage {stage.name} failed: {e}")
+                        continue
+                    artifacts.update(outputs)
+                    records[stage.name] = record
+                    if record.status == "ran":
+                        state[stage.name] = {"fingerprint": record.fingerprint if stage.cache else None,
+                                             "outputs": {name: fp for name, (_, fp) in outputs.items()},
+                                             "finished_at": pd.Timestamp.now(tz="UTC").isoformat()}
+                    print(f"Stage {stage.name} {record.status} ({record.seconds:.2f} s)")
+        for stage in pending:
+            records[stage.name] = StageRecord(stage.name, "not run")
+
+        self._save_state(state)
+        report = RunReport(self.name, [records[s.name] for s in self.stages], time.perf_counter() - started)
+        with open(self.path / RUNS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"pipeline": self.name, "finished_at": pd.Timestamp.now(tz="UTC").isoformat(),
+                                "seconds": round(report.seconds, 3),
+                                "stages": [asdict(r) for r in report.records]}, default=str) + "\n")
+        print(report)
+        if error is not None:
+            raise error
+        return report
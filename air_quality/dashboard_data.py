@@ -0,0 +1,176 @@
+"""Cached data layer for the Streamlit dashboard.
+
+Streamlit reruns the whole script on every interaction, so without a cache each
+slider move downloads the model, re-reads aq_predictions and (with the hindcast
+box checked) re-reads and re-joins air_quality. This module keeps those results
+in a process-wide `DataCache` (modules survive reruns, only the script is
+re-executed):
+
+- feature group data is keyed on (name, version, latest commit), so a new
+  commit yields a new entry; the latest commit itself is only looked up once
+  per FRESHNESS_TTL_SECONDS,
+- every entry also expires after its TTL,
+- pipelines call `invalidate()` after writing, which touches a marker file; the
+  dashboard process clears its cache when the marker is newer than its last
+  clear, so fresh predictions show up on the next rerun,
+- hits and misses are counted per kind of entry (`metrics()`).
+"""
+import os
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+from air_quality import feature_store, model_cache
+
+DEFAULT_INVALIDATION_FILE = str(Path(__file__).resolve().parent.parent / "data" / "dashboard_cache.invalidate")
+
+FRESHNESS_TTL_SECONDS = 60
+DATA_TTL_SECONDS = 15 * 60
+MODEL_TTL_SECONDS = 24 * 3600
+
+# Upper end of the dashboard's forecast slider, read once and sliced per rerun
+MAX_FORECAST_DAYS = 7
+
+
+class DataCache:
+    """TTL cache with hit/miss counters and marker-file invalidation."""
+
+    def __init__(self, invalidation_file: str = DEFAULT_INVALIDATION_FILE):
+        self.invalidation_file = invalidation_file
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._cleared_at = self._marker_time()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.invalidations = 0
+
+    def _marker_time(self):
+        try:
+            return os.stat(self.invalidation_file).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def _check_invalidation(self):
+        marker_time = self._marker_time()
+        if marker_time > self._cleared_at:
+            self.clear()
+            self._cleared_at = marker_time
+            self.invalidations += 1
+
+    def get(self, kind: str, key: tuple, compute, ttl: float = DATA_TTL_SECONDS):
+        """Returns the cached value for (kind, *key), calling `compute()` on a miss or after `ttl` seconds."""
+        self._check_invalidation()
+        full_key = (kind,) + tuple(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+        if entry is not None and entry[0] > now:
+            self.hits[kind] += 1
+            return entry[1]
+
+        self.misses[kind] += 1
+        value = compute()
+        with self._lock:
+            # Drop expired entries, e.g. the ones keyed on an older commit
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            self._entries[full_key] = (now + ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> pd.DataFrame:
+        kinds = sorted(set(self.hits) | set(self.misses))
+        rows = []
+        for kind in kinds:
+            total = self.hits[kind] + self.misses[kind]
+            rows.append({"kind": kind, "hits": self.hits[kind], "misses": self.misses[kind],
+                         "hit_rate": self.hits[kind] / total if total else 0.0})
+        return pd.DataFrame(rows, columns=["kind", "hits", "misses", "hit_rate"])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> DataCache:
+    """The process-wide cache, with the marker file from DASHBOARD_CACHE_INVALIDATION_FILE if set."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DataCache(os.getenv("DASHBOARD_CACHE_INVALIDATION_FILE", DEFAULT_INVALIDATION_FILE))
+        return _cache
+
+
+def invalidate(invalidation_file: str = None):
+    """Called by the pipelines after writing; the dashboard drops its cache on the next rerun."""
+    path = Path(invalidation_file or os.getenv("DASHBOARD_CACHE_INVALIDATION_FILE", DEFAULT_INVALIDATION_FILE))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+# -- dashboard data ----------------------------------------------------------
+
+def latest_commit(fg, cache: DataCache = None):
+    """Id of the latest commit to `fg` (None if the backend does not report commits)."""
+    cache = cache or get_cache()
+    return cache.get("freshness", (fg.name, fg.version), lambda: feature_store.latest_commit_id(fg),
+                     ttl=FRESHNESS_TTL_SECONDS)
+
+
+def _fg_key(fg, cache):
+    return (fg.name, fg.version, latest_commit(fg, cache))
+
+
+def get_feature_group(fs, name, version, cache: DataCache = None):
+    cache = cache or get_cache()
+    return cache.get("feature_group", (name, version), lambda: fs.get_feature_group(name=name, version=version),
+                     ttl=MODEL_TTL_SECONDS)
+
+
+def model_dir(project, name, version, cache: DataCache = None) -> str:
+    """Local directory of the downloaded model artifact (kept in .cache/models across restarts)."""
+    cache = cache or get_cache()
+
+    def download():
+        return model_cache.ModelCache(project.get_model_registry()).path(name, version)
+
+    return cache.get("model", (name, version), download, ttl=MODEL_TTL_SECONDS)
+
+
+def forecast(monitor_fg, forecast_days: int, cache: DataCache = None) -> pd.DataFrame:
+    """
+    Predictions with days_before_forecast_day <= forecast_days. Reads up to
+    MAX_FORECAST_DAYS once per commit, so moving the slider only slices the cached frame.
+    """
+    cache = cache or get_cache()
+    predictions = cache.get(
+        "forecast", _fg_key(monitor_fg, cache),
+        lambda: monitor_fg.filter(monitor_fg.days_before_forecast_day <= MAX_FORECAST_DAYS).read())
+    return predictions[predictions["days_before_forecast_day"] <= forecast_days].copy()
+
+
+def hindcast(monitor_fg, air_quality_fg, today, cache: DataCache = None) -> pd.DataFrame:
+    """1-day prior predictions joined with the observed PM2.5 before `today`."""
+    cache = cache or get_cache()
+
+    def join():
+        monitoring_df = monitor_fg.filter(monitor_fg.days_before_forecast_day == 1).read()
+        if monitoring_df.empty:
+            return pd.DataFrame(columns=["date", "predicted_pm25", "pm2_5"])
+        # Only read the outcomes for the window covered by the predictions
+        outcome_df = air_quality_fg.select(["date", "pm2_5"]).filter(
+            (air_quality_fg.date >= monitoring_df["date"].min()) & (air_quality_fg.date < today)
+        ).read()
+        # There were placeholder values in the original data for future dates, only keep previous values
+        outcome_df = outcome_df[outcome_df["date"] < today]
+        hindcast_df = pd.merge(monitoring_df[["date", "predicted_pm25"]], outcome_df[["date", "pm2_5"]],
+                               on="date", how="inner")
+        return hindcast_df.sort_values(["date"], ascending=True)
+
+    key = _fg_key(monitor_fg, cache) + _fg_key(air_quality_fg, cache) + (str(today),)
+    return cache.get("hindcast", key, join).copy()
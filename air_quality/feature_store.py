@@ -0,0 +1,444 @@
+"""Pluggable feature store backends.
+
+``get_feature_store()`` returns either the Hopsworks feature store or a local,
+date-partitioned Parquet store that offers the same
+get_or_create_feature_group / insert / read / filter surface, so pipelines and
+the dashboard can run offline.
+
+Each local feature group is a directory with one Parquet file per month of
+event time::
+
+    data/feature_store/air_quality_1/
+        _metadata.json
+        date=2025-10/data.parquet
+        date=2025-11/data.parquet
+
+Filters on the event time column are used to skip whole partitions, and every
+filter is also handed to pyarrow so row groups whose min/max statistics cannot
+match (e.g. ``days_before_forecast_day``) are never decoded. Read cost
+therefore follows the requested window, not the length of the history.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DEFAULT_LOCAL_DIR = str(Path(__file__).resolve().parent.parent / "data" / "feature_store")
+ROW_GROUP_SIZE = 1024
+_METADATA_FILE = "_metadata.json"
+_DATA_FILE = "data.parquet"
+_UNPARTITIONED = "all"
+
+
+def get_feature_store(backend: str = None, project=None, local_dir: str = None):
+    """
+    Returns the feature store selected by `backend` or the FEATURE_STORE_BACKEND
+    environment variable: "hopsworks" (default) or "local".
+    """
+    backend = (backend or os.getenv("FEATURE_STORE_BACKEND", "hopsworks")).lower()
+    if backend == "local":
+        return LocalFeatureStore(local_dir or os.getenv("LOCAL_FEATURE_STORE_DIR", DEFAULT_LOCAL_DIR))
+    if backend != "hopsworks":
+        raise ValueError(f"Unknown feature store backend: {backend}")
+
+    if project is None:
+        import hopsworks
+        project = hopsworks.login(
+            project=os.getenv("HOPSWORKS_PROJECT"),
+            api_key_value=os.getenv("HOPSWORKS_API_KEY"),
+        )
+    return project.get_feature_store()
+
+
+def latest_commit_id(fg):
+    """Id of the latest commit to a Hopsworks or local feature group, None if it cannot be read."""
+    try:
+        commits = fg.commit_details(limit=1)
+    except Exception as e:
+        print(f"Could not read commits of {fg.name}: {e}")
+        return None
+    return max(commits) if commits else None
+
+
+def _to_utc(values):
+    """Event times are stored as UTC timestamps, like Hopsworks returns them."""
+    if isinstance(values, pd.Series):
+        values = pd.to_datetime(values)
+        if values.dt.tz is None:
+            return values.dt.tz_localize("UTC")
+        return values.dt.tz_convert("UTC")
+    ts = pd.Timestamp(values)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+class Feature:
+    """A column handle; comparisons build filters, e.g. `fg.date >= "2025-01-01"`."""
+
+    def __init__(self, name, type=None):
+        self.name = name
+        self.type = type
+
+    def _filter(self, op, value):
+        return Filter(self.name, op, value)
+
+    def __eq__(self, value):
+        return self._filter("==", value)
+
+    def __ne__(self, value):
+        return self._filter("!=", value)
+
+    def __lt__(self, value):
+        return self._filter("<", value)
+
+    def __le__(self, value):
+        return self._filter("<=", value)
+
+    def __gt__(self, value):
+        return self._filter(">", value)
+
+    def __ge__(self, value):
+        return self._filter(">=", value)
+
+    def isin(self, values):
+        return self._filter("isin", list(values))
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return f"Feature({self.name!r}, {self.type!r})"
+
+
+class Filter:
+    """A single comparison, combinable with `&` and `|`."""
+
+    _OPS = {
+        "==": lambda f, v: f == v,
+        "!=": lambda f, v: f != v,
+        "<": lambda f, v: f < v,
+        "<=": lambda f, v: f <= v,
+        ">": lambda f, v: f > v,
+        ">=": lambda f, v: f >= v,
+    }
+
+    def __init__(self, feature, op, value):
+        self.feature = feature
+        self.op = op
+        self.value = value
+
+    def __and__(self, other):
+        return Logic("AND", self, other)
+
+    def __or__(self, other):
+        return Logic("OR", self, other)
+
+    def to_expression(self, event_time=None):
+        field = pc.field(self.feature)
+        if self.feature == event_time:
+            convert = lambda v: pa.scalar(_to_utc(v).to_pydatetime(), type=pa.timestamp("ns", tz="UTC"))
+        else:
+            convert = lambda v: v
+        if self.op == "isin":
+            return field.isin([convert(v) for v in self.value])
+        return self._OPS[self.op](field, convert(self.value))
+
+    def time_bounds(self, event_time):
+        """Returns the (lower, upper) event time bounds implied by this filter."""
+        if self.feature != event_time or self.op == "!=":
+            return None, None
+        if self.op == "isin":
+            values = [_to_utc(v) for v in self.value]
+            return (min(values), max(values)) if values else (None, None)
+        value = _to_utc(self.value)
+        if self.op == "==":
+            return value, value
+        if self.op in (">", ">="):
+            return value, None
+        return None, value
+
+    def __repr__(self):
+        return f"Filter({self.feature} {self.op} {self.value!r})"
+
+
+class Logic(Filter):
+    """AND/OR combination of two filters."""
+
+    def __init__(self, type, left, right):
+        self.type = type
+        self.left = left
+        self.right = right
+
+    def to_expression(self, event_time=None):
+        left = self.left.to_expression(event_time)
+        right = self.right.to_expression(event_time)
+        return (left & right) if self.type == "AND" else (left | right)
+
+    def time_bounds(self, event_time):
+        (l_lo, l_hi), (r_lo, r_hi) = self.left.time_bounds(event_time), self.right.time_bounds(event_time)
+        if self.type == "AND":
+            lower = max((b for b in (l_lo, r_lo) if b is not None), default=None)
+            upper = min((b for b in (l_hi, r_hi) if b is not None), default=None)
+            return lower, upper
+        # OR: the window is only bounded if both sides are
+        lower = min(l_lo, r_lo) if l_lo is not None and r_lo is not None else None
+        upper = max(l_hi, r_hi) if l_hi is not None and r_hi is not None else None
+        return lower, upper
+
+    def __repr__(self):
+        return f"({self.left!r} {self.type} {self.right!r})"
+
+
+class Query:
+    """Lazy selection over a local feature group, executed by `read()`."""
+
+    def __init__(self, feature_group, columns=None, filter=None):
+        self._fg = feature_group
+        self._columns = columns
+        self._filter = filter
+
+    def filter(self, f):
+        combined = f if self._filter is None else (self._filter & f)
+        return Query(self._fg, self._columns, combined)
+
+    def select(self, features):
+        return Query(self._fg, [getattr(f, "name", f) for f in features], self._filter)
+
+    def read(self, **kwargs):
+        return self._fg._read(self._columns, self._filter)
+
+    def show(self, n):
+        return self.read().head(n)
+
+    def __repr__(self):
+        return f"Query({self._fg.name}_{self._fg.version}, columns={self._columns}, filter={self._filter!r})"
+
+
+class LocalFeatureGroup:
+    """A feature group stored as monthly Parquet partitions on local disk."""
+
+    def __init__(self, store, name, version, primary_key, event_time=None, description="", **kwargs):
+        self._store = store
+        self.name = name
+        self.version = version
+        self.primary_key = list(primary_key or [])
+        self.event_time = event_time
+        self.description = description
+
+    @property
+    def path(self) -> Path:
+        return self._store.root / f"{self.name}_{self.version}"
+
+    def _save_metadata(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "name": self.name,
+            "version": self.version,
+            "primary_key": self.primary_key,
+            "event_time": self.event_time,
+            "description": self.description,
+        }
+        with open(self.path / _METADATA_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    # -- schema ------------------------------------------------------------
+
+    def _files(self):
+        return sorted(self.path.glob(f"*/{_DATA_FILE}"))
+
+    def _schema(self):
+        files = self._files()
+        return pa.unify_schemas([pq.read_schema(f) for f in files]) if files else None
+
+    @property
+    def features(self):
+        schema = self._schema()
+        if schema is None:
+            return []
+        return [Feature(field.name, str(field.type)) for field in schema]
+
+    def get_feature(self, name):
+        return Feature(name)
+
+    def __getattr__(self, name):
+        # Mirrors hsfs, where `fg.<column>` returns a Feature usable in filters
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return Feature(name)
+
+    # -- writes ------------------------------------------------------------
+
+    def _partition_of(self, df):
+        if self.event_time is None or self.event_time not in df.columns:
+            return pd.Series(_UNPARTITIONED, index=df.index)
+        return df[self.event_time].dt.strftime("%Y-%m")
+
+    def _partition_dir(self, key):
+        column = self.event_time or "partition"
+        return self.path / f"{column}={key}"
+
+    def _sort_columns(self, df):
+        # Numeric keys first (e.g. days_before_forecast_day) so row-group statistics are tight for them
+        numeric = [c for c in self.primary_key if c != self.event_time and pd.api.types.is_numeric_dtype(df[c])]
+        ordered = numeric + ([self.event_time] if self.event_time in df.columns else [])
+        return ordered + [c for c in self.primary_key if c not in ordered]
+
+    def insert(self, df: pd.DataFrame, write_options=None, wait=None, **kwargs):
+        """
+        Upserts `df` on the primary key. Only the partitions touched by `df` are rewritten.
+        """
+        if df.empty:
+            return None, None
+        df = df.copy()
+        if self.event_time in df.columns:
+            df[self.event_time] = _to_utc(df[self.event_time])
+
+        # Keep column types stable across partitions so reads can unify the schema
+        files = self._files()
+        if files:
+            dtypes = pq.read_schema(files[-1]).empty_table().to_pandas().dtypes
+            for column in df.columns.intersection(dtypes.index):
+                if isinstance(dtypes[column], pd.CategoricalDtype):
+                    # Dictionary-encoded column: the categories are per partition, only the encoding is kept
+                    if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                        df[column] = df[column].astype("category")
+                elif df[column].dtype != dtypes[column]:
+                    df[column] = df[column].astype(dtypes[column])
+        categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+
+        for key, part in df.groupby(self._partition_of(df), sort=True):
+            part_dir = self._partition_dir(key)
+            data_file = part_dir / _DATA_FILE
+            if data_file.exists():
+                existing = pq.read_table(data_file).to_pandas()
+                part = pd.concat([existing, part], ignore_index=True)
+                if categorical:
+                    # Concatenating different categories gives strings, re-encode before writing
+                    part[categorical] = part[categorical].astype("category")
+            if self.primary_key:
+                part = part.drop_duplicates(subset=self.primary_key, keep="last")
+            part = part.sort_values(self._sort_columns(part)).reset_index(drop=True)
+
+            part_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = part_dir / f".{_DATA_FILE}.tmp"
+            pq.write_table(
+                pa.Table.from_pandas(part, preserve_index=False),
+                tmp_file,
+                row_group_size=ROW_GROUP_SIZE,
+                compression="zstd",
+            )
+            os.replace(tmp_file, data_file)
+        return None, None
+
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def commit_details(self, limit=None, **kwargs):
+        """
+        Like hsfs, returns {commit_id: {"committedOn": ...}}. Every insert rewrites
+        its partitions atomically, so the newest partition file marks the last commit.
+        """
+        files = self._files()
+        if not files:
+            return {}
+        commit_ns = max(f.stat().st_mtime_ns for f in files)
+        committed_on = pd.Timestamp(commit_ns, unit="ns", tz="UTC").strftime("%Y%m%d%H%M%S%f")
+        return {commit_ns: {"committedOn": committed_on}}
+
+    # -- reads -------------------------------------------------------------
+
+    def _partition_files(self, lower, upper):
+        """Files whose month may contain event times in [lower, upper]."""
+        files = []
+        for data_file in self._files():
+            key = data_file.parent.name.split("=", 1)[-1]
+            if key != _UNPARTITIONED and (lower is not None or upper is not None):
+                month_start = pd.Timestamp(f"{key}-01", tz="UTC")
+                month_end = month_start + pd.offsets.MonthBegin(1)
+                if upper is not None and month_start > upper:
+                    continue
+                if lower is not None and month_end <= lower:
+                    continue
+            files.append(data_file)
+        return files
+
+    def _read(self, columns=None, filter=None):
+        lower, upper = filter.time_bounds(self.event_time) if filter is not None else (None, None)
+        files = self._partition_files(lower, upper)
+        if not files:
+            return pd.DataFrame(columns=columns or [f.name for f in self.features])
+
+        schema = pa.unify_schemas([pq.read_schema(f) for f in files])
+        dataset = ds.dataset([str(f) for f in files], schema=schema, format="parquet")
+        expression = filter.to_expression(self.event_time) if filter is not None else None
+        table = dataset.to_table(columns=columns, filter=expression)
+        return table.to_pandas().reset_index(drop=True)
+
+    def read(self, **kwargs):
+        return self._read()
+
+    def filter(self, f):
+        return Query(self).filter(f)
+
+    def select(self, features):
+        return Query(self).select(features)
+
+    def select_all(self):
+        return Query(self)
+
+    def select_features(self):
+        keys = set(self.primary_key) | {self.event_time}
+        return Query(self, [f.name for f in self.features if f.name not in keys])
+
+    def show(self, n):
+        return self.read().head(n)
+
+    def __repr__(self):
+        return f"LocalFeatureGroup({self.name!r}, version={self.version})"
+
+
+class LocalFeatureStore:
+    """Offline stand-in for the Hopsworks feature store."""
+
+    def __init__(self, root: str = DEFAULT_LOCAL_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _load(self, name, version):
+        meta_file = self.root / f"{name}_{version}" / _METADATA_FILE
+        if not meta_file.exists():
+            return None
+        with open(meta_file, encoding="utf-8") as f:
+            meta = json.load(f)
+        return LocalFeatureGroup(self, **meta)
+
+    def get_feature_group(self, name, version=1):
+        fg = self._load(name, version)
+        if fg is None:
+            raise ValueError(f"Feature group {name}/{version} not found in {self.root}")
+        return fg
+
+    def get_feature_groups(self, name):
+        groups = []
+        for meta_file in sorted(self.root.glob(f"{name}_*/{_METADATA_FILE}")):
+            version = meta_file.parent.name[len(name) + 1:]
+            if version.isdigit():
+                groups.append(self._load(name, int(version)))
+        return groups
+
+    def get_or_create_feature_group(self, name, version=1, primary_key=None, event_time=None,
+                                    description="", **kwargs):
+        """Same signature as hsfs; options such as `expectation_suite` are accepted and ignored."""
+        fg = self._load(name, version)
+        if fg is None:
+            fg = LocalFeatureGroup(self, name, version, primary_key, event_time, description)
+            fg._save_metadata()
+        return fg
+
+    def __repr__(self):
+        return f"LocalFeatureStore({str(self.root)!r})"
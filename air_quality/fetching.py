@@ -0,0 +1,123 @@
+"""Fetching weather, air quality and location data from external APIs.
+
+All requests go through the shared client in `air_quality.http_client`.
+"""
+import datetime
+
+import pandas as pd
+import requests
+
+from air_quality import http_client, openmeteo, schema, tracing
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+ECMWF_URL = "https://api.open-meteo.com/v1/ecmwf"
+HISTORICAL_DAILY_VARIABLES = ["temperature_2m_mean", "precipitation_sum", "wind_speed_10m_max", "wind_direction_10m_dominant"]
+FORECAST_HOURLY_VARIABLES = ["temperature_2m", "precipitation", "wind_speed_10m", "wind_direction_10m"]
+
+
+def _weather_api(url: str, params: dict, block: str, variables: list) -> pd.DataFrame:
+    """One location from an Open-Meteo endpoint in the binary format, with its variables matched by name."""
+    params = dict(params, format=openmeteo.FORMAT, **{block: ",".join(variables)})
+    response = http_client.get_client().get(url, params=params)
+    response.raise_for_status()
+    df = openmeteo.decode(response.content, variables, block).rename(columns={"time": "date"})
+    return df.dropna().reset_index(drop=True)
+
+@tracing.traced(kind="fetch")
+def get_historical_weather(city, start_date,  end_date, latitude, longitude):
+    # latitude, longitude = get_city_coordinates(city)
+
+    # Archive responses are cached by the shared client and never expire
+    daily_dataframe = _weather_api(ARCHIVE_URL, {
+        "latitude": latitude,
+        "longitude": longitude,
+        "start_date": start_date,
+        "end_date": end_date,
+    }, "daily", HISTORICAL_DAILY_VARIABLES)
+    daily_dataframe['city'] = city
+    return daily_dataframe
+
+@tracing.traced(kind="fetch")
+def get_hourly_weather_forecast(city, latitude, longitude):
+
+    # latitude, longitude = get_city_coordinates(city)
+
+    # Hourly values keep their hourly names (temperature_2m, precipitation, wind_speed_10m, wind_direction_10m)
+    return _weather_api(ECMWF_URL, {"latitude": latitude, "longitude": longitude}, "hourly", FORECAST_HOURLY_VARIABLES)
+
+
+
+def get_city_coordinates(city_name: str):
+    """
+    Takes city name and returns its latitude and longitude (rounded to 2 digits after dot).
+    """
+    # Nominatim API (for getting lat and long of the city), cached and rate limited by the shared client
+    results = http_client.get_client().get_json(
+        "https://nominatim.openstreetmap.org/search",
+        params={"q": city_name, "format": "json", "limit": 1},
+    )
+    city = results[0]
+
+    latitude = round(float(city["lat"]), 2)
+    longitude = round(float(city["lon"]), 2)
+
+    return latitude, longitude
+
+def trigger_request(url:str):
+    response = http_client.get_client().get(url)
+    if response.status_code == 200:
+        # Extract the JSON content from the response
+        data = response.json()
+    else:
+        print("Failed to retrieve data. Status Code:", response.status_code)
+        raise requests.exceptions.RequestException(response.status_code)
+
+    return data
+
+
+# Feed URL that resolved each station, so later calls skip the "Unknown station" fallbacks
+_waqi_feed_urls = {}
+
+@tracing.traced(kind="fetch")
+def get_pm25(aqicn_url: str, country: str, city: str, street: str, day: datetime.date, AQI_API_KEY: str):
+    """
+    Returns DataFrame with air quality (pm25) as dataframe
+    """
+    station = (aqicn_url, country, city, street)
+    candidates = [
+        aqicn_url,
+        # if we get 'Unknown station' response then retry with city in url
+        f"https://api.waqi.info/feed/{country}/{street}",
+        f"https://api.waqi.info/feed/{country}/{city}/{street}",
+    ]
+    if station in _waqi_feed_urls:
+        candidates = [_waqi_feed_urls[station]]
+
+    # Make a GET request to fetch the data from the API (responses are cached for a few minutes)
+    for feed_url in candidates:
+        data = trigger_request(f"{feed_url}/?token={AQI_API_KEY}")
+        if data['data'] != "Unknown station":
+            _waqi_feed_urls[station] = feed_url
+            break
+
+
+    # Check if the API response contains the data
+    if data['status'] == 'ok':
+        # Extract the air quality data
+        aqi_data = data['data']
+        aq_today_df = pd.DataFrame()
+        aq_today_df['pm2_5'] = [aqi_data['iaqi'].get('pm2_5', {}).get('v', None)]
+
+        aq_today_df['country'] = country
+        aq_today_df['city'] = city
+        aq_today_df['street'] = street
+        aq_today_df['date'] = day
+        aq_today_df['date'] = pd.to_datetime(aq_today_df['date'])
+        aq_today_df['url'] = aqicn_url
+        # Location keys as categoricals, pm2_5 as float32
+        aq_today_df = schema.apply(aq_today_df, "air_quality")
+    else:
+        print("Error: There may be an incorrect  URL for your Sensor or it is not contactable right now. The API response does not contain data.  Error message:", data['data'])
+        raise requests.exceptions.RequestException(data['data'])
+
+    return aq_today_df
@@ -0,0 +1,102 @@
+"""Recursive multi-horizon PM2.5 forecasting.
+
+The model predicts one day ahead from the previous days' PM2.5 (lag features)
+and that day's weather. To forecast a whole horizon, the prediction of step h
+is fed back as the newest "reading" so the lags of step h + 1 are built from
+it, instead of reusing the last observed lags for every forecast day.
+
+Each horizon step makes a single `model.predict` call for all sensors, so a
+7 day forecast costs 7 batched calls however many sensors are configured.
+"""
+import numpy as np
+import pandas as pd
+
+from air_quality import tracing
+from air_quality.features import DATE, KEYS, VALUE, LOOKBACK_DAYS, LagFeatureEngine
+
+PREDICTION = "predicted_pm25"
+HORIZON_COLUMN = "days_before_forecast_day"
+
+# Location columns copied from the history onto the predictions (besides KEYS)
+INFO_COLUMNS = ("country",)
+
+
+def model_feature_columns(model) -> list:
+    """Feature names the model was trained on (XGBoost keeps them in the booster)."""
+    names = getattr(model, "feature_names_in_", None)
+    if names is None:
+        names = model.get_booster().feature_names
+    if names is None:
+        raise ValueError("The model has no feature names, pass feature_cols explicitly")
+    return list(names)
+
+
+def _to_utc(dates: pd.Series) -> pd.Series:
+    return pd.to_datetime(dates, utc=True)
+
+
+@tracing.traced(kind="predict")
+def recursive_forecast(model, history_df: pd.DataFrame, weather_forecast_df: pd.DataFrame,
+                       feature_cols: list = None, horizon: int = None,
+                       lookback_days: int = LOOKBACK_DAYS) -> pd.DataFrame:
+    """
+    Forecasts PM2.5 for every (city, street) in `history_df` over the dates in
+    `weather_forecast_df` that come after the last observation.
+
+    `history_df` holds observed readings (city, street, date, pm2_5), e.g. the
+    recent rows of the air_quality or air_quality_lagged feature group.
+    `weather_forecast_df` holds one row per forecast date, either per sensor
+    (with city and street columns) or shared by all sensors (date only).
+
+    Returns one row per sensor and forecast date with the model features,
+    `predicted_pm25` and `days_before_forecast_day` (1 for the first forecast
+    date), ready to insert into the aq_predictions feature group.
+    """
+    feature_cols = list(feature_cols or model_feature_columns(model))
+
+    history_df = history_df.dropna(subset=[VALUE]).copy()
+    history_df[DATE] = _to_utc(history_df[DATE])
+    last_observed = history_df[DATE].max()
+    history_df = history_df[history_df[DATE] > last_observed - pd.Timedelta(days=lookback_days)]
+
+    weather_df = weather_forecast_df.copy()
+    weather_df[DATE] = _to_utc(weather_df[DATE])
+    weather_df = weather_df[weather_df[DATE] > last_observed]
+    per_sensor_weather = all(k in weather_df.columns for k in KEYS)
+    weather_keys = KEYS + [DATE] if per_sensor_weather else [DATE]
+    weather_df = weather_df.drop_duplicates(subset=weather_keys, keep="last")
+
+    forecast_dates = sorted(weather_df[DATE].unique())[:horizon]
+    if not forecast_dates:
+        print(f"No weather forecast after the last observation ({last_observed.date()})")
+        return pd.DataFrame(columns=KEYS + [DATE] + feature_cols + [PREDICTION, HORIZON_COLUMN])
+
+    engine = LagFeatureEngine.from_history(history_df[KEYS + [DATE, VALUE]])
+    missing = [c for c in feature_cols if c not in engine.feature_columns and c not in weather_df.columns]
+    if missing:
+        raise ValueError(f"Features neither computed from PM2.5 nor in the weather forecast: {missing}")
+
+    info_columns = [c for c in INFO_COLUMNS if c in history_df.columns]
+    sensors = history_df.sort_values(DATE).groupby(KEYS, sort=False, observed=True)[info_columns].last()
+
+    weather_columns = [c for c in weather_df.columns if c not in KEYS + [DATE]]
+    steps = []
+    for step, date in enumerate(forecast_dates, start=1):
+        step_df = engine.next_features()
+        step_df[DATE] = date
+        step_df = step_df.merge(weather_df[weather_keys + weather_columns], on=weather_keys, how="left")
+
+        # One batched prediction for all sensors, fed back as the next step's lags
+        step_df[PREDICTION] = np.asarray(model.predict(step_df[feature_cols]), dtype="float64")
+        step_df[HORIZON_COLUMN] = step
+        engine.update(step_df[KEYS + [DATE, PREDICTION]].rename(columns={PREDICTION: VALUE}))
+        steps.append(step_df)
+
+    forecast_df = pd.concat(steps, ignore_index=True)
+    if info_columns:
+        forecast_df = forecast_df.merge(sensors.reset_index(), on=KEYS, how="left")
+    columns = KEYS + info_columns + [DATE] + feature_cols + [PREDICTION, HORIZON_COLUMN]
+    columns += [c for c in weather_columns if c not in columns]
+    print(f"Forecast {len(forecast_dates)} days for {len(sensors)} sensors "
+          f"({len(forecast_dates)} batched predictions)")
+    return forecast_df[columns].sort_values(by=KEYS + [DATE]).reset_index(drop=True)
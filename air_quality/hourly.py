@@ -0,0 +1,104 @@
+"""Hourly measurements and their daily aggregates.
+
+The hourly path keeps every PM2.5 and weather reading (instead of only the
+12:00 value) as float32, one row per (sensor, hour). `daily_aggregates` turns
+any number of sensors into daily rows with a single groupby: each aggregate is
+computed from a masked column (NaN outside the hours it covers), so the mean,
+max, 12:00 value and night/day split all come from one pass over the data.
+
+The daily rows keep the column names of the daily pipeline (`pm2_5` is the
+12:00 reading, `temperature_2m_max`, `wind_speed_10m_max`, ...), so models
+trained on the daily feature groups can be trained from them as well.
+"""
+import numpy as np
+import pandas as pd
+
+from air_quality import schema, tracing
+
+KEYS = ["city", "street"]
+DATE = "date"
+MEASUREMENTS = schema.MEASUREMENTS["air_quality_hourly"]
+REPRESENTATIVE_HOUR = 12
+NIGHT_HOURS = (22, 23, 0, 1, 2, 3, 4, 5)
+
+
+def compact(hourly_df: pd.DataFrame) -> pd.DataFrame:
+    """Categorical location keys, float32 measurements and datetime dates, sorted by sensor and hour."""
+    df = schema.apply(hourly_df, "air_quality_hourly").copy()
+    df[DATE] = pd.to_datetime(df[DATE])
+    return df.sort_values(KEYS + [DATE]).reset_index(drop=True)
+
+
+@tracing.traced(kind="aggregate")
+def daily_aggregates(hourly_df: pd.DataFrame, representative_hour: int = REPRESENTATIVE_HOUR,
+                     night_hours=NIGHT_HOURS) -> pd.DataFrame:
+    """
+    One row per (city, street, day) with:
+
+    - pm2_5 (the reading at `representative_hour`), pm2_5_mean, pm2_5_max,
+      pm2_5_night_mean and pm2_5_day_mean (`night_hours` vs the rest),
+    - temperature_2m_mean/max/min, precipitation_sum, wind_speed_10m_mean/max,
+      wind_gusts_10m_max and wind_direction_10m_dominant (the direction of the
+      summed wind vectors, like Open-Meteo's daily value),
+    - hours: the number of hourly rows of the day.
+    """
+    info = [c for c in ("country",) if c in hourly_df.columns]
+    dates = pd.to_datetime(hourly_df[DATE])
+    hour = dates.dt.hour.to_numpy()
+    night = np.isin(hour, night_hours)
+
+    # .array keeps categorical keys as codes instead of materializing the strings
+    work = {k: hourly_df[k].array for k in KEYS + info}
+    work[DATE] = dates.dt.floor("D").to_numpy()
+    work["hour"] = hour
+    aggregations = {"hours": ("hour", "size")}
+
+    if "pm2_5" in hourly_df.columns:
+        pm = hourly_df["pm2_5"].to_numpy(dtype="float32")
+        work["pm2_5"] = pm
+        work["pm2_5_representative"] = np.where(hour == representative_hour, pm, np.nan)
+        work["pm2_5_night"] = np.where(night, pm, np.nan)
+        work["pm2_5_day"] = np.where(night, np.nan, pm)
+        aggregations.update({
+            "pm2_5": ("pm2_5_representative", "first"),
+            "pm2_5_mean": ("pm2_5", "mean"),
+            "pm2_5_max": ("pm2_5", "max"),
+            "pm2_5_night_mean": ("pm2_5_night", "mean"),
+            "pm2_5_day_mean": ("pm2_5_day", "mean"),
+        })
+    if "temperature_2m" in hourly_df.columns:
+        work["temperature_2m"] = hourly_df["temperature_2m"].to_numpy(dtype="float32")
+        aggregations.update({
+            "temperature_2m_mean": ("temperature_2m", "mean"),
+            "temperature_2m_max": ("temperature_2m", "max"),
+            "temperature_2m_min": ("temperature_2m", "min"),
+        })
+    if "precipitation" in hourly_df.columns:
+        work["precipitation"] = hourly_df["precipitation"].to_numpy(dtype="float32")
+        aggregations["precipitation_sum"] = ("precipitation", "sum")
+    if "wind_speed_10m" in hourly_df.columns:
+        speed = hourly_df["wind_speed_10m"].to_numpy(dtype="float32")
+        work["wind_speed_10m"] = speed
+        aggregations.update({
+            "wind_speed_10m_mean": ("wind_speed_10m", "mean"),
+            "wind_speed_10m_max": ("wind_speed_10m", "max"),
+        })
+        if "wind_direction_10m" in hourly_df.columns:
+            direction = np.deg2rad(hourly_df["wind_direction_10m"].to_numpy(dtype="float32"))
+            work["wind_u"] = speed * np.sin(direction)
+            work["wind_v"] = speed * np.cos(direction)
+            aggregations.update({"wind_u": ("wind_u", "sum"), "wind_v": ("wind_v", "sum")})
+    if "wind_gusts_10m" in hourly_df.columns:
+        work["wind_gusts_10m"] = hourly_df["wind_gusts_10m"].to_numpy(dtype="float32")
+        aggregations["wind_gusts_10m_max"] = ("wind_gusts_10m", "max")
+
+    group_keys = KEYS + [DATE]
+    if info:
+        aggregations.update({c: (c, "first") for c in info})
+    daily = pd.DataFrame(work).groupby(group_keys, sort=True, observed=True).agg(**aggregations).reset_index()
+
+    if "wind_u" in daily.columns:
+        daily["wind_direction_10m_dominant"] = np.rad2deg(np.arctan2(daily["wind_u"], daily["wind_v"])) % 360.0
+        daily = daily.drop(columns=["wind_u", "wind_v"])
+    measurements = [c for c in daily.columns if c not in group_keys + info + ["hours"]]
+    return schema.apply(daily[KEYS + info + [DATE] + measurements + ["hours"]], "air_quality_daily_aggregates")
@@ -0,0 +1,355 @@
+"""Shared HTTP client for all external APIs (Open-Meteo, WAQI, Nominatim).
+
+`get_client()` returns one process-wide `HttpClient`, a `requests.Session`
+subclass, so it can be passed anywhere a session is expected. It adds:
+
+- connection pooling (one pool per host, reused across calls and threads),
+- a bounded on-disk cache that expires entries by TTL and evicts the least
+  recently used entries once the cache grows beyond `max_cache_bytes`,
+- retries with jittered exponential backoff on connection errors, 429 and 5xx,
+  honouring `Retry-After`,
+- a per-host token-bucket rate limiter,
+- a record/replay mode (HTTP_CLIENT_MODE=record|replay) that stores responses as
+  JSON fixtures under HTTP_FIXTURES_DIR so pipelines can run without network.
+
+API tokens (e.g. the WAQI `token` parameter) are stripped from cache keys and
+fixtures.
+"""
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_CACHE_DIR = ".cache/http"
+DEFAULT_FIXTURES_DIR = "data/http_fixtures"
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_TTL = 3600
+NEVER_EXPIRE = -1
+
+# Cache lifetime in seconds by host; archive data does not change once published
+TTL_BY_HOST = {
+    "archive-api.open-meteo.com": NEVER_EXPIRE,
+    "api.open-meteo.com": 3600,
+    "air-quality-api.open-meteo.com": 3600,
+    "api.waqi.info": 600,
+    "nominatim.openstreetmap.org": 30 * 24 * 3600,
+}
+
+# (requests per second, burst) by host. Nominatim's usage policy allows 1 request per second.
+RATE_LIMITS = {
+    "nominatim.openstreetmap.org": (1.0, 1),
+    "api.waqi.info": (10.0, 10),
+    "archive-api.open-meteo.com": (10.0, 20),
+    "api.open-meteo.com": (10.0, 20),
+    "air-quality-api.open-meteo.com": (10.0, 20),
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+SECRET_PARAMS = {"token", "apikey", "api_key", "key"}
+
+
+class ReplayMissError(requests.exceptions.RequestException):
+    """Raised in replay mode when no fixture was recorded for a request."""
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average with bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _redact(url, params=None):
+    """URL with params merged in and secret parameters removed, sorted for stable keys."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        for k, v in items:
+            if isinstance(v, (list, tuple)):
+                v = ",".join(map(str, v))
+            query.append((k, str(v)))
+    query = sorted((k, v) for k, v in query if k.lower() not in SECRET_PARAMS)
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme, parts.netloc, path, urlencode(query), ""))
+
+
+def _cache_key(method, url, params):
+    return hashlib.sha256(f"{method.upper()} {_redact(url, params)}".encode()).hexdigest()
+
+
+def _build_response(url, status_code, headers, content):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response.headers.update(headers)
+    response._content = content
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+class DiskCache:
+    """Responses stored as `<key>.body` + `<key>.meta` files, bounded by TTL and total size."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = sum(p.stat().st_size for p in self.directory.glob("*.body"))
+
+    def _paths(self, key):
+        return self.directory / f"{key}.body", self.directory / f"{key}.meta"
+
+    def get(self, key):
+        body_path, meta_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                if meta["expires"] != NEVER_EXPIRE and meta["expires"] < time.time():
+                    self._remove(key)
+                    return None
+                content = body_path.read_bytes()
+            except (OSError, ValueError, KeyError):
+                return None
+            os.utime(body_path)    # access time drives LRU eviction
+        return meta, content
+
+    def set(self, key, meta, content, ttl):
+        meta = dict(meta, expires=NEVER_EXPIRE if ttl == NEVER_EXPIRE else time.time() + ttl)
+        body_path, meta_path = self._paths(key)
+        with self._lock:
+            self._remove(key)
+            tmp = body_path.with_suffix(".tmp")
+            tmp.write_bytes(content)
+            os.replace(tmp, body_path)
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._size += len(content)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, key):
+        body_path, meta_path = self._paths(key)
+        if body_path.exists():
+            self._size -= body_path.stat().st_size
+            body_path.unlink()
+        meta_path.unlink(missing_ok=True)
+
+    def _evict(self):
+        """Drops expired entries first, then least recently used ones until under the size bound."""
+        now = time.time()
+        entries = []
+        for body_path in self.directory.glob("*.body"):
+            key = body_path.stem
+            try:
+                with open(self.directory / f"{key}.meta", encoding="utf-8") as f:
+                    expires = json.load(f)["expires"]
+            except (OSError, ValueError, KeyError):
+                expires = 0
+            if expires != NEVER_EXPIRE and expires < now:
+                self._remove(key)
+            else:
+                entries.append((body_path.stat().st_mtime, key))
+        for _, key in sorted(entries):
+            if self._size <= self.max_bytes:
+                break
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            for path in self.directory.glob("*.*"):
+                path.unlink(missing_ok=True)
+            self._size = 0
+
+
+class HttpClient(requests.Session):
+    """A pooled, cached, rate-limited and retrying `requests.Session`."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_cache_bytes=DEFAULT_MAX_CACHE_BYTES,
+                 default_ttl=DEFAULT_TTL, retries=5, backoff_base=0.5, backoff_max=30.0,
+                 pool_maxsize=16, mode="live", fixtures_dir=DEFAULT_FIXTURES_DIR, timeout=60):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=len(RATE_LIMITS), pool_maxsize=pool_maxsize)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self.headers["User-Agent"] = "air-quality-prediction/1.0"
+
+        self.cache = DiskCache(cache_dir, max_cache_bytes) if cache_dir else None
+        self.default_ttl = default_ttl
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        if mode not in ("live", "record", "replay"):
+            raise ValueError(f"Unknown HTTP client mode: {mode}")
+        self.mode = mode
+        self.fixtures_dir = Path(fixtures_dir)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self.stats = {"requests": 0, "cache_hits": 0, "retries": 0, "bytes": 0}
+
+    # -- helpers -------------------------------------------------------------
+
+    def _bucket(self, host):
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None and host in RATE_LIMITS:
+                bucket = self._buckets[host] = TokenBucket(*RATE_LIMITS[host])
+            return bucket
+
+    def _ttl(self, host, ttl):
+        if ttl is not None:
+            return ttl
+        return TTL_BY_HOST.get(host, self.default_ttl)
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        # "Equal jitter": half of the exponential delay is fixed, the other half random
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _fixture_path(self, host, key):
+        return self.fixtures_dir / host / f"{key}.json"
+
+    def _load_fixture(self, url, host, key):
+        path = self._fixture_path(host, key)
+        if not path.exists():
+            raise ReplayMissError(f"No recorded fixture for {url} ({path})")
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        if "text" in fixture:
+            content = fixture["text"].encode("utf-8")
+        else:
+            content = base64.b64decode(fixture["base64"])
+        return _build_response(url, fixture["status_code"], fixture["headers"], content)
+
+    def _save_fixture(self, method, url, params, host, key, response):
+        path = self._fixture_path(host, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fixture = {
+            "request": f"{method.upper()} {_redact(url, params)}",
+            "status_code": response.status_code,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "")},
+        }
+        content_type = fixture["headers"]["Content-Type"]
+        if "json" in content_type or content_type.startswith("text/"):
+            fixture["text"] = response.content.decode("utf-8")
+        else:
+            fixture["base64"] = base64.b64encode(response.content).decode("ascii")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, indent=1, ensure_ascii=False)
+
+    def _send_with_retries(self, method, url, host, **kwargs):
+        bucket = self._bucket(host)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            if bucket is not None:
+                bucket.acquire()
+            response = None
+            try:
+                response = super().request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS:
+                    return response
+                error = requests.exceptions.HTTPError(f"{response.status_code} from {url}", response=response)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            if attempt == self.retries:
+                if response is not None:
+                    return response
+                raise error
+            self.stats["retries"] += 1
+            delay = self._backoff(attempt, response)
+            print(f"Request to {host} failed ({error}), retrying in {delay:.1f} s...")
+            time.sleep(delay)
+
+    # -- public API ----------------------------------------------------------
+
+    def request(self, method, url, params=None, ttl=None, **kwargs):
+        """
+        Same as `requests.Session.request`, with an optional cache `ttl` in seconds
+        (NEVER_EXPIRE to keep forever, 0 to bypass the cache).
+        """
+        host = urlsplit(url).netloc
+        key = _cache_key(method, url, params)
+        self.stats["requests"] += 1
+
+        if self.mode == "replay":
+            return self._load_fixture(url, host, key)
+
+        ttl = self._ttl(host, ttl)
+        cacheable = self.cache is not None and method.upper() == "GET" and ttl != 0
+        if cacheable:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                meta, content = cached
+                return _build_response(meta["url"], meta["status_code"], meta["headers"], content)
+
+        response = self._send_with_retries(method, url, host, params=params, **kwargs)
+        self.stats["bytes"] += len(response.content)
+        if response.status_code == 200:
+            if cacheable:
+                meta = {
+                    "url": _redact(url, params),
+                    "status_code": response.status_code,
+                    "headers": {"Content-Type": response.headers.get("Content-Type", "")},
+                }
+                self.cache.set(key, meta, response.content, ttl)
+            if self.mode == "record":
+                self._save_fixture(method, url, params, host, key, response)
+        return response
+
+    def get_json(self, url, params=None, ttl=None, **kwargs):
+        response = self.get(url, params=params, ttl=ttl, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """The shared client, configured from HTTP_CLIENT_MODE, HTTP_CACHE_DIR and HTTP_FIXTURES_DIR."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(
+                cache_dir=os.getenv("HTTP_CACHE_DIR", DEFAULT_CACHE_DIR),
+                mode=os.getenv("HTTP_CLIENT_MODE", "live"),
+                fixtures_dir=os.getenv("HTTP_FIXTURES_DIR", DEFAULT_FIXTURES_DIR),
+            )
+        return _client
+
+
+def bytes_received() -> int:
+    """Response bytes the shared client received over the network (0 if it was never created)."""
+    return _client.stats["bytes"] if _client is not None else 0
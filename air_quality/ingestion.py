@@ -0,0 +1,193 @@
+"""Regional Open-Meteo ingestion.
+
+All sensor coordinates of a city/region config are collapsed into
+multi-location Open-Meteo requests (Open-Meteo accepts comma separated
+latitude/longitude lists), and the three endpoint families (air quality,
+archive weather and weather forecast) are fetched concurrently over one pooled
+session (the shared `http_client`). The result is one long-format DataFrame keyed by `sensor_id`, so a
+region with 100 sensors costs about as much wall time as a single request.
+
+Responses are requested in Open-Meteo's binary format and decoded by variable
+name into float32 columns (air_quality/openmeteo.py); servers that answer with
+JSON (e.g. fixtures recorded before) are still read as JSON.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+
+from air_quality import http_client, openmeteo, schema, tracing
+
+AIR_QUALITY_URL = "https://air-quality-api.open-meteo.com/v1/air-quality"
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+DAILY_WEATHER_VARIABLES = ["wind_speed_10m_max", "wind_gusts_10m_max", "wind_direction_10m_dominant", "temperature_2m_max"]
+HOURLY_AIR_QUALITY_VARIABLES = ["pm2_5"]
+HOURLY_WEATHER_VARIABLES = ["temperature_2m", "precipitation", "wind_speed_10m", "wind_gusts_10m", "wind_direction_10m"]
+TIMEZONE = "Europe/Berlin"    # same timezone as Sweden
+
+# Keeps the request URL well below common URL length limits
+MAX_LOCATIONS_PER_REQUEST = 100
+MAX_WORKERS = 8
+TIMEOUT_SECONDS = 60
+
+LOCATION_COLUMNS = ["sensor_id", "country", "city", "street"]
+
+
+def sensor_locations(city_config: dict) -> pd.DataFrame:
+    """
+    Returns one row per sensor with its id, location columns and coordinates.
+    Sensors without their own lat/lon use the city coordinates.
+    """
+    rows = []
+    for sensor in city_config["sensors"]:
+        rows.append({
+            "sensor_id": sensor["id"],
+            "country": sensor.get("country", city_config.get("country_name")),
+            "city": sensor.get("city", city_config.get("city_name", city_config.get("region_name"))),
+            "street": sensor.get("street", city_config.get("street_name", sensor["display_name"])),
+            "latitude": sensor.get("lat", city_config.get("city_lat")),
+            "longitude": sensor.get("lon", city_config.get("city_lon")),
+        })
+    return pd.DataFrame(rows)
+
+
+def _chunks(df, size):
+    for start in range(0, len(df), size):
+        yield df.iloc[start:start + size]
+
+
+def _fetch_locations(session, url, params, locations, block):
+    """One multi-location request; returns a long frame for `block` ("daily" or "hourly")."""
+    params = dict(params, format=openmeteo.FORMAT)
+    params["latitude"] = ",".join(f"{lat:.4f}" for lat in locations["latitude"])
+    params["longitude"] = ",".join(f"{lon:.4f}" for lon in locations["longitude"])
+    response = session.get(url, params=params, timeout=TIMEOUT_SECONDS)
+    response.raise_for_status()
+    sensor_ids = list(locations["sensor_id"])
+    if "json" in response.headers.get("Content-Type", ""):
+        return _from_json(response.json(), block, sensor_ids)
+    return openmeteo.decode(response.content, params[block].split(","), block, sensor_ids)
+
+
+def _from_json(data, block, sensor_ids) -> pd.DataFrame:
+    """Long frame of a JSON response, one location per sensor id."""
+    # A single location is returned as an object, several as a list in request order
+    results = data if isinstance(data, list) else [data]
+    if len(results) != len(sensor_ids):
+        raise ValueError(f"Expected {len(sensor_ids)} locations, got {len(results)}")
+
+    frames = []
+    for sensor_id, result in zip(sensor_ids, results):
+        frame = pd.DataFrame(result[block])
+        frame.insert(0, "sensor_id", sensor_id)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _requests_for(start_date, end_date, forecast_days):
+    """(source, url, params, block) for the three endpoint families."""
+    return [
+        ("air_quality", AIR_QUALITY_URL,
+         {"hourly": ",".join(HOURLY_AIR_QUALITY_VARIABLES), "start_date": start_date, "end_date": end_date,
+          "timezone": TIMEZONE}, "hourly"),
+        ("weather", ARCHIVE_URL,
+         {"daily": ",".join(DAILY_WEATHER_VARIABLES), "start_date": start_date, "end_date": end_date,
+          "timezone": TIMEZONE}, "daily"),
+        ("forecast", FORECAST_URL,
+         {"daily": ",".join(DAILY_WEATHER_VARIABLES), "forecast_days": forecast_days, "timezone": TIMEZONE},
+         "daily"),
+    ]
+
+
+def daily_pm25_from_hourly(hourly_df: pd.DataFrame, hour: int = 12) -> pd.DataFrame:
+    """Keeps the reading at `hour` as the daily representative value, as the daily pipeline does."""
+    daily = hourly_df[hourly_df["date"].dt.hour == hour].copy()
+    daily["date"] = daily["date"].dt.floor("D")
+    return daily
+
+
+@tracing.traced(kind="fetch")
+def fetch_region(city_config: dict, start_date: str, end_date: str, forecast_days: int = None,
+                 sources=("air_quality", "weather", "forecast"), session: requests.Session = None,
+                 max_workers: int = MAX_WORKERS) -> pd.DataFrame:
+    """
+    Fetches air quality and weather for every sensor in `city_config` between
+    `start_date` and `end_date`, plus the weather forecast.
+
+    Returns a long-format DataFrame with one row per (source, sensor_id, date),
+    where `source` is "air_quality" (daily pm2_5 taken at 12:00), "weather" or
+    "forecast", together with the sensor's country, city and street.
+    """
+    locations = sensor_locations(city_config)
+    forecast_days = forecast_days or city_config.get("forecast_days", 7)
+    session = session or http_client.get_client()
+
+    jobs = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for source, url, params, block in _requests_for(start_date, end_date, forecast_days):
+            if source not in sources:
+                continue
+            for chunk in _chunks(locations, MAX_LOCATIONS_PER_REQUEST):
+                jobs.append((source, pool.submit(_fetch_locations, session, url, params, chunk, block)))
+        results = [(source, future.result()) for source, future in jobs]
+
+    frames = []
+    for source, frame in results:
+        frame = frame.rename(columns={"time": "date"})
+        frame["date"] = pd.to_datetime(frame["date"])
+        if source == "air_quality":
+            frame = daily_pm25_from_hourly(frame)
+        frame.insert(0, "source", source)
+        frames.append(frame)
+
+    region_df = pd.concat(frames, ignore_index=True)
+    location_info = locations[LOCATION_COLUMNS]
+    region_df = region_df.merge(location_info, on="sensor_id", how="left")
+    ordered = ["source"] + LOCATION_COLUMNS + ["date"]
+    return schema.apply(region_df[ordered + [c for c in region_df.columns if c not in ordered]])
+
+
+@tracing.traced(kind="fetch")
+def fetch_region_hourly(city_config: dict, start_date: str, end_date: str, session: requests.Session = None,
+                        max_workers: int = MAX_WORKERS) -> pd.DataFrame:
+    """
+    Hourly PM2.5 and archive weather for every sensor in `city_config` between
+    `start_date` and `end_date`: one row per (sensor, hour) with the location
+    columns and the measurements as float32 (see air_quality/hourly.py for the
+    daily aggregates).
+    """
+    locations = sensor_locations(city_config)
+    session = session or http_client.get_client()
+    families = [
+        (AIR_QUALITY_URL, {"hourly": ",".join(HOURLY_AIR_QUALITY_VARIABLES), "start_date": start_date,
+                           "end_date": end_date, "timezone": TIMEZONE}),
+        (ARCHIVE_URL, {"hourly": ",".join(HOURLY_WEATHER_VARIABLES), "start_date": start_date,
+                       "end_date": end_date, "timezone": TIMEZONE}),
+    ]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [[pool.submit(_fetch_locations, session, url, params, chunk, "hourly")
+                    for chunk in _chunks(locations, MAX_LOCATIONS_PER_REQUEST)]
+                   for url, params in families]
+        air_df, weather_df = (pd.concat([f.result() for f in family], ignore_index=True) for family in futures)
+
+    hourly_df = air_df.merge(weather_df, on=["sensor_id", "time"], how="outer").rename(columns={"time": "date"})
+    hourly_df["date"] = pd.to_datetime(hourly_df["date"])
+    measurements = HOURLY_AIR_QUALITY_VARIABLES + HOURLY_WEATHER_VARIABLES
+    hourly_df = hourly_df.merge(locations[LOCATION_COLUMNS], on="sensor_id", how="left")
+    return schema.apply(hourly_df[LOCATION_COLUMNS + ["date"] + measurements], "air_quality_hourly")
+
+
+def split_sources(region_df: pd.DataFrame) -> dict:
+    """Splits the output of `fetch_region` into one frame per source, dropping unused columns."""
+    variables = {
+        "air_quality": HOURLY_AIR_QUALITY_VARIABLES,
+        "weather": DAILY_WEATHER_VARIABLES,
+        "forecast": DAILY_WEATHER_VARIABLES,
+    }
+    frames = {}
+    for source, frame in region_df.groupby("source", sort=False):
+        columns = LOCATION_COLUMNS + ["date"] + variables[source]
+        frames[source] = frame[columns].reset_index(drop=True)
+    return frames
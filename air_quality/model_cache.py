@@ -0,0 +1,211 @@
+"""Model registry cache and batched inference over many sensors.
+
+`ModelCache` downloads every (name, version) of the model registry once. The
+artifacts are stored content-addressed under .cache/models::
+
+    .cache/models/
+        index.json                      {"air_quality_model/1": "<sha256>", ...}
+        objects/<sha256>/model.json
+
+so a registry version is never downloaded again (registry versions are
+immutable) and versions with identical artifacts share one directory. On top of
+that, the `max_models` most recently used deserialized models are kept in
+memory and the least recently used one is evicted first.
+
+Which model serves a sensor comes from the city config: a sensor's own
+`model_registry` entry, otherwise the config's `model_registry`, otherwise
+DEFAULT_MODEL. `predict_sensors` groups the rows of all sensors that share a
+model into one batched predict and runs the groups concurrently, so regional
+inference costs one download and one deserialization per distinct model.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from air_quality import tracing, tree_model
+from air_quality.forecasting import model_feature_columns
+
+DEFAULT_CACHE_DIR = str(Path(__file__).resolve().parent.parent / ".cache" / "models")
+DEFAULT_MODEL = {"name": "air_quality_model", "version": 1}
+MAX_MODELS = 8
+MAX_WORKERS = 4
+INDEX_FILE = "index.json"
+
+
+def load_tree_model(model_dir: str):
+    """Default loader: the compiled NumPy evaluator of the model.json in `model_dir`."""
+    return tree_model.load_model(os.path.join(model_dir, "model.json"))
+
+
+def _tree_digest(path: Path) -> str:
+    """sha256 over the relative paths and contents of every file below `path`."""
+    h = hashlib.sha256()
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        h.update(file.relative_to(path).as_posix().encode("utf-8") + b"\0")
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+class ModelCache:
+    """Downloads registry models once and keeps the most recently used ones deserialized."""
+
+    def __init__(self, registry=None, cache_dir: str = DEFAULT_CACHE_DIR, max_models: int = MAX_MODELS,
+                 loader=load_tree_model):
+        self.registry = registry
+        self.root = Path(cache_dir)
+        self.max_models = max_models
+        self.loader = loader
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _key_lock(self, key):
+        # One lock per model, so concurrent requests for the same model download and load it once
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    # -- artifacts on disk -----------------------------------------------------
+
+    def _index(self) -> dict:
+        try:
+            with open(self.root / INDEX_FILE, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_index(self, entry: str, digest: str):
+        with self._lock:
+            index = self._index()
+            index[entry] = digest
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.root / f".{INDEX_FILE}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.root / INDEX_FILE)
+
+    def _download(self, name, version, staging: Path) -> Path:
+        if self.registry is None:
+            raise ValueError(f"Model {name}/{version} is not cached and there is no model registry to download it from")
+        model = self.registry.get_model(name=name, version=version)
+        with tracing.stage("download_model", kind="read", model=f"{name}/{version}"):
+            try:
+                return Path(model.download(local_path=str(staging)))
+            except TypeError:    # older hsml without local_path
+                return Path(model.download())
+
+    def path(self, name: str, version: int) -> str:
+        """Local directory with the artifacts of the model, downloaded on first use."""
+        entry = f"{name}/{version}"
+        with self._key_lock(("path", name, version)):
+            digest = self._index().get(entry)
+            if digest is not None and (self.root / "objects" / digest).is_dir():
+                self.hits["download"] += 1
+                return str(self.root / "objects" / digest)
+
+            self.misses["download"] += 1
+            objects = self.root / "objects"
+            objects.mkdir(parents=True, exist_ok=True)
+            staging = Path(tempfile.mkdtemp(dir=objects, prefix=".download-"))
+            try:
+                downloaded = self._download(name, version, staging)
+                digest = _tree_digest(downloaded)
+                target = objects / digest
+                if not target.exists():
+                    tmp_target = Path(tempfile.mkdtemp(dir=objects, prefix=".tmp-"))
+                    shutil.copytree(downloaded, tmp_target, dirs_exist_ok=True)
+                    os.replace(tmp_target, target)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            self._save_index(entry, digest)
+            print(f"Downloaded model {entry} ({digest[:12]})")
+            return str(target)
+
+    # -- deserialized models ---------------------------------------------------
+
+    def get(self, name: str, version: int):
+        """The deserialized model, from memory if it is one of the `max_models` most recently used."""
+        key = (name, version)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits["model"] += 1
+                return self._models[key]
+        with self._key_lock(("model", name, version)):
+            with self._lock:
+                if key in self._models:    # loaded by another thread in the meantime
+                    self._models.move_to_end(key)
+                    self.hits["model"] += 1
+                    return self._models[key]
+            self.misses["model"] += 1
+            model = self.loader(self.path(name, version))
+            with self._lock:
+                self._models[key] = model
+                while len(self._models) > self.max_models:
+                    self._models.popitem(last=False)
+            return model
+
+    def evict(self, name: str = None, version: int = None):
+        """Drops one model (or all of them) from memory; the artifacts stay on disk."""
+        with self._lock:
+            if name is None:
+                self._models.clear()
+            else:
+                self._models.pop((name, version), None)
+
+    def metrics(self) -> pd.DataFrame:
+        kinds = sorted(set(self.hits) | set(self.misses))
+        rows = [{"kind": k, "hits": self.hits[k], "misses": self.misses[k]} for k in kinds]
+        return pd.DataFrame(rows, columns=["kind", "hits", "misses"])
+
+
+def model_key(entry: dict) -> tuple:
+    return entry["name"], entry.get("version", DEFAULT_MODEL["version"])
+
+
+def sensor_models(city_config: dict) -> dict:
+    """sensor id -> (name, version) of the model serving it."""
+    default = city_config.get("model_registry", DEFAULT_MODEL)
+    return {sensor["id"]: model_key(sensor.get("model_registry", default)) for sensor in city_config["sensors"]}
+
+
+@tracing.traced(kind="predict")
+def predict_sensors(cache: ModelCache, df: pd.DataFrame, models: dict, sensor_column: str = "sensor_id",
+                    feature_cols=None, default=None, max_workers: int = MAX_WORKERS) -> np.ndarray:
+    """
+    Predictions for every row of `df`, aligned with its rows. `models` maps the
+    values of `sensor_column` to (name, version); sensors missing from it use
+    `default`. Rows of all sensors sharing a model are predicted in one batch,
+    and the batches of different models run concurrently.
+    """
+    default = model_key(default) if isinstance(default, dict) else (default or model_key(DEFAULT_MODEL))
+    # Models are resolved once per sensor, not per row
+    codes, sensors = pd.factorize(df[sensor_column])
+    sensors_of_model = {}
+    for code, sensor in enumerate(sensors):
+        sensors_of_model.setdefault(models.get(sensor, default), []).append(code)
+    groups = {key: np.flatnonzero(np.isin(codes, sensor_codes)) for key, sensor_codes in sensors_of_model.items()}
+
+    def predict(key, rows):
+        model = cache.get(*key)
+        columns = feature_cols or model_feature_columns(model)
+        return rows, np.asarray(model.predict(df.iloc[rows][columns]), dtype="float64")
+
+    predictions = np.full(len(df), np.nan)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as pool:
+        for rows, values in pool.map(lambda item: predict(*item), groups.items()):
+            predictions[rows] = values
+    print(f"Predicted {len(df)} rows of {len(sensors)} sensors with {len(groups)} models")
+    return predictions
@@ -0,0 +1,137 @@
+"""Monitoring: hindcast predictions compared with the observed outcomes.
+
+`hindcast_windows` walks an arbitrary date range in windows of `window_days`.
+Each window reads only its own air quality and weather rows (the first one also
+reads `lookback_days` before the start to warm up the lag features), joins them
+on (city, street, date) and makes one batched prediction. The lag state is
+carried from one window to the next by a `LagFeatureEngine`, so lags are never
+recomputed over the full history and memory is bounded by one window.
+
+`backfill_hindcast` inserts the windows into the monitoring feature group in
+chunks of at most `chunk_rows` rows, overlapping each insert with reading and
+predicting the next window.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from air_quality import schema, tracing, upserts
+from air_quality.features import DATE, KEYS, VALUE, LOOKBACK_DAYS, LagFeatureEngine
+from air_quality.forecasting import HORIZON_COLUMN, INFO_COLUMNS, PREDICTION, model_feature_columns
+
+WINDOW_DAYS = 30
+CHUNK_ROWS = 50_000
+# Days of hindcast created by backfill_predictions_for_monitoring when there are no outcomes yet
+RECENT_DAYS = 10
+
+
+def _utc(value):
+    ts = pd.Timestamp(value)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def _read_window(source, start, end, sensors=None) -> pd.DataFrame:
+    """Rows of a feature group (or an already read DataFrame) with start <= date < end for the given sensors."""
+    if isinstance(source, pd.DataFrame):
+        df = source
+        dates = pd.to_datetime(df[DATE], utc=True)
+        df = df[(dates >= start) & (dates < end)]
+    else:
+        query = source.filter((source.date >= start) & (source.date < end))
+        if sensors:
+            # Pushed down to the feature store; the exact (city, street) pairs are matched below
+            query = query.filter(source.street.isin(sorted({street for _, street in sensors})))
+        df = query.read()
+    df = schema.apply(df).copy()
+    df[DATE] = pd.to_datetime(df[DATE], utc=True)
+    if sensors:
+        wanted = pd.MultiIndex.from_tuples([tuple(s) for s in sensors], names=KEYS)
+        df = df[pd.MultiIndex.from_frame(df[KEYS]).isin(wanted)]
+    return df
+
+
+def hindcast_windows(model, air_quality_fg, weather_fg, start, end, sensors=None, feature_cols=None,
+                     window_days: int = WINDOW_DAYS, lookback_days: int = LOOKBACK_DAYS):
+    """
+    Yields one DataFrame per window between `start` (inclusive) and `end`
+    (exclusive) with the one-day-ahead prediction of every observed
+    (city, street, date) that has weather, next to the observed pm2_5.
+    `sensors` is a list of (city, street) pairs, None for all sensors.
+    `air_quality_fg` and `weather_fg` may also be DataFrames.
+    """
+    feature_cols = list(feature_cols or model_feature_columns(model))
+    start, end = _utc(start), _utc(end)
+
+    history_df = _read_window(air_quality_fg, start - pd.Timedelta(days=lookback_days), start, sensors)
+    engine = LagFeatureEngine.from_history(history_df.dropna(subset=[VALUE])[KEYS + [DATE, VALUE]])
+
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + pd.Timedelta(days=window_days), end)
+        aq_df = _read_window(air_quality_fg, window_start, window_end, sensors).dropna(subset=[VALUE])
+        lagged_df = engine.update(aq_df)
+        weather_df = _read_window(weather_fg, window_start, window_end, sensors)
+        weather_df = weather_df.drop(columns=[c for c in weather_df.columns if c in lagged_df.columns
+                                              and c not in KEYS + [DATE]])
+        weather_df = weather_df.drop_duplicates(subset=KEYS + [DATE], keep="last")
+
+        # Join on the full key, so sensors sharing a date never fan out
+        window_df = lagged_df.merge(weather_df, on=KEYS + [DATE], how="inner")
+        if not window_df.empty:
+            window_df[PREDICTION] = np.asarray(model.predict(window_df[feature_cols]), dtype="float64")
+            window_df[HORIZON_COLUMN] = 1
+            info_columns = [c for c in INFO_COLUMNS if c in window_df.columns]
+            columns = KEYS + info_columns + [DATE] + feature_cols + [PREDICTION, HORIZON_COLUMN]
+            columns += [c for c in weather_df.columns if c not in columns] + [VALUE]
+            yield window_df[columns].sort_values(by=KEYS + [DATE]).reset_index(drop=True)
+        window_start = window_end
+
+
+def _chunks(df: pd.DataFrame, chunk_rows: int):
+    for i in range(0, len(df), chunk_rows):
+        yield df.iloc[i:i + chunk_rows]
+
+
+@tracing.traced(kind="predict")
+def backfill_hindcast(model, air_quality_fg, weather_fg, monitor_fg, start, end, sensors=None, feature_cols=None,
+                      window_days: int = WINDOW_DAYS, chunk_rows: int = CHUNK_ROWS,
+                      lookback_days: int = LOOKBACK_DAYS, collect=False):
+    """
+    Predicts and inserts hindcasts (days_before_forecast_day = 1) for every
+    window in [start, end). Only new or changed predictions are written (see
+    upserts.upsert), and at most one insert runs in the background while the
+    next window is prepared. Returns the number of written rows, or the
+    hindcast rows (predictions with observed pm2_5) if `collect` is set.
+    """
+    written, processed, collected, pending = 0, 0, [], None
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        for window_df in hindcast_windows(model, air_quality_fg, weather_fg, start, end, sensors, feature_cols,
+                                          window_days, lookback_days):
+            if collect:
+                collected.append(window_df)
+            predictions_df = schema.for_insert(window_df.drop(columns=[VALUE]), monitor_fg)
+            for chunk in _chunks(predictions_df, chunk_rows):
+                if pending is not None:
+                    written += pending.result().written
+                pending = pool.submit(upserts.upsert, monitor_fg, chunk, write_options={"wait_for_job": False})
+                processed += len(chunk)
+            print(f"Hindcast up to {window_df[DATE].max().date()}: {processed} rows predicted")
+        if pending is not None:
+            written += pending.result().written
+
+    if collect:
+        return pd.concat(collected, ignore_index=True) if collected else pd.DataFrame()
+    return written
+
+
+def backfill_predictions_for_monitoring(weather_fg, air_quality_fg, monitor_fg, model, start=None, end=None,
+                                        sensors=None, **kwargs):
+    """
+    Creates hindcasts when there are no outcomes for the predictions yet, by
+    default for the last RECENT_DAYS days. Returns the hindcast rows.
+    """
+    end = _utc(end) if end is not None else pd.Timestamp.now(tz="UTC").normalize() + pd.Timedelta(days=1)
+    start = _utc(start) if start is not None else end - pd.Timedelta(days=RECENT_DAYS)
+    return backfill_hindcast(model, air_quality_fg, weather_fg, monitor_fg, start, end, sensors=sensors,
+                             collect=True, **kwargs)
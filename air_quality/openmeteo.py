@@ -0,0 +1,121 @@
+"""Schema-driven decoding of Open-Meteo's binary (FlatBuffers) responses.
+
+With `format=flatbuffers`, every Open-Meteo endpoint answers with one
+size-prefixed WeatherApiResponse message per requested location. A variable in
+a message is identified by a (variable, altitude, aggregation) triple of
+openmeteo_sdk enums, not by its API name, and its values are a float32 vector
+inside the response buffer.
+
+`VariableSpec.parse` derives that triple from the API name once
+("wind_speed_10m_max" is wind_speed at 10 m, maximum), so `decode` finds the
+variables of a response by name, in whatever order they come, and an unknown
+name fails when it is declared instead of ending up in the wrong column.
+`ValuesAsNumpy()` is a read-only view into the response; the views of all
+locations are copied once, straight into one (variables x rows) float32 block
+whose rows the returned frame wraps without another copy. The timestamps of every
+location come from one shared `arange` (time + step * interval). No Python
+object is created per value.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+FORMAT = "flatbuffers"
+BLOCKS = {"daily": "Daily", "hourly": "Hourly", "current": "Current", "minutely_15": "Minutely15"}
+# API names whose FlatBuffers variable is spelled differently
+VARIABLE_ALIASES = {"pm2_5": "pm2p5"}
+AGGREGATIONS = {"min": "minimum", "max": "maximum", "mean": "mean", "median": "median", "sum": "sum",
+                "dominant": "dominant", "spread": "spread"}
+# A streamed error replaces the next size prefix with the text "Unexpected ..."
+_ERROR_PREFIX = int.from_bytes(b"Unex", "little")
+_NAME = re.compile(r"^(?P<variable>.+?)(?:_(?P<altitude>\d+)m)?(?:_(?P<aggregation>" + "|".join(AGGREGATIONS) + r"))?$")
+
+
+@dataclass(frozen=True)
+class VariableSpec:
+    name: str
+    variable: int
+    altitude: int = 0
+    aggregation: int = 0
+
+    @property
+    def key(self) -> tuple:
+        return self.variable, self.altitude, self.aggregation
+
+    @classmethod
+    def parse(cls, name: str) -> "VariableSpec":
+        """The FlatBuffers identity of an API variable name, e.g. "temperature_2m_max" or "pm2_5"."""
+        from openmeteo_sdk.Aggregation import Aggregation
+        from openmeteo_sdk.Variable import Variable
+
+        match = _NAME.match(VARIABLE_ALIASES.get(name, name))
+        variable = getattr(Variable, match["variable"], None) if match else None
+        if variable is None:
+            raise ValueError(f"Unknown Open-Meteo variable: {name}")
+        aggregation = getattr(Aggregation, AGGREGATIONS[match["aggregation"]]) if match["aggregation"] else Aggregation.none
+        return cls(name, variable, int(match["altitude"] or 0), aggregation)
+
+
+@lru_cache(maxsize=None)
+def variable_specs(names: tuple) -> tuple:
+    return tuple(VariableSpec.parse(name) for name in names)
+
+
+def messages(content: bytes) -> list:
+    """The WeatherApiResponse of every location in a binary response, in request order."""
+    from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
+
+    responses, position, total = [], 0, len(content)
+    while position < total:
+        length = int.from_bytes(content[position:position + 4], "little")
+        if length == _ERROR_PREFIX:
+            raise ValueError(bytes(content[position:]).decode("utf-8", errors="replace"))
+        responses.append(WeatherApiResponse.GetRootAs(content, position + 4))
+        position += 4 + length
+    return responses
+
+
+def decode(content: bytes, variables, block: str, location_ids=None) -> pd.DataFrame:
+    """
+    Long frame of the `block` ("daily" or "hourly") of a binary response: one row
+    per location and time, with `time` in the local time of the response (like
+    the JSON API returns it) and one float32 column per name in `variables`.
+    With `location_ids` (one per location, in request order) the rows also get a
+    categorical sensor_id column. Variables a location did not return are NaN.
+    """
+    specs = variable_specs(tuple(variables))
+    rows = {spec.key: i for i, spec in enumerate(specs)}
+    responses = messages(content)
+    if location_ids is not None and len(location_ids) != len(responses):
+        raise ValueError(f"Expected {len(location_ids)} locations, got {len(responses)}")
+
+    series = [getattr(response, BLOCKS[block])() for response in responses]
+    lengths = np.array([0 if s is None or not s.Interval() else (s.TimeEnd() - s.Time()) // s.Interval()
+                        for s in series], dtype="int64")
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    values = np.full((len(specs), offsets[-1]), np.nan, dtype="float32")
+    seconds = np.empty(offsets[-1], dtype="int64")
+    steps = np.arange(lengths.max() if len(lengths) else 0, dtype="int64")
+
+    for response, s, start, n in zip(responses, series, offsets[:-1], lengths):
+        if not n:
+            continue
+        np.multiply(steps[:n], s.Interval(), out=seconds[start:start + n])
+        seconds[start:start + n] += s.Time() + response.UtcOffsetSeconds()
+        for j in range(s.VariablesLength()):
+            variable = s.Variables(j)
+            i = rows.get((variable.Variable(), variable.Altitude(), variable.Aggregation()))
+            if i is not None and variable.ValuesLength():
+                values[i, start:start + n] = variable.ValuesAsNumpy()[:n]
+
+    seconds *= 1_000_000_000
+    columns = {"time": seconds.view("datetime64[ns]")}
+    if location_ids is not None:
+        codes = np.repeat(np.arange(len(location_ids), dtype="int32"), lengths)
+        columns = {"sensor_id": pd.Categorical.from_codes(codes, categories=pd.Index(location_ids)), **columns}
+    # One column per row of `values`; copy=False keeps them as views instead of consolidating into a new block
+    columns.update((spec.name, values[i]) for i, spec in enumerate(specs))
+    return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,192 @@
+"""Forecast and hindcast plots.
+
+Charts are drawn on Agg canvases without pyplot, so no figure is registered
+globally and nothing leaks across Streamlit reruns or loop iterations.
+
+Every PNG carries a hash of its input (city, street, chart type and the plotted
+columns) in its metadata. `render_chart` skips the drawing when the file
+already holds the same hash, and `render_many` renders many sensors in a
+process pool where each worker reuses one figure per chart type and only swaps
+the data lines, which keeps memory flat however many charts are rendered. The
+reused figures are per thread, since Streamlit runs every session in its own.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+from matplotlib.ticker import MultipleLocator, ScalarFormatter
+
+from air_quality import tracing
+
+# Bump when the chart layout changes so existing PNGs are re-rendered
+STYLE_VERSION = "1"
+HASH_KEY = "Source-Hash"
+PLOT_COLUMNS = ["date", "predicted_pm25", "pm2_5"]
+Y_TICKS = [0, 10, 25, 50, 100, 250, 500]
+
+CATEGORY_COLORS = ['green', 'yellow', 'orange', 'red', 'purple', 'darkred']
+CATEGORY_LABELS = ['Good', 'Moderate', 'Unhealthy for Some', 'Unhealthy', 'Very Unhealthy', 'Hazardous']
+CATEGORY_RANGES = [(0, 49), (50, 99), (100, 149), (150, 199), (200, 299), (300, 500)]
+
+
+def frame_hash(city: str, street: str, df: pd.DataFrame, hindcast=False) -> str:
+    """Hash of everything that ends up in the chart."""
+    columns = [c for c in PLOT_COLUMNS if c in df.columns and (hindcast or c != "pm2_5")]
+    h = hashlib.sha256(f"{STYLE_VERSION}|{city}|{street}|{bool(hindcast)}".encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def stored_hash(file_path: str):
+    """The input hash saved in an existing PNG, or None."""
+    if not os.path.exists(file_path):
+        return None
+    from PIL import Image    # Pillow comes with matplotlib
+
+    try:
+        with Image.open(file_path) as image:
+            return image.text.get(HASH_KEY)
+    except OSError:
+        return None
+
+
+class _ChartTemplate:
+    """A figure with the static parts of the chart (scale, category bands, legend, labels) drawn once."""
+
+    def __init__(self, hindcast=False):
+        self.hindcast = hindcast
+        self.figure = Figure(figsize=(10, 6))
+        FigureCanvasAgg(self.figure)
+        ax = self.ax = self.figure.add_subplot()
+
+        # Set the y-axis to a logarithmic scale
+        ax.set_yscale('log')
+        ax.set_yticks(Y_TICKS)
+        ax.get_yaxis().set_major_formatter(ScalarFormatter())
+
+        # Set the labels
+        ax.set_xlabel('Date')
+        ax.set_ylabel('PM2.5')
+
+        for color, (start, end) in zip(CATEGORY_COLORS, CATEGORY_RANGES):
+            ax.axhspan(start, end, color=color, alpha=0.3)
+
+        # Add a legend for the different Air Quality Categories
+        patches = [Patch(color=color, label=f"{label}: {start}-{end}")
+                   for color, label, (start, end) in zip(CATEGORY_COLORS, CATEGORY_LABELS, CATEGORY_RANGES)]
+        self.category_legend = ax.legend(handles=patches, loc='upper right', title="Air Quality Categories",
+                                         fontsize='x-small')
+        self.lines = []
+        self.date_locator = None
+        self._category_legend_added = False
+
+    def draw(self, city, street, df):
+        ax = self.ax
+        for line in self.lines:
+            line.remove()
+
+        # The category bands must not count towards the data limits of the new lines
+        ax.ignore_existing_data_limits = True
+        ax.set_autoscaley_on(True)
+        day = pd.to_datetime(df['date']).dt.date
+        self.lines = ax.plot(day, df['predicted_pm25'], label='Predicted PM2.5', color='red', linewidth=2,
+                             marker='o', markersize=5, markerfacecolor='blue')
+        if self.hindcast:
+            self.lines += ax.plot(day, df['pm2_5'], label='Actual PM2.5', color='black', linewidth=2, marker='^',
+                                  markersize=5, markerfacecolor='grey')
+            # The new legend replaces the category legend, which is kept as a separate artist (added once)
+            ax.legend(loc='upper left', fontsize='x-small')
+            if not self._category_legend_added:
+                ax.add_artist(self.category_legend)
+                self._category_legend_added = True
+        # Setting the ticks extends the view up to 500, so all category bands stay visible
+        ax.set_yticks(Y_TICKS)
+        ax.set_ylim(bottom=1)
+        ax.set_title(f"PM2.5 Predicted (Logarithmic Scale) for {city}, {street}")
+
+        # Aim for ~10 annotated values on x-axis, will work for both forecasts ans hindcasts
+        if self.date_locator is None:
+            self.date_locator = ax.xaxis.get_major_locator()    # set up by the date converter on the first plot
+        if len(df.index) > 11:
+            ax.xaxis.set_major_locator(MultipleLocator(len(df.index) / 10))
+        else:
+            ax.xaxis.set_major_locator(self.date_locator)
+        ax.tick_params(axis='x', labelrotation=45)
+
+        # Ensure everything is laid out neatly
+        self.figure.tight_layout()
+        return self.figure
+
+    def save(self, file_path, source_hash):
+        # Save the figure, overwriting any existing file with the same name
+        self.figure.savefig(file_path, metadata={HASH_KEY: source_hash})
+
+
+@tracing.traced(kind="plot")
+def plot_air_quality_forecast(city: str, street: str, df: pd.DataFrame, file_path: str, hindcast=False) -> Figure:
+    """Draws the chart, saves it to `file_path` and returns the figure (always renders)."""
+    template = _ChartTemplate(hindcast)
+    figure = template.draw(city, street, df)
+    template.save(file_path, frame_hash(city, street, df, hindcast))
+    return figure
+
+
+# One template per chart type and thread, reused by render_chart
+_local = threading.local()
+
+
+def render_chart(city: str, street: str, df: pd.DataFrame, file_path: str, hindcast=False, force=False) -> bool:
+    """
+    Saves the chart to `file_path` unless the existing PNG was rendered from the
+    same input. Returns True if the chart was rendered.
+    """
+    source_hash = frame_hash(city, street, df, hindcast)
+    if not force and stored_hash(file_path) == source_hash:
+        return False
+    templates = getattr(_local, "templates", None)
+    if templates is None:
+        templates = _local.templates = {}
+    template = templates.get(bool(hindcast))
+    if template is None:
+        template = templates[bool(hindcast)] = _ChartTemplate(hindcast)
+    template.draw(city, street, df)
+    template.save(file_path, source_hash)
+    return True
+
+
+def _render_job(job):
+    return render_chart(**job)
+
+
+@tracing.traced(kind="plot")
+def render_many(jobs, max_workers=None) -> list:
+    """
+    Renders charts given as dicts of `render_chart` arguments (city, street, df,
+    file_path, hindcast) in a process pool. Charts whose PNG is up to date are
+    skipped before anything is sent to the workers. Returns, per job, whether it was rendered.
+    """
+    jobs = list(jobs)
+    stale = [i for i, job in enumerate(jobs)
+             if job.get("force") or stored_hash(job["file_path"]) != frame_hash(
+                 job["city"], job["street"], job["df"], job.get("hindcast", False))]
+    rendered = [False] * len(jobs)
+    if not stale:
+        print(f"All {len(jobs)} charts up to date")
+        return rendered
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(stale))
+    if max_workers == 1:
+        results = [_render_job(dict(jobs[i], force=True)) for i in stale]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            chunksize = max(1, len(stale) // (max_workers * 4))
+            results = list(pool.map(_render_job, [dict(jobs[i], force=True) for i in stale], chunksize=chunksize))
+    for i, result in zip(stale, results):
+        rendered[i] = result
+    print(f"Rendered {len(stale)} of {len(jobs)} charts ({len(jobs) - len(stale)} up to date)")
+    return rendered
@@ -0,0 +1,93 @@
+"""Column types of the feature groups.
+
+Location keys (sensor_id, country, city, street, url) repeat on every row, so
+they are kept as categoricals: each distinct value is stored once and the rows
+hold small integer codes (Parquet writes them dictionary-encoded). Measurements
+are float32, which is also the precision XGBoost trains and predicts with.
+
+`apply` casts the known columns of any frame and is used both when frames are
+built (ingestion, WAQI, CSV backfill) and after reading from a feature store,
+since Hopsworks returns strings and doubles. `for_insert` prepares a frame for
+one feature group: the compact types for a new feature group, the types of the
+existing schema otherwise, so versions created before this module keep
+accepting inserts. Only the local store keeps categoricals on disk; Hopsworks
+gets plain strings.
+"""
+import pandas as pd
+
+CATEGORY = "category"
+FLOAT = "float32"
+
+LOCATION_KEYS = ["sensor_id", "country", "city", "street", "url"]
+
+_DAILY_WEATHER = ["wind_speed_10m_max", "wind_gusts_10m_max", "wind_direction_10m_dominant", "temperature_2m_max"]
+_HOURLY_WEATHER = ["temperature_2m", "precipitation", "wind_speed_10m", "wind_gusts_10m", "wind_direction_10m"]
+_LAG_FEATURES = ["pm2_5_lag_1", "pm2_5_lag_2", "pm2_5_lag_3", "pm2_5_rolling_mean_7", "pm2_5_ewma_7"]
+_DAILY_AGGREGATES = [
+    "pm2_5_mean", "pm2_5_max", "pm2_5_night_mean", "pm2_5_day_mean",
+    "temperature_2m_mean", "temperature_2m_min", "precipitation_sum", "wind_speed_10m_mean",
+]
+
+# Measurement columns per feature group; every location key present is a categorical
+MEASUREMENTS = {
+    "air_quality": ["pm2_5"],
+    "weather": _DAILY_WEATHER,
+    "weather_forecast_features": _DAILY_WEATHER,
+    "air_quality_lagged": ["pm2_5"] + _LAG_FEATURES,
+    "aq_predictions": ["predicted_pm25", "pm2_5"] + _LAG_FEATURES + _DAILY_WEATHER,
+    "air_quality_hourly": ["pm2_5"] + _HOURLY_WEATHER,
+    "air_quality_daily_aggregates": ["pm2_5"] + _DAILY_AGGREGATES + _DAILY_WEATHER,
+}
+OTHER_TYPES = {
+    "air_quality_daily_aggregates": {"hours": "int16"},
+}
+
+# Hive types of Hopsworks / Arrow types of the local store -> pandas dtype
+_STORED_TYPES = {"double": "float64", "float": FLOAT, "string": object}
+
+
+def dtypes(name: str = None) -> dict:
+    """Column -> dtype of a feature group, or of all feature groups if `name` is None."""
+    names = [name] if name is not None else list(MEASUREMENTS)
+    types = {key: CATEGORY for key in LOCATION_KEYS}
+    for n in names:
+        if n not in MEASUREMENTS:
+            raise ValueError(f"No schema for feature group {n}")
+        types.update({column: FLOAT for column in MEASUREMENTS[n]})
+        types.update(OTHER_TYPES.get(n, {}))
+    return types
+
+
+def apply(df: pd.DataFrame, name: str = None) -> pd.DataFrame:
+    """Returns `df` with its known columns cast to the schema of `name` (all feature groups if None)."""
+    casts = {column: dtype for column, dtype in dtypes(name).items()
+             if column in df.columns and df[column].dtype != dtype}
+    return df.astype(casts) if casts else df
+
+
+def _stored_dtype(feature_type: str):
+    if feature_type in _STORED_TYPES:
+        return _STORED_TYPES[feature_type]
+    if feature_type.startswith("dictionary"):
+        return CATEGORY
+    return None
+
+
+def for_insert(df: pd.DataFrame, fg) -> pd.DataFrame:
+    """
+    `df` with the types `fg` stores: the compact schema, aligned to the features
+    the feature group already has. Categoricals are only kept for the local store.
+    """
+    df = apply(df, fg.name if fg.name in MEASUREMENTS else None)
+    existing = {f.name: _stored_dtype(str(f.type)) for f in (getattr(fg, "features", None) or []) if f.type}
+    casts = {column: dtype for column, dtype in existing.items()
+             if dtype is not None and column in df.columns and df[column].dtype != dtype}
+    if casts:
+        df = df.astype(casts)
+
+    from air_quality.feature_store import LocalFeatureGroup    # imported here so building frames never loads pyarrow
+    if not isinstance(fg, LocalFeatureGroup):
+        categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+        if categorical:
+            df = df.astype({c: object for c in categorical})
+    return df
@@ -0,0 +1,145 @@
+"""Local snapshots of materialized training datasets.
+
+`feature_view.train_test_split()` runs the joined lagged + weather query and
+downloads the result on every call. `train_test_split` here stores each split
+as zstd-compressed Parquet files under .cache/training_datasets, keyed on
+
+- the feature view name and version,
+- the split boundaries (and any other split arguments),
+- the latest commit of every upstream feature group,
+
+and loads it from disk as long as none of these changed. The key is exposed as
+`snapshot.fingerprint`, so experiments that use the same data can record it
+and share one materialization::
+
+    .cache/training_datasets/air_quality_fv_1/<fingerprint>/
+        manifest.json
+        X_train.parquet  X_test.parquet  y_train.parquet  y_test.parquet
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from air_quality import tracing
+from air_quality.feature_store import latest_commit_id
+
+DEFAULT_SNAPSHOT_DIR = str(Path(__file__).resolve().parent.parent / ".cache" / "training_datasets")
+# Snapshots kept per feature view version, the oldest ones are removed first
+KEEP_SNAPSHOTS = 5
+MANIFEST_FILE = "manifest.json"
+SPLITS = ("X_train", "X_test", "y_train", "y_test")
+
+
+@dataclass
+class TrainTestSnapshot:
+    X_train: pd.DataFrame = field(repr=False)
+    X_test: pd.DataFrame = field(repr=False)
+    y_train: pd.DataFrame = field(repr=False)
+    y_test: pd.DataFrame = field(repr=False)
+    fingerprint: str = None
+    path: str = None
+    from_cache: bool = False
+
+    def __iter__(self):
+        # Unpacks like feature_view.train_test_split: X_train, X_test, y_train, y_test = snapshot
+        return iter((self.X_train, self.X_test, self.y_train, self.y_test))
+
+
+def upstream_feature_groups(feature_view) -> list:
+    """Feature groups read by the feature view's query (empty if the query does not expose them)."""
+    query = getattr(feature_view, "query", None)
+    return list(getattr(query, "featuregroups", None) or [])
+
+
+def _boundary(value):
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return (ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")).isoformat()
+
+
+def snapshot_fingerprint(name: str, version: int, split_args: dict, commits: dict) -> str:
+    """Key of a snapshot: feature view, split arguments and upstream commits."""
+    key = json.dumps({"feature_view": [name, version], "split": split_args, "commits": commits},
+                     sort_keys=True, default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def _write(path: Path, frames: dict, manifest: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    try:
+        series = []
+        for name, df in frames.items():
+            if isinstance(df, pd.Series):
+                series.append(name)
+                df = df.to_frame()
+            df.to_parquet(tmp_dir / f"{name}.parquet", compression="zstd")
+        with open(tmp_dir / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump({**manifest, "series": series}, f, indent=2, default=str)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_dir, path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _read(path: Path) -> dict:
+    with open(path / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    frames = {}
+    for name in SPLITS:
+        df = pd.read_parquet(path / f"{name}.parquet")
+        frames[name] = df.iloc[:, 0] if name in manifest.get("series", []) else df
+    return frames
+
+
+def _prune(view_dir: Path, keep: int):
+    snapshots = sorted((p for p in view_dir.iterdir() if (p / MANIFEST_FILE).exists()),
+                       key=lambda p: (p / MANIFEST_FILE).stat().st_mtime_ns, reverse=True)
+    for old in snapshots[keep:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+@tracing.traced(kind="read")
+def train_test_split(feature_view, test_start=None, test_end=None, train_start=None, train_end=None,
+                     upstream=None, snapshot_dir: str = DEFAULT_SNAPSHOT_DIR, refresh=False,
+                     keep: int = KEEP_SNAPSHOTS, **kwargs) -> TrainTestSnapshot:
+    """
+    `feature_view.train_test_split(...)` backed by a local snapshot. `upstream` are
+    the feature groups whose commits invalidate the snapshot (default: the feature
+    groups of the feature view's query). If a commit cannot be read, the split is
+    materialized without caching, since a stale snapshot could not be detected.
+    """
+    name, version = feature_view.name, feature_view.version
+    boundaries = {"test_start": test_start, "test_end": test_end, "train_start": train_start, "train_end": train_end}
+    split_args = {**{k: _boundary(v) for k, v in boundaries.items()}, **kwargs}
+    fgs = upstream if upstream is not None else upstream_feature_groups(feature_view)
+    commits = {f"{fg.name}_{fg.version}": latest_commit_id(fg) for fg in fgs}
+
+    def materialize():
+        args = {k: v for k, v in boundaries.items() if v is not None}
+        return dict(zip(SPLITS, feature_view.train_test_split(**args, **kwargs)))
+
+    if not commits or any(c is None for c in commits.values()):
+        print(f"Upstream commits of {name}_{version} unknown, materializing without a snapshot")
+        return TrainTestSnapshot(**materialize())
+
+    fingerprint = snapshot_fingerprint(name, version, split_args, commits)
+    view_dir = Path(snapshot_dir) / f"{name}_{version}"
+    path = view_dir / fingerprint
+    if not refresh and (path / MANIFEST_FILE).exists():
+        print(f"Loading training dataset snapshot {fingerprint[:12]} of {name}_{version}")
+        return TrainTestSnapshot(**_read(path), fingerprint=fingerprint, path=str(path), from_cache=True)
+
+    print(f"Materializing training dataset of {name}_{version} (snapshot {fingerprint[:12]})")
+    frames = materialize()
+    _write(path, frames, {"feature_view": name, "version": version, "split": split_args, "commits": commits,
+                          "rows": {k: len(v) for k, v in frames.items()}})
+    _prune(view_dir, keep)
+    return TrainTestSnapshot(**frames, fingerprint=fingerprint, path=str(path))
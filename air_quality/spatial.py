@@ -0,0 +1,238 @@
+"""Spatial interpolation of sensor forecasts onto a regional lat/lon grid.
+
+Forecasts only exist at the sensors. `forecast_grid` spreads them over a
+regular grid with inverse distance weighting (IDW): every cell is the weighted
+mean of its `neighbours` nearest sensors, with weights 1 / distance**power.
+
+The interpolation is split in two parts:
+
+- `load_weights` finds the nearest sensors of every cell with a KD-tree and
+  computes their weights. This only depends on the sensor coordinates and the
+  grid, so it is done once and stored under .cache/grid_weights, keyed on a
+  fingerprint of both (and kept in memory for the rest of the process).
+- `interpolate` applies the weights to a (days x sensors) matrix of values
+  with a few vectorized NumPy operations, for all days at once. Sensors
+  without a value on a day are left out of that day's weighted means.
+
+The grid comes from the `grid` entry of the city config::
+
+    "grid": {"lat_min": 57.1, "lat_max": 58.9, "lon_min": 11.1, "lon_max": 14.1, "rows": 200, "cols": 250}
+
+Without bounds, the bounding box of the sensors padded by PADDING_DEG is used,
+and without rows/cols DEFAULT_CELLS per axis. Distances are measured in km on
+an equirectangular projection around the centre of the grid, which is
+accurate at the scale of a region.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from air_quality import tracing
+from air_quality.features import DATE, KEYS
+from air_quality.forecasting import HORIZON_COLUMN, PREDICTION
+from air_quality.ingestion import sensor_locations
+
+DEFAULT_WEIGHTS_DIR = str(Path(__file__).resolve().parent.parent / ".cache" / "grid_weights")
+NEIGHBOURS = 8
+POWER = 2.0
+PADDING_DEG = 0.1
+DEFAULT_CELLS = 200
+EARTH_RADIUS_KM = 6371.0
+# Distances below 1 m count as 1 m, so a cell on top of a sensor takes (almost only) its value
+MIN_DISTANCE_KM = 1e-3
+
+_WEIGHTS = {}
+
+
+@dataclass
+class Grid:
+    lat: np.ndarray
+    lon: np.ndarray
+
+    @property
+    def shape(self) -> tuple:
+        return len(self.lat), len(self.lon)
+
+    def cells(self) -> tuple:
+        """Latitude and longitude of every cell in row-major order (rows follow `lat`, north first)."""
+        lon, lat = np.meshgrid(self.lon, self.lat)
+        return lat.ravel(), lon.ravel()
+
+    def spec(self) -> dict:
+        return {"lat": [float(self.lat[0]), float(self.lat[-1]), len(self.lat)],
+                "lon": [float(self.lon[0]), float(self.lon[-1]), len(self.lon)]}
+
+
+def grid_from_config(city_config: dict, locations: pd.DataFrame = None) -> Grid:
+    """The grid of the `grid` entry of the city config, by default around its sensors."""
+    spec = city_config.get("grid", {})
+    if locations is None:
+        locations = sensor_locations(city_config)
+    lat_min = spec.get("lat_min", locations["latitude"].min() - PADDING_DEG)
+    lat_max = spec.get("lat_max", locations["latitude"].max() + PADDING_DEG)
+    lon_min = spec.get("lon_min", locations["longitude"].min() - PADDING_DEG)
+    lon_max = spec.get("lon_max", locations["longitude"].max() + PADDING_DEG)
+    rows = int(spec.get("rows", DEFAULT_CELLS))
+    cols = int(spec.get("cols", DEFAULT_CELLS))
+    if lat_min >= lat_max or lon_min >= lon_max or rows < 1 or cols < 1:
+        raise ValueError(f"Invalid grid: {spec}")
+    return Grid(lat=np.linspace(lat_max, lat_min, rows), lon=np.linspace(lon_min, lon_max, cols))
+
+
+def _project(lat, lon, lat0: float) -> np.ndarray:
+    """Equirectangular x/y in km around latitude `lat0`."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack([EARTH_RADIUS_KM * lon * np.cos(np.radians(lat0)), EARTH_RADIUS_KM * lat])
+
+
+@dataclass
+class IDWWeights:
+    """Nearest sensors (`indices`) and their IDW weights of every grid cell, both (cells, neighbours)."""
+    indices: np.ndarray = field(repr=False)
+    weights: np.ndarray = field(repr=False)
+    sensors: list
+    grid: Grid = field(repr=False)
+    fingerprint: str = None
+
+
+def weights_fingerprint(locations: pd.DataFrame, grid: Grid, neighbours: int, power: float) -> str:
+    """Key of the weights: sensor coordinates (in order), grid, neighbours and power."""
+    key = json.dumps({
+        "sensors": locations[["latitude", "longitude"]].round(6).to_numpy().tolist(),
+        "grid": grid.spec(), "neighbours": neighbours, "power": power,
+    }, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def build_weights(locations: pd.DataFrame, grid: Grid, neighbours: int = NEIGHBOURS, power: float = POWER) -> IDWWeights:
+    """IDW weights of the `neighbours` nearest sensors of every cell, found with a KD-tree."""
+    if locations.empty:
+        raise ValueError("No sensors to interpolate from")
+    lat0 = float(grid.lat.mean())
+    tree = cKDTree(_project(locations["latitude"].to_numpy(), locations["longitude"].to_numpy(), lat0))
+    k = min(neighbours, len(locations))
+    distances, indices = tree.query(_project(*grid.cells(), lat0), k=k)
+    if k == 1:
+        distances, indices = distances[:, None], indices[:, None]
+    weights = 1.0 / np.maximum(distances, MIN_DISTANCE_KM) ** power
+    # Normalized per cell, so the weights also sum to 1 if all neighbours have a value
+    weights /= weights.sum(axis=1, keepdims=True)
+    return IDWWeights(indices=indices.astype("int32"), weights=weights.astype("float32"),
+                      sensors=locations[KEYS].astype(str).to_numpy().tolist(), grid=grid)
+
+
+def _save_weights(path: Path, weights: IDWWeights):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".npz")
+    os.close(fd)
+    try:
+        np.savez(tmp_path, indices=weights.indices, weights=weights.weights,
+                 lat=weights.grid.lat, lon=weights.grid.lon)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_weights(locations: pd.DataFrame, grid: Grid, neighbours: int = NEIGHBOURS, power: float = POWER,
+                 weights_dir: str = DEFAULT_WEIGHTS_DIR) -> IDWWeights:
+    """The weights of `locations` on `grid`, from memory or .cache/grid_weights if they were built before."""
+    fingerprint = weights_fingerprint(locations, grid, neighbours, power)
+    sensors = locations[KEYS].astype(str).to_numpy().tolist()
+    if fingerprint in _WEIGHTS:
+        cached = _WEIGHTS[fingerprint]
+        return IDWWeights(cached.indices, cached.weights, sensors, cached.grid, fingerprint)
+
+    path = Path(weights_dir) / f"{fingerprint}.npz"
+    if path.exists():
+        with np.load(path) as stored:
+            weights = IDWWeights(stored["indices"], stored["weights"], sensors,
+                                 Grid(lat=stored["lat"], lon=stored["lon"]), fingerprint)
+    else:
+        with tracing.stage("build_grid_weights", kind="aggregate", rows_in=len(locations)) as s:
+            weights = build_weights(locations, grid, neighbours, power)
+            weights.fingerprint = fingerprint
+            s.rows_out = weights.indices.shape[0]
+        _save_weights(path, weights)
+        print(f"Built IDW weights for {len(locations)} sensors on a {grid.shape[0]}x{grid.shape[1]} grid "
+              f"({fingerprint[:12]})")
+    _WEIGHTS[fingerprint] = weights
+    return weights
+
+
+def interpolate(weights: IDWWeights, values: np.ndarray) -> np.ndarray:
+    """
+    (days, rows, cols) float32 grids of `values`, a (days, sensors) matrix in the
+    order of `weights.sensors`. Missing values (NaN) are left out of the weighted
+    means; cells without any neighbour value are NaN.
+    """
+    values = np.asarray(values, dtype="float32")
+    if values.ndim == 1:
+        values = values[None, :]
+    neighbour_values = values[:, weights.indices]    # (days, cells, neighbours)
+    valid = ~np.isnan(neighbour_values)
+    numerator = np.einsum("dcn,cn->dc", np.where(valid, neighbour_values, 0.0), weights.weights)
+    denominator = np.einsum("dcn,cn->dc", valid.astype("float32"), weights.weights)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        grids = np.where(denominator > 0, numerator / denominator, np.nan).astype("float32")
+    return grids.reshape((len(values),) + weights.grid.shape)
+
+
+@dataclass
+class ForecastGrid:
+    dates: np.ndarray
+    lat: np.ndarray = field(repr=False)
+    lon: np.ndarray = field(repr=False)
+    values: np.ndarray = field(repr=False)
+
+    def save(self, path: str):
+        """Writes the grids as a compressed .npz (dates as datetime64[D], values float32) for a map layer."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, dates=self.dates.astype("datetime64[D]"), lat=self.lat.astype("float32"),
+                            lon=self.lon.astype("float32"), values=self.values)
+        os.replace(tmp_path, path)
+
+
+def _sensor_values(predictions_df: pd.DataFrame, locations: pd.DataFrame, value_column: str):
+    """(dates, (days, sensors) matrix) of the predictions, sensors in the order of `locations`."""
+    df = predictions_df.dropna(subset=[value_column])
+    if HORIZON_COLUMN in df.columns:
+        # The most recent forecast of every date (fewest days before it)
+        df = df.sort_values(HORIZON_COLUMN).drop_duplicates(subset=KEYS + [DATE], keep="first")
+    dates = pd.to_datetime(df[DATE])
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert(None)
+    values = df[KEYS].astype(str).assign(**{DATE: dates.dt.floor("D"), value_column: df[value_column]})
+    matrix = values.pivot_table(index=DATE, columns=KEYS, values=value_column, aggfunc="mean")
+    sensors = pd.MultiIndex.from_frame(locations[KEYS].astype(str))
+    unknown = sorted(set(matrix.columns) - set(sensors))
+    if unknown:
+        print(f"Skipping predictions of sensors without coordinates in the city config: {unknown}")
+    matrix = matrix.reindex(columns=sensors)
+    return matrix.index.to_numpy(), matrix.to_numpy(dtype="float32")
+
+
+@tracing.traced(kind="aggregate")
+def forecast_grid(predictions_df: pd.DataFrame, city_config: dict, grid: Grid = None,
+                  value_column: str = PREDICTION, neighbours: int = NEIGHBOURS, power: float = POWER,
+                  weights_dir: str = DEFAULT_WEIGHTS_DIR) -> ForecastGrid:
+    """
+    Interpolates the per-sensor predictions (rows of aq_predictions: city,
+    street, date, `value_column`) onto the grid of the city config, one grid
+    per forecast date.
+    """
+    locations = sensor_locations(city_config).dropna(subset=["latitude", "longitude"]).reset_index(drop=True)
+    grid = grid if grid is not None else grid_from_config(city_config, locations)
+    weights = load_weights(locations, grid, neighbours, power, weights_dir)
+    dates, values = _sensor_values(predictions_df, locations, value_column)
+    grids = interpolate(weights, values) if len(dates) else np.empty((0,) + grid.shape, dtype="float32")
+    print(f"Interpolated {len(dates)} days of {len(locations)} sensors onto a {grid.shape[0]}x{grid.shape[1]} grid")
+    return ForecastGrid(dates=dates, lat=weights.grid.lat, lon=weights.grid.lon, values=grids)
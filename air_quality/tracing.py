@@ -0,0 +1,225 @@
+"""Per-stage tracing of the pipelines.
+
+A stage records its wall time, CPU time, peak RSS, rows in/out and the bytes
+received by the shared HTTP client::
+
+    with tracing.stage("insert_air_quality", kind="insert", rows_in=len(df)) as s:
+        fg.insert(df)
+        s.rows_out = len(df)
+
+    @tracing.traced(kind="fetch")
+    def fetch_region(...): ...
+
+Tracing is off unless PIPELINE_TRACE_FILE (JSON lines, one record per stage)
+or PIPELINE_METRICS_FILE (Prometheus textfile with the last value per stage)
+is set, or `configure()` is called. When it is off, `stage()` returns a shared
+no-op object and `traced` functions call straight through, so the
+instrumentation can stay in place.
+
+Peak RSS is the process high-water mark at the end of the stage;
+`rss_growth_bytes` is how much the stage raised it.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:    # Windows
+    resource = None
+
+METRIC_PREFIX = "air_quality_stage"
+
+_config = {"trace_file": None, "metrics_file": None, "pipeline": None}
+_enabled = False
+_run_id = uuid.uuid4().hex[:12]
+_local = threading.local()
+_lock = threading.Lock()
+_last = {}    # (pipeline, stage) -> last record, for the Prometheus textfile
+
+
+def configure(trace_file: str = None, metrics_file: str = None, pipeline: str = None):
+    """
+    Sets the output files (default: PIPELINE_TRACE_FILE / PIPELINE_METRICS_FILE)
+    and the pipeline name (default: PIPELINE_NAME or the script name).
+    """
+    global _enabled
+    _config["trace_file"] = trace_file or os.getenv("PIPELINE_TRACE_FILE") or None
+    _config["metrics_file"] = metrics_file or os.getenv("PIPELINE_METRICS_FILE") or None
+    script = Path(sys.argv[0]).stem if sys.argv and sys.argv[0] else "python"
+    _config["pipeline"] = pipeline or os.getenv("PIPELINE_NAME") or script
+    _enabled = bool(_config["trace_file"] or _config["metrics_file"])
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024    # kilobytes on Linux
+
+
+def _http_bytes():
+    # Only read if a pipeline already uses the HTTP client, never imported for it
+    module = sys.modules.get("air_quality.http_client")
+    return module.bytes_received() if module is not None else 0
+
+
+class _NoopStage:
+    rows_in = rows_out = bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+class Stage:
+    """A running stage; set `rows_out` (and `rows_in` or `bytes` if known) before it ends."""
+
+    def __init__(self, name, kind=None, rows_in=None, **labels):
+        self.name = name
+        self.kind = kind
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.bytes = None
+        self.labels = labels
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self._started_at = time.time()
+        self._rss_before = _peak_rss_bytes()
+        self._bytes_before = _http_bytes()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak = _peak_rss_bytes()
+        _local.stack.pop()
+        record = {
+            "run_id": _run_id,
+            "pipeline": _config["pipeline"],
+            "stage": self.name,
+            "kind": self.kind,
+            "parent": self.parent,
+            "started_at": self._started_at,
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(cpu, 6),
+            "peak_rss_bytes": peak,
+            "rss_growth_bytes": None if peak is None else peak - self._rss_before,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes": self.bytes if self.bytes is not None else _http_bytes() - self._bytes_before,
+            "status": "ok" if exc_type is None else "error",
+            "error": None if exc_type is None else exc_type.__name__,
+        }
+        if self.labels:
+            record["labels"] = self.labels
+        _emit(record)
+        return False
+
+
+def stage(name, kind=None, rows_in=None, **labels):
+    """Context manager timing one stage; a shared no-op when tracing is off."""
+    if not _enabled:
+        return _NOOP
+    return Stage(name, kind, rows_in, **labels)
+
+
+def _rows(value):
+    # DataFrames, Series and arrays
+    if hasattr(value, "shape") and hasattr(value, "__len__"):
+        return len(value)
+    return None
+
+
+def traced(name=None, kind=None):
+    """Decorator running the function as a stage; rows are taken from a DataFrame first argument and result."""
+    def decorate(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            rows_in = next((r for r in map(_rows, args) if r is not None), None)
+            with Stage(stage_name, kind, rows_in) as s:
+                result = fn(*args, **kwargs)
+                s.rows_out = _rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def _emit(record):
+    with _lock:
+        if _config["trace_file"]:
+            path = Path(_config["trace_file"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        if _config["metrics_file"]:
+            _last[(record["pipeline"], record["stage"])] = record
+            _write_metrics(Path(_config["metrics_file"]))
+
+
+_METRICS = [
+    ("wall_seconds", "Wall time of the last run of the stage in seconds."),
+    ("cpu_seconds", "CPU time of the last run of the stage in seconds."),
+    ("peak_rss_bytes", "Process peak resident memory at the end of the stage."),
+    ("rss_growth_bytes", "Increase of the process peak resident memory during the stage."),
+    ("rows_in", "Rows going into the stage."),
+    ("rows_out", "Rows coming out of the stage."),
+    ("bytes", "Bytes received over HTTP during the stage."),
+]
+
+
+def _write_metrics(path: Path):
+    def label(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    lines = []
+    for field, help_text in _METRICS + [("last_run_timestamp_seconds", "Unix time the stage last ended."),
+                                        ("failed", "1 if the last run of the stage raised an error.")]:
+        metric = f"{METRIC_PREFIX}_{field}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+        for (pipeline, stage_name), record in sorted(_last.items()):
+            if field == "last_run_timestamp_seconds":
+                value = record["started_at"] + record["wall_seconds"]
+            elif field == "failed":
+                value = int(record["status"] != "ok")
+            else:
+                value = record[field]
+            if value is None:
+                continue
+            lines.append(f'{metric}{{pipeline="{label(pipeline)}",stage="{label(stage_name)}",'
+                         f'kind="{label(record["kind"] or "")}"}} {value}')
+
+    # Written to a temporary file first so the node exporter never reads a half-written file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+configure()
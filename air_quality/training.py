@@ -0,0 +1,121 @@
+"""Training helpers shared by the full training notebook and the incremental update.
+
+Every saved model directory gets a training_metadata.json next to model.json
+with the training cutoff (the last date the model has been trained on) and a
+fingerprint of the training rows. `warm_start_update` continues boosting the
+existing model on the rows after that cutoff only, and `compare_on_holdout`
+decides whether the updated model may replace the previous one.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+
+from air_quality import tracing
+
+METADATA_FILE = "training_metadata.json"
+MODEL_FILE = "model.json"
+LAG_COLUMNS = ['pm2_5_lag_1', 'pm2_5_lag_2', 'pm2_5_lag_3']
+NON_FEATURE_COLUMNS = ['date', 'country', 'city', 'street']
+LABEL = "pm2_5"
+
+# Boosting rounds added per incremental update, and how much worse (relative MSE) an update may be
+INCREMENTAL_ROUNDS = 50
+TOLERANCE = 0.0
+
+
+def prepare_features(X: pd.DataFrame) -> pd.DataFrame:
+    """Same preprocessing as the training notebook: fill lags within each sensor, drop keys."""
+    X = X.sort_values(by=[c for c in ['city', 'street', 'date'] if c in X.columns]).copy()
+    lag_cols = [c for c in LAG_COLUMNS if c in X.columns]
+    if lag_cols:
+        # Forward-fill, then back-fill the leading gap; both per sensor, so no sensor is filled from another
+        X[lag_cols] = X.groupby(['city', 'street'], observed=True)[lag_cols].ffill()
+        X[lag_cols] = X.groupby(['city', 'street'], observed=True)[lag_cols].bfill()
+    return X.drop(columns=[c for c in NON_FEATURE_COLUMNS if c in X.columns])
+
+
+def fingerprint(X: pd.DataFrame, y=None) -> str:
+    """Content hash of the training rows (order-sensitive, index ignored)."""
+    h = hashlib.sha256(",".join(map(str, X.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    if y is not None:
+        h.update(pd.util.hash_pandas_object(pd.DataFrame(y), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def write_metadata(model_dir: str, training_cutoff, data_fingerprint: str, n_rows: int, mode: str = "full",
+                   parent=None, metrics: dict = None, dataset_snapshot: str = None):
+    meta = {
+        "training_cutoff": pd.Timestamp(training_cutoff).isoformat(),
+        "data_fingerprint": data_fingerprint,
+        "n_rows": int(n_rows),
+        "mode": mode,
+        "parent": parent,
+        "metrics": metrics or {},
+        "dataset_snapshot": dataset_snapshot,
+    }
+    with open(os.path.join(model_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def read_metadata(model_dir: str) -> dict:
+    path = os.path.join(model_dir, METADATA_FILE)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found. Run the full training pipeline once to record the training cutoff.")
+    with open(path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["training_cutoff"] = pd.Timestamp(meta["training_cutoff"])
+    return meta
+
+
+def load_model(model_dir: str) -> XGBRegressor:
+    model = XGBRegressor()
+    model.load_model(os.path.join(model_dir, MODEL_FILE))
+    return model
+
+
+def split_new_rows(df: pd.DataFrame, training_cutoff, holdout_days: int):
+    """
+    Rows after `training_cutoff`, split into (train, holdout) where the holdout is
+    the last `holdout_days` days. The holdout is not trained on, so the next update's
+    cutoff stays before it and it is picked up then.
+    """
+    dates = pd.to_datetime(df['date'], utc=True)
+    cutoff = pd.Timestamp(training_cutoff)
+    cutoff = cutoff.tz_localize("UTC") if cutoff.tzinfo is None else cutoff.tz_convert("UTC")
+    new = df[dates > cutoff]
+    if new.empty:
+        return new, new
+    new_dates = pd.to_datetime(new['date'], utc=True)
+    holdout_start = new_dates.max().normalize() - pd.Timedelta(days=holdout_days - 1)
+    return new[new_dates < holdout_start], new[new_dates >= holdout_start]
+
+
+@tracing.traced(kind="train")
+def warm_start_update(model: XGBRegressor, X_new: pd.DataFrame, y_new, n_rounds: int = INCREMENTAL_ROUNDS) -> XGBRegressor:
+    """A new model with `n_rounds` more trees boosted on top of `model` using only the new rows."""
+    params = {k: v for k, v in model.get_params().items() if v is not None}
+    params["n_estimators"] = n_rounds
+    updated = XGBRegressor(**params)
+    X_new = X_new[list(model.feature_names_in_)]
+    updated.fit(X_new, np.asarray(y_new, dtype="float64").ravel(), xgb_model=model.get_booster())
+    return updated
+
+
+def compare_on_holdout(previous: XGBRegressor, updated: XGBRegressor, X_holdout: pd.DataFrame, y_holdout,
+                       tolerance: float = TOLERANCE) -> dict:
+    """Holdout MSE of both models; `accept` is True if the update is not worse (within `tolerance`)."""
+    y = np.asarray(y_holdout, dtype="float64").ravel()
+    X_holdout = X_holdout[list(previous.feature_names_in_)]
+    previous_mse = float(np.mean((y - previous.predict(X_holdout)) ** 2))
+    updated_mse = float(np.mean((y - updated.predict(X_holdout)) ** 2))
+    return {
+        "previous_mse": previous_mse,
+        "updated_mse": updated_mse,
+        "accept": updated_mse <= previous_mse * (1.0 + tolerance),
+    }
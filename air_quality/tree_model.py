@@ -0,0 +1,207 @@
+"""NumPy evaluator for the XGBoost model saved as model.json.
+
+`load_model` reads the JSON dump written by `XGBRegressor.save_model` and
+compiles all trees into flat arrays (split feature, threshold, child indices,
+default direction and leaf value), concatenated over trees. `predict_margin`
+then walks every tree for every row at once, one NumPy step per tree level,
+which avoids the per-call overhead of the xgboost runtime for small batches.
+Its cost grows with the batch much faster than xgboost's, so `predict` hands
+batches of XGBOOST_MIN_ROWS rows or more to the xgboost booster of the same
+model.json when xgboost is installed.
+
+Only numerical splits of gbtree models are supported, which is what the
+training notebook produces. Parity with `XGBRegressor.predict` is checked by
+benchmarks/tree_model.py, which also measures the crossover batch size.
+"""
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Objectives whose prediction is the raw margin, and the link of the others
+_IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:squaredlogerror", "reg:absoluteerror", "reg:pseudohubererror"}
+_LOGISTIC_OBJECTIVES = {"reg:logistic", "binary:logistic"}
+_LOG_LINK_OBJECTIVES = {"count:poisson", "reg:gamma", "reg:tweedie"}
+
+# Batch size from which xgboost predicts faster than the NumPy evaluator (benchmarks/tree_model.py)
+XGBOOST_MIN_ROWS = 32
+
+
+def _parse_base_score(value) -> float:
+    # Saved as "2.66E1" by xgboost < 3 and as "[2.66E1]" by newer versions
+    return float(str(value).strip("[]"))
+
+
+class TreeModel:
+    """Compiled gbtree ensemble, a drop-in for `XGBRegressor.predict`."""
+
+    def __init__(self, feature_names, split_index, threshold, left, right, default_left, leaf_value,
+                 roots, depth, base_margin, objective, source=None):
+        self.feature_names = list(feature_names) if feature_names else None
+        # Same attribute as fitted scikit-learn estimators, so callers can read the feature order
+        self.feature_names_in_ = np.array(self.feature_names) if self.feature_names else None
+        self.split_index = split_index
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.depth = depth
+        self.base_margin = base_margin
+        self.objective = objective
+        # model.json the xgboost booster for large batches is loaded from, on first use
+        self.source = source
+        self._booster = None
+        self._booster_lock = threading.Lock()
+        # xgboost allocates the right child next to the left one, which saves a gather per level
+        self._adjacent_children = bool(np.all(right[left != right] == left[left != right] + 1))
+
+    def __getstate__(self):
+        # The booster and its lock are not picklable; the booster is loaded again on first use
+        state = dict(self.__dict__)
+        state.update(_booster=None, _booster_lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._booster_lock = threading.Lock()
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def from_dict(cls, model: dict, source=None) -> "TreeModel":
+        learner = model["learner"]
+        booster = learner["gradient_booster"]
+        if booster["name"] != "gbtree":
+            raise ValueError(f"Only gbtree models are supported, got {booster['name']}")
+        params = learner["learner_model_param"]
+        if int(params.get("num_class", 0)) > 1 or int(params.get("num_target", 1)) > 1:
+            raise ValueError("Only single-output models are supported")
+
+        objective = learner["objective"]["name"]
+        base_score = _parse_base_score(params["base_score"])
+        if objective in _IDENTITY_OBJECTIVES:
+            base_margin = base_score
+        elif objective in _LOGISTIC_OBJECTIVES:
+            base_margin = float(np.log(base_score / (1.0 - base_score)))
+        elif objective in _LOG_LINK_OBJECTIVES:
+            base_margin = float(np.log(base_score))
+        else:
+            raise ValueError(f"Unsupported objective: {objective}")
+
+        split_index, threshold, left, right, default_left, leaf_value = [], [], [], [], [], []
+        roots, depth, offset = [], 0, 0
+        for tree in booster["model"]["trees"]:
+            if any(tree.get("split_type", [])):
+                raise ValueError("Categorical splits are not supported")
+            tree_left = np.asarray(tree["left_children"], dtype=np.int64)
+            tree_right = np.asarray(tree["right_children"], dtype=np.int64)
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            is_leaf = tree_left == -1
+            nodes = np.arange(len(tree_left))
+
+            # Leaves point to themselves and always "go left" (x < inf, missing goes left),
+            # so extra steps past a leaf are no-ops
+            left.append(np.where(is_leaf, nodes, tree_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree_right) + offset)
+            split_index.append(np.where(is_leaf, 0, np.asarray(tree["split_indices"], dtype=np.int64)))
+            threshold.append(np.where(is_leaf, np.inf, conditions).astype(np.float32))
+            default_left.append(np.asarray(tree["default_left"], dtype=bool) | is_leaf)
+            # For leaves, xgboost stores the leaf value in split_conditions
+            leaf_value.append(np.where(is_leaf, conditions, 0.0).astype(np.float32))
+            roots.append(offset)
+            depth = max(depth, _tree_depth(tree_left, tree_right))
+            offset += len(tree_left)
+
+        return cls(
+            feature_names=learner.get("feature_names"),
+            split_index=np.concatenate(split_index),
+            threshold=np.concatenate(threshold),
+            left=np.concatenate(left),
+            right=np.concatenate(right),
+            default_left=np.concatenate(default_left),
+            leaf_value=np.concatenate(leaf_value),
+            roots=np.asarray(roots, dtype=np.int64),
+            depth=depth,
+            base_margin=base_margin,
+            objective=objective,
+            source=source,
+        )
+
+    def _as_matrix(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names:
+                X = X[self.feature_names]
+            return X.to_numpy(dtype=np.float32, na_value=np.nan)
+        X = np.asarray(X, dtype=np.float32)
+        return X.reshape(1, -1) if X.ndim == 1 else X
+
+    def booster(self):
+        """The xgboost booster of `source`, or None without a model file or xgboost."""
+        if self._booster is None and self.source is not None:
+            with self._booster_lock:
+                if self._booster is None:
+                    try:
+                        import xgboost
+                    except ImportError:
+                        self.source = None
+                        return None
+                    self._booster = xgboost.Booster(model_file=str(self.source))
+        return self._booster
+
+    def predict_margin(self, X) -> np.ndarray:
+        """Raw margin of every row, from the NumPy evaluator."""
+        X = np.ascontiguousarray(self._as_matrix(X))
+        has_missing = np.isnan(X).any()
+        flat_X = X.ravel()
+        row_offset = (np.arange(len(X)) * X.shape[1])[:, None]
+        node = np.tile(self.roots, (len(X), 1))
+        for _ in range(self.depth):
+            value = np.take(flat_X, row_offset + np.take(self.split_index, node))
+            # Comparisons are in float32 like xgboost; NaN compares False and is fixed up below
+            go_right = ~(value < np.take(self.threshold, node))
+            if has_missing:
+                missing = np.isnan(value)
+                go_right[missing] = ~np.take(self.default_left, node[missing])
+            if self._adjacent_children:
+                node = np.take(self.left, node) + go_right
+            else:
+                node = np.where(go_right, np.take(self.right, node), np.take(self.left, node))
+        return np.take(self.leaf_value, node).sum(axis=1, dtype=np.float64) + self.base_margin
+
+    def predict(self, X, evaluator=None) -> np.ndarray:
+        """
+        Like `XGBRegressor.predict`. `evaluator` ("numpy" or "xgboost") overrides
+        the choice by batch size.
+        """
+        X = self._as_matrix(X)
+        if evaluator is None:
+            evaluator = "xgboost" if len(X) >= XGBOOST_MIN_ROWS else "numpy"
+        if evaluator == "xgboost" and self.booster() is not None:
+            return np.asarray(self.booster().inplace_predict(X), dtype=np.float32)
+        margin = self.predict_margin(X)
+        if self.objective in _LOGISTIC_OBJECTIVES:
+            margin = 1.0 / (1.0 + np.exp(-margin))
+        elif self.objective in _LOG_LINK_OBJECTIVES:
+            margin = np.exp(margin)
+        return margin.astype(np.float32)
+
+
+def _tree_depth(left, right) -> int:
+    depth, frontier = 0, np.array([0])
+    while True:
+        children = np.concatenate([left[frontier], right[frontier]])
+        frontier = children[children != -1]
+        if not len(frontier):
+            return depth
+        depth += 1
+
+
+def load_model(path) -> TreeModel:
+    """Compiles the model.json written by `XGBRegressor.save_model`."""
+    with open(path, encoding="utf-8") as f:
+        return TreeModel.from_dict(json.load(f), source=path)
@@ -0,0 +1,211 @@
+"""Delta-aware, idempotent feature group inserts.
+
+Every insert into a Hopsworks feature group starts a materialization job, even
+when most of the rows are already stored. `upsert(fg, df)` only inserts the
+rows that are new or changed, by comparing `df` with a content-hash index of
+the feature group: one 64-bit hash of the primary key (city, street, date and
+days_before_forecast_day for aq_predictions) and one of the other columns per
+stored row::
+
+    .cache/upsert_index/air_quality_1.parquet     key: uint64, row: uint64
+
+Rows whose key is not in the index are inserted, rows whose content hash
+differs are updated (re-inserted, the feature group upserts on its primary
+key) and the rest are skipped, so re-running a pipeline writes nothing and a
+daily run writes the new days only. Rows are sent in batches of `batch_rows`
+and the index is updated after every batch that was written.
+
+The index also records the latest commit of the feature group it has seen.
+If the feature group has another commit (written elsewhere, recreated, or the
+index is missing, e.g. on a fresh CI runner), the index is first refreshed
+for the incoming rows from the feature group itself, reading only their event
+time window. Values are hashed as they are stored: floats as float64, event
+times as UTC, categoricals like their strings.
+"""
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from air_quality import tracing
+from air_quality.feature_store import _to_utc, latest_commit_id
+
+DEFAULT_INDEX_DIR = str(Path(__file__).resolve().parent.parent / ".cache" / "upsert_index")
+BATCH_ROWS = 100_000
+_COMMIT_KEY = b"commit"
+
+_INDEXES = {}
+_lock = threading.Lock()
+
+
+@dataclass
+class UpsertResult:
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+    @property
+    def written(self) -> int:
+        return self.inserted + self.updated
+
+    def __add__(self, other):
+        return UpsertResult(self.inserted + other.inserted, self.updated + other.updated,
+                            self.skipped + other.skipped)
+
+
+def _normalized(df: pd.DataFrame) -> pd.DataFrame:
+    """Columns in the types they are stored with, so frames built and frames read back hash the same."""
+    columns = {}
+    for column in sorted(df.columns):
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = _to_utc(values)
+        elif pd.api.types.is_float_dtype(values):
+            values = values.astype("float64")
+        elif pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+            values = values.astype("int64")
+        columns[column] = values.reset_index(drop=True)
+    return pd.DataFrame(columns)
+
+
+def row_hashes(df: pd.DataFrame, primary_key: list) -> tuple:
+    """(key hashes, content hashes) of the rows of `df`, both uint64 arrays."""
+    values = [c for c in df.columns if c not in primary_key]
+    keys = pd.util.hash_pandas_object(_normalized(df[primary_key]), index=False).to_numpy()
+    if not values:
+        return keys, np.zeros(len(df), dtype="uint64")
+    return keys, pd.util.hash_pandas_object(_normalized(df[values]), index=False).to_numpy()
+
+
+class HashIndex:
+    """Content hash per primary key hash of the rows stored in one feature group."""
+
+    def __init__(self, keys=None, rows=None, commit=None):
+        self.keys = pd.Index(np.asarray(keys if keys is not None else [], dtype="uint64"))
+        self.rows = np.asarray(rows if rows is not None else [], dtype="uint64")
+        self.commit = commit
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Position of every key in the index, -1 if it is not there."""
+        return self.keys.get_indexer(keys) if len(self.keys) else np.full(len(keys), -1)
+
+    def update(self, keys: np.ndarray, rows: np.ndarray):
+        keys = pd.Index(np.concatenate([self.keys.to_numpy(), keys]))
+        rows = np.concatenate([self.rows, rows])
+        keep = ~keys.duplicated(keep="last")
+        self.keys, self.rows = keys[keep], rows[keep]
+
+    def drop(self, keys: np.ndarray):
+        keep = ~self.keys.isin(keys)
+        self.keys, self.rows = self.keys[keep], self.rows[keep]
+
+    @classmethod
+    def load(cls, path: Path):
+        if not path.exists():
+            return cls()
+        table = pq.read_table(path)
+        commit = (table.schema.metadata or {}).get(_COMMIT_KEY)
+        return cls(table["key"].to_numpy(), table["row"].to_numpy(),
+                   None if not commit else commit.decode("utf-8"))
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.table({"key": pa.array(self.keys.to_numpy(), pa.uint64()), "row": pa.array(self.rows, pa.uint64())})
+        table = table.replace_schema_metadata({_COMMIT_KEY: "" if self.commit is None else str(self.commit)})
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        pq.write_table(table, tmp_path, compression="zstd")
+        tmp_path.replace(path)
+
+
+def index_path(fg, index_dir: str = DEFAULT_INDEX_DIR) -> Path:
+    return Path(index_dir) / f"{fg.name}_{fg.version}.parquet"
+
+
+def _index(fg, index_dir) -> HashIndex:
+    path = index_path(fg, index_dir)
+    with _lock:
+        if path not in _INDEXES:
+            _INDEXES[path] = HashIndex.load(path)
+        return _INDEXES[path]
+
+
+def _stored_hashes(fg, df: pd.DataFrame, primary_key: list):
+    """Hashes of the stored rows in the event time window of `df`; None if the feature group cannot be read."""
+    event_time = getattr(fg, "event_time", None)
+    columns = list(df.columns)
+    try:
+        query = fg.select(columns)
+        if event_time in df.columns:
+            times = _to_utc(df[event_time])
+            feature = fg.get_feature(event_time)
+            query = query.filter((feature >= times.min()) & (feature <= times.max()))
+        stored = query.read()
+    except Exception as e:
+        print(f"Could not read {fg.name}_{fg.version} to refresh its upsert index: {e}")
+        return None
+    if stored is None or stored.empty or not set(columns) <= set(stored.columns):
+        return np.array([], dtype="uint64"), np.array([], dtype="uint64")
+    return row_hashes(stored[columns], primary_key)
+
+
+def upsert(fg, df: pd.DataFrame, primary_key: list = None, batch_rows: int = BATCH_ROWS,
+           index_dir: str = DEFAULT_INDEX_DIR, **insert_kwargs) -> UpsertResult:
+    """
+    Inserts the rows of `df` that are new or changed in `fg` (in batches of
+    `batch_rows`, passing `insert_kwargs` to `fg.insert`) and skips the rest.
+    `primary_key` defaults to the primary key of the feature group.
+    """
+    name = f"{fg.name}_{fg.version}"
+    if df.empty:
+        return UpsertResult()
+    primary_key = list(primary_key or fg.primary_key)
+    missing = [c for c in primary_key if c not in df.columns]
+    if missing:
+        raise ValueError(f"Rows for {name} lack primary key columns {missing}")
+
+    with tracing.stage("upsert", kind="insert", rows_in=len(df), feature_group=name) as s:
+        df = df.drop_duplicates(subset=primary_key, keep="last").reset_index(drop=True)
+        keys, rows = row_hashes(df, primary_key)
+        index = _index(fg, index_dir)
+        with index.lock:
+            commit = latest_commit_id(fg)
+            commit = None if commit is None else str(commit)
+            if commit is None or commit != index.commit:
+                # Written outside this index (or never indexed here): refresh the keys of the incoming rows
+                stored = _stored_hashes(fg, df, primary_key)
+                index.drop(keys)
+                if stored is not None:
+                    stored_keys, stored_rows = stored
+                    in_df = np.isin(stored_keys, keys)
+                    index.update(stored_keys[in_df], stored_rows[in_df])
+                index.commit = commit
+
+            positions = index.lookup(keys)
+            new = positions < 0
+            changed = np.zeros(len(df), dtype=bool)
+            changed[~new] = index.rows[positions[~new]] != rows[~new]
+            result = UpsertResult(inserted=int(new.sum()), updated=int(changed.sum()),
+                                  skipped=int((~new & ~changed).sum()))
+            send = np.flatnonzero(new | changed)
+            try:
+                for start in range(0, len(send), batch_rows):
+                    batch = send[start:start + batch_rows]
+                    fg.insert(df.iloc[batch], **insert_kwargs)
+                    index.update(keys[batch], rows[batch])
+            finally:
+                if len(send):
+                    written = latest_commit_id(fg)
+                    index.commit = None if written is None else str(written)
+                index.save(index_path(fg, index_dir))
+        s.rows_out = result.written
+
+    print(f"{name}: {result.inserted} rows inserted, {result.updated} updated, {result.skipped} unchanged")
+    return result
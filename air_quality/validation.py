@@ -0,0 +1,159 @@
+"""Lightweight, vectorized data validation.
+
+Rules are declared per feature group in the city config, e.g.::
+
+    "validation": {
+        "air_quality": [
+            {"column": "pm2_5", "rule": "not_null"},
+            {"column": "pm2_5", "rule": "between", "min": 0.0, "max": 500.0, "strict_min": true}
+        ]
+    }
+
+`validate()` evaluates all rules with NumPy over the column arrays (each column
+is converted once) and reports per-rule failure counts with a sample of the
+offending rows. `to_expectation_suite()` exports the same rules in the Great
+Expectations suite format for the Hopsworks feature groups; Great Expectations
+is only imported there.
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from air_quality import tracing
+
+SAMPLE_ROWS = 5
+
+# Used when a city config has no "validation" section
+DEFAULT_RULES = {
+    "air_quality": [
+        {"column": "pm2_5", "rule": "not_null"},
+        {"column": "pm2_5", "rule": "between", "min": 0.0, "max": 500.0, "strict_min": True},
+    ],
+    "weather": [
+        {"column": "temperature_2m_max", "rule": "not_null"},
+        {"column": "temperature_2m_max", "rule": "between", "min": -60.0, "max": 60.0},
+    ],
+}
+
+_EXPECTATION_TYPES = {
+    "not_null": "expect_column_values_to_not_be_null",
+    "between": "expect_column_values_to_be_between",
+}
+
+
+@dataclass
+class RuleResult:
+    rule: dict
+    failed: int
+    sample: pd.DataFrame = field(repr=False)
+
+    @property
+    def success(self):
+        return self.failed == 0
+
+    def describe(self):
+        rule = self.rule
+        if rule["rule"] == "between":
+            return f"{rule['column']} between {rule.get('min')} and {rule.get('max')}"
+        return f"{rule['column']} {rule['rule']}"
+
+
+@dataclass
+class ValidationReport:
+    name: str
+    rows: int
+    results: list
+
+    @property
+    def success(self):
+        return all(r.success for r in self.results)
+
+    def raise_if_failed(self):
+        """Prints the outcome and raises ValueError if any rule failed."""
+        if self.success:
+            print(f"Validation passed for {self.name}")
+            return
+        print(f"Validation failed for {self.name}")
+        for res in self.results:
+            if not res.success:
+                print(f" - {res.describe()} failed for {res.failed}/{self.rows} rows, e.g.:")
+                print(res.sample.to_string())
+        raise ValueError(f"Validation failed for {self.name}. Check the data.")
+
+
+def rules_from_config(city_config: dict, group: str) -> list:
+    """Validation rules for feature group `group`, falling back to DEFAULT_RULES."""
+    return city_config.get("validation", DEFAULT_RULES).get(group, DEFAULT_RULES.get(group, []))
+
+
+def _failure_mask(values: np.ndarray, is_null: np.ndarray, rule: dict) -> np.ndarray:
+    kind = rule["rule"]
+    if kind == "not_null":
+        return is_null
+    if kind == "between":
+        # Like Great Expectations, missing values are left to the not_null rule
+        mask = np.zeros(len(values), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            if rule.get("min") is not None:
+                mask |= (values <= rule["min"]) if rule.get("strict_min") else (values < rule["min"])
+            if rule.get("max") is not None:
+                mask |= (values >= rule["max"]) if rule.get("strict_max") else (values > rule["max"])
+        return mask & ~is_null
+    raise ValueError(f"Unknown validation rule: {kind}")
+
+
+def validate(df: pd.DataFrame, rules: list, name="dataset", sample_rows=SAMPLE_ROWS) -> ValidationReport:
+    """Evaluates `rules` over `df` and returns a report with per-rule failure counts."""
+    # Each column is converted to a NumPy array (and null mask) once, however many rules use it
+    null_masks, values = {}, {}
+    results = []
+    for rule in rules:
+        column = rule["column"]
+        if column not in df.columns:
+            results.append(RuleResult(rule, len(df), df.head(0)))
+            continue
+        if column not in null_masks:
+            null_masks[column] = df[column].isna().to_numpy()
+        if rule["rule"] == "between" and column not in values:
+            values[column] = df[column].to_numpy(dtype="float64", na_value=np.nan)
+
+        failed = np.flatnonzero(_failure_mask(values.get(column), null_masks[column], rule))
+        results.append(RuleResult(rule, len(failed), df.iloc[failed[:sample_rows]]))
+    return ValidationReport(name, len(df), results)
+
+
+@tracing.traced(kind="validate")
+def validate_or_raise(df: pd.DataFrame, rules: list, name="dataset") -> ValidationReport:
+    report = validate(df, rules, name)
+    report.raise_if_failed()
+    return report
+
+
+def to_suite_dict(rules: list, suite_name: str) -> dict:
+    """The rules in the Great Expectations suite JSON format."""
+    expectations = []
+    for rule in rules:
+        kwargs = {"column": rule["column"]}
+        if rule["rule"] == "between":
+            kwargs.update({
+                "min_value": rule.get("min"),
+                "max_value": rule.get("max"),
+                "strict_min": rule.get("strict_min", False),
+                "strict_max": rule.get("strict_max", False),
+            })
+        expectations.append({"expectation_type": _EXPECTATION_TYPES[rule["rule"]], "kwargs": kwargs, "meta": {}})
+    return {"expectation_suite_name": suite_name, "expectations": expectations, "meta": {}}
+
+
+def to_expectation_suite(rules: list, suite_name: str):
+    """A great_expectations ExpectationSuite for `get_or_create_feature_group(expectation_suite=...)`."""
+    import great_expectations as ge
+
+    suite = ge.core.ExpectationSuite(expectation_suite_name=suite_name)
+    for expectation in to_suite_dict(rules, suite_name)["expectations"]:
+        suite.add_expectation(ge.core.ExpectationConfiguration(
+            expectation_type=expectation["expectation_type"],
+            kwargs=expectation["kwargs"],
+        ))
+    return suite
@@ -0,0 +1,183 @@
+"""
+Offline stand-ins for the external services, used by the benchmarks.
+
+- `ApiStandIn` is a local HTTP server answering Open-Meteo (archive, air
+  quality, forecast; JSON or FlatBuffers, like the real API) and WAQI (feed,
+  CSV export) requests with synthetic data, so the real request/parse code
+  paths run without network access.
+- `MemoryFeatureStore` keeps feature groups as DataFrames in process and
+  offers the same insert/read/filter/select surface as the local and Hopsworks
+  stores, so feature store I/O does not blur the compute timings.
+"""
+import contextlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import pyarrow as pa
+
+from air_quality import ingestion
+from air_quality.feature_store import Feature, Query
+
+import synthetic
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.requests += 1
+        if url.path.startswith("/waqi/"):
+            # /waqi/<lat>,<lon>.csv
+            latitude, longitude = map(float, url.path[len("/waqi/"):-len(".csv")].split(","))
+            start, end = params["start_date"], params["end_date"]
+            text = synthetic.waqi_csv(latitude, longitude, pd.date_range(start, end, freq="D"))
+            return self._send(text.encode("utf-8"), "text/csv")
+        if url.path.startswith("/feed/"):
+            # /feed/@<lat>,<lon>/
+            latitude, longitude = map(float, url.path.strip("/").split("/")[1].lstrip("@").split(","))
+            return self._send(json.dumps(synthetic.waqi_feed(latitude, longitude, params.get("day", "2025-10-31")))
+                              .encode("utf-8"), "application/json")
+
+        latitudes = [float(v) for v in params["latitude"].split(",")]
+        longitudes = [float(v) for v in params["longitude"].split(",")]
+        if url.path == "/v1/forecast":
+            start = pd.Timestamp(synthetic.END_DATE) + pd.Timedelta(days=1)
+            days = pd.date_range(start, periods=int(params.get("forecast_days", 7)), freq="D")
+        else:
+            days = pd.date_range(params["start_date"], params["end_date"], freq="D")
+        if "hourly" in params:
+            hours = pd.date_range(days[0], days[-1] + pd.Timedelta(hours=23), freq="h")
+            results = [synthetic.open_meteo_hourly(lat, lon, hours, params["hourly"].split(","))
+                       for lat, lon in zip(latitudes, longitudes)]
+        else:
+            results = [synthetic.open_meteo_daily(lat, lon, days, params["daily"].split(","))
+                       for lat, lon in zip(latitudes, longitudes)]
+        if params.get("format") == "flatbuffers":
+            offset = 3600 if "timezone" in params else 0
+            block = "hourly" if "hourly" in params else "daily"
+            return self._send(synthetic.open_meteo_flatbuffers(results, block, offset), "application/octet-stream")
+        body = results[0] if len(results) == 1 else results
+        self._send(json.dumps(body).encode("utf-8"), "application/json")
+
+
+class ApiStandIn:
+    """Serves synthetic Open-Meteo and WAQI responses on a free local port while in a `with` block."""
+
+    def __init__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.daemon_threads = True
+        self.server.requests = 0
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def url(self, path: str) -> str:
+        return self.base_url + path
+
+    @contextlib.contextmanager
+    def open_meteo(self):
+        """Points air_quality.ingestion at the stand-in instead of the Open-Meteo hosts."""
+        names = ("AIR_QUALITY_URL", "ARCHIVE_URL", "FORECAST_URL")
+        saved = {name: getattr(ingestion, name) for name in names}
+        for name in names:
+            setattr(ingestion, name, self.url(urlsplit(saved[name]).path))
+        try:
+            yield self
+        finally:
+            for name, value in saved.items():
+                setattr(ingestion, name, value)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MemoryFeatureGroup:
+    """A feature group held as one DataFrame; inserts upsert on the primary key."""
+
+    def __init__(self, name, version, primary_key, event_time=None, **kwargs):
+        self.name = name
+        self.version = version
+        self.primary_key = list(primary_key or [])
+        self.event_time = event_time
+        self._df = pd.DataFrame()
+        self._commits = 0
+
+    @property
+    def features(self):
+        return [Feature(c, str(t)) for c, t in self._df.dtypes.items()]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return Feature(name)
+
+    def insert(self, df: pd.DataFrame, write_options=None, wait=None, **kwargs):
+        df = df.copy()
+        if self.event_time:
+            df[self.event_time] = pd.to_datetime(df[self.event_time], utc=True)
+        df = pd.concat([self._df, df], ignore_index=True) if len(self._df) else df
+        if self.primary_key:
+            df = df.drop_duplicates(subset=self.primary_key, keep="last")
+        self._df = df.reset_index(drop=True)
+        self._commits += 1
+        return None, None
+
+    def commit_details(self, limit=None, **kwargs):
+        return {self._commits: {}} if self._commits else {}
+
+    def _read(self, columns=None, filter=None):
+        if filter is None:
+            df = self._df
+        else:
+            table = pa.Table.from_pandas(self._df, preserve_index=False)
+            df = table.filter(filter.to_expression(self.event_time)).to_pandas()
+        return (df[columns] if columns else df).reset_index(drop=True)
+
+    def read(self, **kwargs):
+        return self._read()
+
+    def filter(self, f):
+        return Query(self, None, f)
+
+    def select(self, features):
+        return Query(self, [getattr(f, "name", f) for f in features])
+
+    def select_all(self):
+        return Query(self)
+
+
+class MemoryFeatureStore:
+    def __init__(self):
+        self._groups = {}
+
+    def get_or_create_feature_group(self, name, version=1, primary_key=None, event_time=None, **kwargs):
+        key = (name, version)
+        if key not in self._groups:
+            self._groups[key] = MemoryFeatureGroup(name, version, primary_key, event_time, **kwargs)
+        return self._groups[key]
+
+    def get_feature_group(self, name, version=1):
+        return self._groups[(name, version)]
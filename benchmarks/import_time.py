@@ -0,0 +1,90 @@
+"""
+Import-time benchmark for util and the pipeline entry points.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter for each
+target, reports the cumulative import cost and the heaviest imported packages,
+and exits with status 1 if a target exceeds its budget.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 300 --top 5 util air_quality.features
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import budget per module in milliseconds
+BUDGETS_MS = {
+    "util": 50,
+    "air_quality.feature_store": 1500,
+    "air_quality.features": 1000,
+    "air_quality.ingestion": 1500,
+    "air_quality.validation": 1000,
+    "air_quality.http_client": 500,
+    "air_quality.tree_model": 1000,
+}
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)")
+
+
+def measure(module, python=sys.executable):
+    """Returns (total_ms, [(package, cumulative_ms), ...]) for importing `module` in a fresh interpreter."""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    # Nested imports are printed before their parent, so the direct children of the
+    # target are the lines one level deeper since the previous top-level import
+    total_us, children, packages = 0, [], []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        if len(indent) == 1:
+            if name == module:
+                total_us = int(cumulative)
+                packages += children
+            children = []
+        elif len(indent) == 3:
+            children.append((name, int(cumulative) / 1000))
+    return total_us / 1000, sorted(packages, key=lambda p: p[1], reverse=True)
+
+
+def main(args):
+    modules = args.modules or list(BUDGETS_MS)
+    failed = []
+    for module in modules:
+        budget = args.budget_ms if args.budget_ms is not None else BUDGETS_MS.get(module)
+        try:
+            total_ms, packages = measure(module)
+        except RuntimeError as e:
+            print(e)
+            failed.append(module)
+            continue
+        status = "ok" if budget is None or total_ms <= budget else "OVER BUDGET"
+        budget_str = f"{budget} ms" if budget is not None else "none"
+        print(f"{module:<30} {total_ms:8.1f} ms  (budget {budget_str})  {status}")
+        for name, ms in packages[:args.top]:
+            if name != module:
+                print(f"    {name:<26} {ms:8.1f} ms")
+        if status != "ok":
+            failed.append(module)
+
+    if failed:
+        print(f"Import budget exceeded or import failed for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("modules", nargs="*", help="Modules to measure (default: all modules with a budget)")
+    ap.add_argument("--budget-ms", type=float, help="Budget applied to every module instead of the defaults")
+    ap.add_argument("--top", type=int, default=5, help="Heaviest imported packages to show per module")
+    main(ap.parse_args())
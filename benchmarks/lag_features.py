@@ -0,0 +1,82 @@
+"""
+Parity check and benchmark of features.LagFeatureEngine against the
+full-recompute reference features.compute_lag_features.
+
+Synthetic PM2.5 histories get missing readings (single NaN days and a gap
+longer than the rolling window). The engine is built from the first part of the
+history, saved and loaded again, and then fed the remaining days one at a time
+like the daily pipeline does; its rows are compared with the reference by
+features.check_against_reference. Exits with status 1 on a mismatch.
+
+    python benchmarks/lag_features.py
+    python benchmarks/lag_features.py --sensors 100 --years 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from air_quality import features
+
+import synthetic
+
+NEW_DAYS = 30
+
+
+def history(n_sensors: int, years: int, missing: float, seed=0) -> pd.DataFrame:
+    start, end = synthetic.date_range(years)
+    days = pd.date_range(start, end, freq="D")
+    rng = np.random.default_rng(seed)
+    frames = []
+    for sensor in synthetic.city_config(n_sensors)["sensors"]:
+        values = synthetic.pm25(sensor["lat"], sensor["lon"], days)
+        values[rng.random(len(days)) < missing] = np.nan
+        # A gap longer than every rolling window, ending inside the new days
+        gap_end = len(days) - NEW_DAYS // 2
+        values[gap_end - max(features.ROLLING_WINDOWS) - 3:gap_end] = np.nan
+        frames.append(pd.DataFrame({"city": sensor["city"], "street": sensor["street"], "date": days, "pm2_5": values}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(args):
+    df = history(args.sensors, args.years, args.missing)
+    cutoff = df["date"].max() - pd.Timedelta(days=NEW_DAYS)
+    print(f"{args.sensors} sensors, {len(df)} rows, {int(df['pm2_5'].isna().sum())} missing readings")
+
+    start = time.perf_counter()
+    features.compute_lag_features(df)
+    recompute_seconds = time.perf_counter() - start
+
+    engine = features.LagFeatureEngine.from_history(df[df["date"] <= cutoff])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lag_state.json")
+        engine.save(path)
+        engine = features.LagFeatureEngine.load(path)
+
+    emitted, day_seconds = [], []
+    for _, day_df in df[df["date"] > cutoff].groupby("date"):
+        start = time.perf_counter()
+        emitted.append(engine.update(day_df))
+        day_seconds.append(time.perf_counter() - start)
+    print(f"full recompute {recompute_seconds:8.3f} s   incremental day {np.median(day_seconds):8.4f} s")
+
+    try:
+        features.check_against_reference(pd.concat(emitted, ignore_index=True), df)
+    except ValueError as e:
+        print(e)
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sensors", type=int, default=20)
+    ap.add_argument("--years", type=int, default=1)
+    ap.add_argument("--missing", type=float, default=0.05, help="Share of days without a reading")
+    sys.exit(0 if main(ap.parse_args()) else 1)
@@ -0,0 +1,99 @@
+"""
+Decode time and peak memory of Open-Meteo responses: JSON (as returned with
+the default format) against the binary FlatBuffers format decoded by
+air_quality.openmeteo, and a check that both give the same frame.
+
+For each sensor count and history length one multi-location hourly response
+(pm2_5 and the hourly weather variables) is generated in both formats and
+decoded into the long frame `ingestion.fetch_region_hourly` works on. The
+FlatBuffers messages list their variables in reverse order, so the check also
+covers matching variables by name.
+
+    python benchmarks/openmeteo.py
+    python benchmarks/openmeteo.py --sensors 10,100 --years 1,5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from air_quality import ingestion, openmeteo
+
+import synthetic
+
+VARIABLES = ingestion.HOURLY_AIR_QUALITY_VARIABLES + ingestion.HOURLY_WEATHER_VARIABLES
+UTC_OFFSET_SECONDS = 3600
+
+
+def responses(n_sensors: int, years: int):
+    start, end = synthetic.date_range(years)
+    hours = pd.date_range(start, end + pd.Timedelta(hours=23), freq="h")
+    sensors = synthetic.city_config(n_sensors)["sensors"]
+    results = [synthetic.open_meteo_hourly(s["lat"], s["lon"], hours, VARIABLES) for s in sensors]
+    json_body = json.dumps(results).encode("utf-8")
+    binary_body = synthetic.open_meteo_flatbuffers(results, "hourly", UTC_OFFSET_SECONDS)
+    return [s["id"] for s in sensors], json_body, binary_body
+
+
+def decode_json(body: bytes, sensor_ids):
+    df = ingestion._from_json(json.loads(body), "hourly", sensor_ids)
+    df["time"] = pd.to_datetime(df["time"])
+    return df
+
+
+def decode_binary(body: bytes, sensor_ids):
+    return openmeteo.decode(body, VARIABLES, "hourly", sensor_ids)
+
+
+def measured(fn, *args):
+    """(result, seconds, peak MiB) of one call; the time is taken without tracemalloc."""
+    start = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    result = fn(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def same_frame(expected, actual) -> bool:
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    if not (expected["sensor_id"].to_numpy() == actual["sensor_id"].to_numpy()).all():
+        return False
+    if not (expected["time"].to_numpy() == actual["time"].to_numpy()).all():
+        return False
+    values = expected[VARIABLES].to_numpy(dtype="float32")
+    return bool(np.array_equal(values, actual[VARIABLES].to_numpy(), equal_nan=True))
+
+
+def main(args):
+    ok = True
+    print(f"{'sensors':>7} {'years':>5} {'rows':>9} {'format':<11} {'MiB':>7} {'decode s':>9} {'peak MiB':>9}")
+    for n_sensors in (int(v) for v in args.sensors.split(",")):
+        for years in (int(v) for v in args.years.split(",")):
+            sensor_ids, json_body, binary_body = responses(n_sensors, years)
+            expected, json_seconds, json_peak = measured(decode_json, json_body, sensor_ids)
+            actual, binary_seconds, binary_peak = measured(decode_binary, binary_body, sensor_ids)
+            ok &= same_frame(expected, actual)
+            for name, body, seconds, peak in (("json", json_body, json_seconds, json_peak),
+                                              ("flatbuffers", binary_body, binary_seconds, binary_peak)):
+                print(f"{n_sensors:>7} {years:>5} {len(actual):>9} {name:<11} {len(body) / 2**20:>7.1f} "
+                      f"{seconds:>9.3f} {peak:>9.1f}")
+    print("Decoded frames match" if ok else "Decoded frames DIFFER")
+    return ok
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sensors", default="1,10,100", help="Comma separated sensor counts")
+    ap.add_argument("--years", default="1,3", help="Comma separated history lengths in years")
+    sys.exit(0 if main(ap.parse_args()) else 1)
@@ -0,0 +1,246 @@
+"""
+End-to-end pipeline benchmark on synthetic data, without Hopsworks or network access.
+
+For every (sensors, years) case of the scaling matrix, synthetic Open-Meteo and
+WAQI responses are served by a local HTTP stand-in and the feature groups live
+in an in-process store (benchmarks/fakes.py). Each stage runs the same code as
+the pipelines:
+
+    fetch        ingestion.fetch_region (air quality + archive weather)
+    fetch_hourly ingestion.fetch_region_hourly (hourly PM2.5 + weather, float32)
+    daily_aggregates hourly.daily_aggregates over all sensors
+    fetch_waqi   fetching.get_pm25, one WAQI feed request per sensor
+    csv_parse    csv_exports.read_exports, one WAQI export per sensor parsed in parallel
+    validate     validation.validate_or_raise on the air quality and weather rows
+    insert       feature group inserts
+    lags         features.compute_lag_features
+    training_set lagged + weather join and training.prepare_features
+    predict      XGBRegressor.predict and tree_model predict on the training set
+    plot         plot_air_quality_forecast for up to --max-charts sensors
+
+Results are written as JSON. With --baseline, the timings are compared with an
+earlier result file and the script exits with status 1 if a stage got slower
+than the tolerance allows.
+
+    python benchmarks/pipelines.py
+    python benchmarks/pipelines.py --sensors 1,10,50 --years 1,3 --out benchmarks/results/after.json \\
+        --baseline benchmarks/results/before.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+# Synthetic responses must not end up in the shared HTTP cache
+os.environ["HTTP_CACHE_DIR"] = ""
+
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+
+from air_quality import csv_exports, features, fetching, hourly, http_client, ingestion, plotting, training, tree_model, validation
+
+import synthetic
+from fakes import ApiStandIn, MemoryFeatureStore
+
+DEFAULT_OUT = os.path.join(ROOT, "benchmarks", "results", "pipelines.json")
+# Stages faster than this are not compared with the baseline (timer noise)
+NOISE_FLOOR_SECONDS = 0.01
+
+
+class _Timer:
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, name, rows_in=None):
+        timer = self
+
+        class _Stage:
+            rows_out = None
+
+            def __enter__(self):
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                seconds = time.perf_counter() - self.start
+                timer.stages[name] = {"seconds": seconds, "rows_in": rows_in, "rows_out": self.rows_out}
+
+        return _Stage()
+
+
+def run_case(standin: ApiStandIn, n_sensors: int, years: int, max_charts: int, workdir: str) -> dict:
+    config = synthetic.city_config(n_sensors)
+    start, end = (d.strftime("%Y-%m-%d") for d in synthetic.date_range(years))
+    locations = ingestion.sensor_locations(config)
+    session = http_client.HttpClient(cache_dir=None)
+    store = MemoryFeatureStore()
+    timer = _Timer()
+
+    with timer.stage("fetch") as s, standin.open_meteo():
+        region_df = ingestion.fetch_region(config, start, end, sources=("air_quality", "weather"), session=session)
+        s.rows_out = len(region_df)
+    weather_df = ingestion.split_sources(region_df)["weather"].drop(columns=["sensor_id"])
+
+    with timer.stage("fetch_hourly") as s, standin.open_meteo():
+        hourly_df = ingestion.fetch_region_hourly(config, start, end, session=session)
+        s.rows_out = len(hourly_df)
+    with timer.stage("daily_aggregates", rows_in=len(hourly_df)) as s:
+        s.rows_out = len(hourly.daily_aggregates(hourly_df))
+    del hourly_df
+
+    with timer.stage("fetch_waqi", rows_in=len(locations)) as s:
+        today_df = pd.concat([fetching.get_pm25(standin.url(f"/feed/@{row.latitude:.4f},{row.longitude:.4f}"),
+                                                row.country, row.city, row.street, end, "synthetic")
+                              for row in locations.itertuples()], ignore_index=True)
+        s.rows_out = len(today_df)
+
+    csv_paths = []
+    for row in locations.itertuples():
+        path = os.path.join(workdir, f"{row.sensor_id}.csv")
+        response = session.get(standin.url(f"/waqi/{row.latitude:.4f},{row.longitude:.4f}.csv"),
+                               params={"start_date": start, "end_date": end})
+        with open(path, "wb") as f:
+            f.write(response.content)
+        csv_paths.append((path, {"country": row.country, "city": row.city, "street": row.street}))
+    with timer.stage("csv_parse") as s:
+        aq_df = csv_exports.read_exports(csv_paths)
+        s.rows_out = len(aq_df)
+
+    with timer.stage("validate", rows_in=len(aq_df) + len(weather_df)) as s:
+        validation.validate_or_raise(aq_df, validation.DEFAULT_RULES["air_quality"], name="air quality")
+        validation.validate_or_raise(weather_df, validation.DEFAULT_RULES["weather"], name="weather")
+        s.rows_out = len(aq_df) + len(weather_df)
+
+    keys = ["city", "street", "date"]
+    with timer.stage("insert", rows_in=len(aq_df) + len(weather_df)):
+        aq_fg = store.get_or_create_feature_group("air_quality", 1, primary_key=keys, event_time="date")
+        weather_fg = store.get_or_create_feature_group("weather", 1, primary_key=keys, event_time="date")
+        aq_fg.insert(aq_df)
+        weather_fg.insert(weather_df)
+
+    with timer.stage("lags", rows_in=len(aq_df)) as s:
+        lagged_df = features.compute_lag_features(aq_fg.read())
+        lagged_fg = store.get_or_create_feature_group("air_quality_lagged", 1, primary_key=keys, event_time="date")
+        lagged_fg.insert(lagged_df)
+        s.rows_out = len(lagged_df)
+
+    with timer.stage("training_set") as s:
+        lagged = lagged_fg.select([training.LABEL] + training.LAG_COLUMNS + keys).read()
+        joined = lagged.merge(weather_fg.read().drop(columns=["country"]), on=keys, how="inner")
+        X = training.prepare_features(joined.drop(columns=[training.LABEL]))
+        y = joined.loc[X.index, training.LABEL]
+        s.rows_out = len(X)
+
+    # A fixed-size model, trained outside the timed stages, so predict cost only follows the rows
+    model = XGBRegressor(n_estimators=100, max_depth=5, random_state=42).fit(X, y)
+    model_path = os.path.join(workdir, "model.json")
+    model.save_model(model_path)
+    compiled = tree_model.load_model(model_path)
+    with timer.stage("predict_xgboost", rows_in=len(X)) as s:
+        s.rows_out = len(model.predict(X))
+    with timer.stage("predict_numpy", rows_in=len(X)) as s:
+        s.rows_out = len(compiled.predict(X))
+
+    charts = locations.head(max_charts)
+    with timer.stage("plot", rows_in=len(charts)) as s:
+        for row in charts.itertuples():
+            sensor_df = joined[(joined["city"] == row.city) & (joined["street"] == row.street)].tail(7).copy()
+            sensor_df["predicted_pm25"] = sensor_df[training.LABEL]
+            plotting.plot_air_quality_forecast(row.city, row.street, sensor_df,
+                                               os.path.join(workdir, f"{row.sensor_id}.png"))
+        s.rows_out = len(charts)
+
+    return timer.stages
+
+
+def run_matrix(sensor_counts, year_counts, repeat=1, max_charts=10) -> list:
+    results = []
+    with ApiStandIn() as standin:
+        for n_sensors in sensor_counts:
+            for years in year_counts:
+                best = {}
+                for _ in range(repeat):
+                    with tempfile.TemporaryDirectory() as workdir:
+                        stages = run_case(standin, n_sensors, years, max_charts, workdir)
+                    for name, record in stages.items():
+                        if name not in best or record["seconds"] < best[name]["seconds"]:
+                            best[name] = record
+                for name, record in best.items():
+                    results.append({"stage": name, "sensors": n_sensors, "years": years, **record})
+                    print(f"sensors={n_sensors:<4} years={years:<2} {name:<16} {record['seconds'] * 1000:10.1f} ms"
+                          f"   rows in={record['rows_in']} out={record['rows_out']}")
+        print(f"{standin.requests} requests served by the API stand-in")
+    return results
+
+
+def _git_commit():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def compare(results: list, baseline: list, tolerance: float) -> bool:
+    """Prints the change of every stage against the baseline; False if one is slower than the tolerance."""
+    previous = {(r["stage"], r["sensors"], r["years"]): r["seconds"] for r in baseline}
+    ok = True
+    print()
+    for r in results:
+        before = previous.get((r["stage"], r["sensors"], r["years"]))
+        if before is None:
+            continue
+        ratio = r["seconds"] / before if before else float("inf")
+        slower = ratio > 1.0 + tolerance and r["seconds"] > NOISE_FLOOR_SECONDS
+        ok &= not slower
+        print(f"sensors={r['sensors']:<4} years={r['years']:<2} {r['stage']:<16} "
+              f"{before * 1000:10.1f} ms -> {r['seconds'] * 1000:10.1f} ms  {ratio:5.2f}x"
+              f"{'  SLOWER' if slower else ''}")
+    return ok
+
+
+def main(args):
+    sensor_counts = [int(v) for v in args.sensors.split(",")]
+    year_counts = [int(v) for v in args.years.split(",")]
+    results = run_matrix(sensor_counts, year_counts, args.repeat, args.max_charts)
+
+    output = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sensors", default="1,10", help="Comma separated sensor counts")
+    ap.add_argument("--years", default="1,3", help="Comma separated years of history")
+    ap.add_argument("--repeat", type=int, default=1, help="Runs per case, the fastest run of each stage is kept")
+    ap.add_argument("--max-charts", type=int, default=10, help="Charts drawn per case")
+    ap.add_argument("--out", default=DEFAULT_OUT)
+    ap.add_argument("--baseline", help="Earlier result file to compare with")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Relative slowdown allowed per stage")
+    main(ap.parse_args())
@@ -0,0 +1,76 @@
+"""
+Memory, Parquet size and lag-feature time of multi-sensor histories with and
+without air_quality.schema (categorical location keys, float32 measurements).
+
+The frames are built the way the pipelines build them: one row per sensor and
+day with country, city, street and url repeated on every row, pm2_5 and the
+daily weather next to them.
+
+    python benchmarks/schema.py
+    python benchmarks/schema.py --sensors 10,100,500 --years 3 --repeat 5
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from air_quality import features, schema
+
+import synthetic
+
+
+def history(n_sensors: int, years: int) -> pd.DataFrame:
+    """Air quality and weather rows as the ingestion returns them (object strings, float64)."""
+    days = pd.date_range(*synthetic.date_range(years), freq="D")
+    frames = []
+    for sensor in synthetic.city_config(n_sensors)["sensors"]:
+        lat, lon = sensor["lat"], sensor["lon"]
+        df = pd.DataFrame(synthetic.daily_weather(lat, lon, days), dtype="float64")
+        df.insert(0, "pm2_5", synthetic.pm25(lat, lon, days + pd.Timedelta(hours=12)))
+        df.insert(0, "date", days)
+        df.insert(0, "url", f"https://api.waqi.info/feed/@{lat:.4f},{lon:.4f}")
+        df.insert(0, "street", sensor["street"])
+        df.insert(0, "city", sensor["city"])
+        df.insert(0, "country", "Sweden")
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True)
+
+
+def parquet_bytes(df: pd.DataFrame) -> int:
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, compression="zstd", index=False)
+    return buffer.tell()
+
+
+def best_time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(args):
+    print(f"{'sensors':>7} {'years':>5} {'layout':<8} {'memory MB':>10} {'parquet MB':>11} {'lags ms':>9}")
+    for n_sensors in (int(v) for v in args.sensors.split(",")):
+        plain = history(n_sensors, args.years)
+        compact = schema.apply(plain)
+        for layout, df in (("object", plain), ("schema", compact)):
+            memory = df.memory_usage(deep=True).sum() / 1e6
+            size = parquet_bytes(df) / 1e6
+            seconds = best_time(lambda: features.compute_lag_features(df), args.repeat)
+            print(f"{n_sensors:>7} {args.years:>5} {layout:<8} {memory:>10.2f} {size:>11.2f} {seconds * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sensors", default="10,100,500", help="Comma separated sensor counts")
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=3, help="Runs of the lag computation, the fastest is reported")
+    main(ap.parse_args())
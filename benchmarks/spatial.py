@@ -0,0 +1,78 @@
+"""
+Build time of air_quality.spatial forecast grids, and a check of the KD-tree
+IDW weights against a brute-force interpolation over all sensors.
+
+For each grid size the weights are built cold (KD-tree query), loaded from the
+on-disk cache and from memory, and a 7 day forecast of all sensors is
+interpolated with them.
+
+    python benchmarks/spatial.py
+    python benchmarks/spatial.py --sensors 50 --cells 100x100,200x250,400x400 --days 7
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from air_quality import spatial
+
+import synthetic
+
+
+def brute_force(locations, grid, values, neighbours, power, max_cells=2000):
+    """IDW of the first `max_cells` cells from the distances to every sensor."""
+    lat0 = float(grid.lat.mean())
+    cells = spatial._project(*grid.cells(), lat0)[:max_cells]
+    points = spatial._project(locations["latitude"].to_numpy(), locations["longitude"].to_numpy(), lat0)
+    distances = np.sqrt(((cells[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    nearest = np.argsort(distances, axis=1)[:, :neighbours]
+    weights = 1.0 / np.maximum(np.take_along_axis(distances, nearest, axis=1), spatial.MIN_DISTANCE_KM) ** power
+    return (values[:, nearest] * weights).sum(axis=2) / weights.sum(axis=1)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(args):
+    config = synthetic.city_config(args.sensors)
+    locations = spatial.sensor_locations(config)
+    values = np.random.default_rng(0).gamma(2.0, 5.0, size=(args.days, len(locations))).astype("float32")
+
+    ok = True
+    print(f"{'grid':>9} {'cells':>8} {'build ms':>9} {'disk ms':>8} {'memory ms':>10} {'interp ms':>10} {'max diff':>9}")
+    for size in args.cells.split(","):
+        rows, cols = (int(v) for v in size.split("x"))
+        grid = spatial.grid_from_config({**config, "grid": {"rows": rows, "cols": cols}}, locations)
+        with tempfile.TemporaryDirectory() as weights_dir:
+            spatial._WEIGHTS.clear()
+            weights, build = timed(lambda: spatial.load_weights(locations, grid, args.neighbours, args.power, weights_dir))
+            spatial._WEIGHTS.clear()
+            _, disk = timed(lambda: spatial.load_weights(locations, grid, args.neighbours, args.power, weights_dir))
+            _, memory = timed(lambda: spatial.load_weights(locations, grid, args.neighbours, args.power, weights_dir))
+        grids, interp = timed(lambda: spatial.interpolate(weights, values))
+
+        expected = brute_force(locations, grid, values, args.neighbours, args.power)
+        actual = grids.reshape(args.days, -1)[:, :expected.shape[1]]
+        max_diff = float(np.max(np.abs(actual - expected) / np.maximum(np.abs(expected), 1.0)))
+        ok &= max_diff < 1e-4
+        print(f"{size:>9} {rows * cols:>8} {build * 1000:>9.1f} {disk * 1000:>8.1f} {memory * 1000:>10.2f} "
+              f"{interp * 1000:>10.1f} {max_diff:>9.1e}")
+    return ok
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sensors", type=int, default=50)
+    ap.add_argument("--cells", default="100x100,200x250,400x400", help="Comma separated grid sizes (rows x cols)")
+    ap.add_argument("--days", type=int, default=7)
+    ap.add_argument("--neighbours", type=int, default=spatial.NEIGHBOURS)
+    ap.add_argument("--power", type=float, default=spatial.POWER)
+    sys.exit(0 if main(ap.parse_args()) else 1)
@@ -0,0 +1,158 @@
+"""
+Synthetic sensors and API responses for the benchmarks.
+
+Every value is derived from the sensor coordinates and the date, so the same
+request always gets the same response and N sensors x Y years of data can be
+generated without network access.
+"""
+import numpy as np
+import pandas as pd
+
+BASE_LAT, BASE_LON = 57.70, 11.97
+END_DATE = "2025-10-31"
+
+
+def date_range(years: int, end_date: str = END_DATE):
+    end = pd.Timestamp(end_date)
+    return end - pd.DateOffset(years=years) + pd.Timedelta(days=1), end
+
+
+def city_config(n_sensors: int) -> dict:
+    """A region config with `n_sensors` sensors on a grid around Gothenburg."""
+    side = int(np.ceil(np.sqrt(n_sensors)))
+    sensors = []
+    for i in range(n_sensors):
+        sensors.append({
+            "id": f"SENSOR_{i}",
+            "display_name": f"Sensor {i}",
+            "city": f"City {i // 10}",
+            "street": f"Street {i}",
+            "lat": round(BASE_LAT + 0.01 * (i // side), 4),
+            "lon": round(BASE_LON + 0.01 * (i % side), 4),
+        })
+    return {"country_name": "Sweden", "region_name": "Synthetic", "sensors": sensors, "forecast_days": 7}
+
+
+def _rng(latitude, longitude, salt):
+    return np.random.default_rng([int(round(latitude * 1e4)), int(round(longitude * 1e4)), salt])
+
+
+def _day_of_year(times: pd.DatetimeIndex):
+    return times.dayofyear.to_numpy() + times.hour.to_numpy() / 24.0
+
+
+def pm25(latitude, longitude, times: pd.DatetimeIndex) -> np.ndarray:
+    """Seasonal PM2.5 (higher in winter) with noise, always inside the validation range (0, 500]."""
+    rng = _rng(latitude, longitude, 1)
+    season = 12.0 + 8.0 * np.cos(2 * np.pi * _day_of_year(times) / 365.25)
+    return np.clip(season + rng.gamma(2.0, 3.0, len(times)), 0.5, 500.0).round(1)
+
+
+def daily_weather(latitude, longitude, days: pd.DatetimeIndex) -> dict:
+    rng = _rng(latitude, longitude, 2)
+    n = len(days)
+    season = np.cos(2 * np.pi * (_day_of_year(days) - 200) / 365.25)
+    wind = np.abs(rng.normal(15.0, 6.0, n))
+    return {
+        "wind_speed_10m_max": wind.round(1).tolist(),
+        "wind_gusts_10m_max": (wind * rng.uniform(1.3, 2.0, n)).round(1).tolist(),
+        "wind_direction_10m_dominant": rng.integers(0, 360, n).tolist(),
+        "temperature_2m_max": (10.0 + 10.0 * season + rng.normal(0.0, 3.0, n)).round(1).tolist(),
+    }
+
+
+def open_meteo_daily(latitude, longitude, days: pd.DatetimeIndex, variables) -> dict:
+    weather = daily_weather(latitude, longitude, days)
+    daily = {"time": days.strftime("%Y-%m-%d").tolist()}
+    daily.update({v: weather[v] for v in variables if v in weather})
+    return {"latitude": latitude, "longitude": longitude, "daily": daily}
+
+
+def hourly_weather(latitude, longitude, hours: pd.DatetimeIndex) -> dict:
+    rng = _rng(latitude, longitude, 4)
+    n = len(hours)
+    season = np.cos(2 * np.pi * (_day_of_year(hours) - 200) / 365.25)
+    daily_cycle = np.cos(2 * np.pi * (hours.hour.to_numpy() - 15) / 24.0)
+    wind = np.abs(rng.normal(12.0, 5.0, n))
+    return {
+        "temperature_2m": (8.0 + 10.0 * season + 4.0 * daily_cycle + rng.normal(0.0, 1.5, n)).round(1).tolist(),
+        "precipitation": np.where(rng.random(n) < 0.1, rng.gamma(1.0, 1.5, n), 0.0).round(1).tolist(),
+        "wind_speed_10m": wind.round(1).tolist(),
+        "wind_gusts_10m": (wind * rng.uniform(1.3, 2.0, n)).round(1).tolist(),
+        "wind_direction_10m": rng.integers(0, 360, n).tolist(),
+    }
+
+
+def open_meteo_hourly(latitude, longitude, hours: pd.DatetimeIndex, variables) -> dict:
+    hourly = {"time": hours.strftime("%Y-%m-%dT%H:%M").tolist()}
+    if "pm2_5" in variables:
+        hourly["pm2_5"] = pm25(latitude, longitude, hours).tolist()
+    weather = [v for v in variables if v != "pm2_5"]
+    if weather:
+        values = hourly_weather(latitude, longitude, hours)
+        hourly.update({v: values[v] for v in weather if v in values})
+    return {"latitude": latitude, "longitude": longitude, "hourly": hourly}
+
+
+def waqi_csv(latitude, longitude, days: pd.DatetimeIndex, missing: float = 0.02) -> str:
+    """A WAQI historical export: padded columns, newest day first and empty fields for missing values."""
+    rng = _rng(latitude, longitude, 3)
+    values = pm25(latitude, longitude, days + pd.Timedelta(hours=12)).round().astype(int).astype(str)
+    values[rng.random(len(days)) < missing] = ""
+    pm10 = rng.integers(1, 40, len(days))
+    lines = ["date, pm25, pm10, o3, no2"]
+    for day, value, p in zip(days[::-1], values[::-1], pm10[::-1]):
+        lines.append(f"{day.year}/{day.month}/{day.day}, {value}, {p}, , {p // 4}")
+    return "\n".join(lines) + "\n"
+
+
+def waqi_feed(latitude, longitude, day) -> dict:
+    value = float(pm25(latitude, longitude, pd.DatetimeIndex([pd.Timestamp(day) + pd.Timedelta(hours=12)]))[0])
+    return {"status": "ok", "data": {"iaqi": {"pm2_5": {"v": value}}, "time": {"s": str(day)}}}
+
+
+
+def open_meteo_flatbuffers(results: list, block: str, utc_offset_seconds: int = 0) -> bytes:
+    """
+    The binary (format=flatbuffers) version of Open-Meteo JSON `results`: one
+    size-prefixed WeatherApiResponse per location, with the variables in
+    reverse order so decoding cannot rely on their position.
+    """
+    import flatbuffers
+    from air_quality.openmeteo import VariableSpec
+
+    messages = []
+    for result in results:
+        data = result[block]
+        times = pd.to_datetime(data["time"])
+        interval = 86400 if block == "daily" else 3600
+        start = int(times[0].timestamp()) - utc_offset_seconds
+        builder = flatbuffers.Builder(1024)
+        variables = []
+        for name in reversed([name for name in data if name != "time"]):
+            spec = VariableSpec.parse(name)
+            values = builder.CreateNumpyVector(np.asarray(data[name], dtype="float32"))
+            builder.StartObject(13)    # VariableWithValues
+            builder.PrependUOffsetTRelativeSlot(3, values, 0)
+            builder.PrependInt16Slot(5, spec.altitude, 0)
+            builder.PrependUint8Slot(0, spec.variable, 0)
+            builder.PrependUint8Slot(6, spec.aggregation, 0)
+            variables.append(builder.EndObject())
+        builder.StartVector(4, len(variables), 4)
+        for variable in reversed(variables):
+            builder.PrependUOffsetTRelative(variable)
+        vector = builder.EndVector()
+        builder.StartObject(4)    # VariablesWithTime
+        builder.PrependInt64Slot(0, start, 0)
+        builder.PrependInt64Slot(1, start + len(times) * interval, 0)
+        builder.PrependInt32Slot(2, interval, 0)
+        builder.PrependUOffsetTRelativeSlot(3, vector, 0)
+        series = builder.EndObject()
+        builder.StartObject(15)    # WeatherApiResponse
+        builder.PrependFloat32Slot(0, result["latitude"], 0.0)
+        builder.PrependFloat32Slot(1, result["longitude"], 0.0)
+        builder.PrependInt32Slot(6, utc_offset_seconds, 0)
+        builder.PrependUOffsetTRelativeSlot(10 if block == "daily" else 11, series, 0)
+        builder.FinishSizePrefixed(builder.EndObject())
+        messages.append(bytes(builder.Output()))
+    return b"".join(messages)
@@ -0,0 +1,117 @@
+"""
+Parity check and latency benchmark of air_quality.tree_model against XGBRegressor.
+
+The parity check compares predictions on random inputs (with missing values) for
+the committed air_quality_model/model.json and for freshly trained models with
+other objectives, for the NumPy evaluator and for `predict` with its choice by
+batch size, and exits with status 1 on a mismatch. The benchmark reports the
+latency of XGBRegressor.predict, both evaluators and `predict` for a range of
+batch sizes, and the batch size from which the xgboost booster is faster than
+the NumPy evaluator (what tree_model.XGBOOST_MIN_ROWS is set from).
+
+    python benchmarks/tree_model.py
+    python benchmarks/tree_model.py --model air_quality_model/model.json --rows 1000 --repeat 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from xgboost import XGBClassifier, XGBRegressor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from air_quality import tree_model
+
+DEFAULT_MODEL = os.path.join(ROOT, "air_quality_model", "model.json")
+
+
+def random_inputs(n_rows, n_features, missing=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(10.0, 8.0, size=(n_rows, n_features)).astype(np.float32)
+    X[rng.random(X.shape) < missing] = np.nan
+    return X
+
+
+def check_parity(xgb_model, compiled, X, name, rtol=1e-5, atol=1e-4):
+    expected = xgb_model.predict(X) if not hasattr(xgb_model, "predict_proba") else xgb_model.predict_proba(X)[:, 1]
+    ok = True
+    for evaluator in ("numpy", None):
+        actual = compiled.predict(X, evaluator=evaluator)
+        matches = np.allclose(actual, expected, rtol=rtol, atol=atol)
+        max_diff = float(np.max(np.abs(actual - expected)))
+        print(f"parity {name:<34} {evaluator or 'predict':<8} rows={len(X):<6} max abs diff={max_diff:.2e}  "
+              f"{'ok' if matches else 'MISMATCH'}")
+        ok &= matches
+    return ok
+
+
+def trained_models(n_features, seed=0):
+    """Small models with other objectives and missing values in training, to cover the default branches."""
+    X = random_inputs(2000, n_features, missing=0.1, seed=seed)
+    y = np.nan_to_num(X[:, 0]) * 0.5 + np.nan_to_num(X[:, 1]) ** 2 / 20.0
+    yield "reg:squarederror (trained)", XGBRegressor(n_estimators=50, max_depth=6).fit(X, y)
+    yield "count:poisson (trained)", XGBRegressor(n_estimators=50, objective="count:poisson").fit(X, np.abs(y))
+    yield "binary:logistic (trained)", XGBClassifier(n_estimators=50).fit(X, (y > np.median(y)).astype(int))
+
+
+def compile_fitted(model):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.json")
+        model.save_model(path)
+        compiled = tree_model.load_model(path)
+        compiled.booster()    # before the file is removed
+        return compiled
+
+
+def best_time(fn, repeat):
+    """Best of `repeat` runs in microseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1e6
+
+
+def main(args):
+    xgb_model = XGBRegressor()
+    xgb_model.load_model(args.model)
+    compiled = tree_model.load_model(args.model)
+    n_features = len(compiled.feature_names or []) or xgb_model.n_features_in_
+    print(f"{args.model}: {compiled.n_trees} trees, depth {compiled.depth}, {n_features} features")
+
+    ok = True
+    for n_rows in (1, 7, tree_model.XGBOOST_MIN_ROWS, args.rows):
+        ok &= check_parity(xgb_model, compiled, random_inputs(n_rows, n_features, seed=n_rows), "model.json")
+    for name, model in trained_models(n_features):
+        ok &= check_parity(model, compile_fitted(model), random_inputs(args.rows, n_features, seed=1), name)
+
+    print()
+    # The forecast predicts one row per sensor and step, the hindcast a window of days per sensor
+    crossover = None
+    for n_rows in sorted({1, 7, 16, 32, 64, 100, args.rows}):
+        X = random_inputs(n_rows, n_features, seed=2)
+        xgb_us = best_time(lambda: xgb_model.predict(X), args.repeat)
+        numpy_us = best_time(lambda: compiled.predict(X, evaluator="numpy"), args.repeat)
+        booster_us = best_time(lambda: compiled.predict(X, evaluator="xgboost"), args.repeat)
+        predict_us = best_time(lambda: compiled.predict(X), args.repeat)
+        if crossover is None and numpy_us > booster_us:
+            crossover = n_rows
+        print(f"latency rows={n_rows:<6} XGBRegressor {xgb_us:8.1f} us   numpy {numpy_us:8.1f} us   "
+              f"booster {booster_us:8.1f} us   predict {predict_us:8.1f} us   speedup {xgb_us / predict_us:4.1f}x")
+    print(f"The booster is faster from {crossover or 'more than ' + str(args.rows)} rows, "
+          f"predict switches at tree_model.XGBOOST_MIN_ROWS={tree_model.XGBOOST_MIN_ROWS}")
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=DEFAULT_MODEL)
+    ap.add_argument("--rows", type=int, default=1000, help="Batch size for the batch cases")
+    ap.add_argument("--repeat", type=int, default=100)
+    main(ap.parse_args())
@@ -0,0 +1,73 @@
+"""
+Rows written and time of daily feature group writes with and without
+air_quality.upserts, on the local feature store.
+
+For each sensor count an air_quality history is inserted once, then a "daily
+run" is repeated with the full history plus one new day: with plain
+`fg.insert` every run rewrites everything, with `upserts.upsert` only the new
+day is written. A re-run of the same day writes nothing.
+
+    python benchmarks/upserts.py
+    python benchmarks/upserts.py --sensors 10,100 --years 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from air_quality import feature_store, schema, upserts
+
+import synthetic
+
+KEYS = ["city", "street", "date"]
+
+
+def history(n_sensors: int, start, end) -> pd.DataFrame:
+    days = pd.date_range(start, end, freq="D")
+    frames = []
+    for sensor in synthetic.city_config(n_sensors)["sensors"]:
+        frames.append(pd.DataFrame({
+            "country": "Sweden", "city": sensor["city"], "street": sensor["street"], "date": days,
+            "pm2_5": synthetic.pm25(sensor["lat"], sensor["lon"], days + pd.Timedelta(hours=12)),
+        }))
+    return schema.apply(pd.concat(frames, ignore_index=True), "air_quality")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main(args):
+    start, end = synthetic.date_range(args.years)
+    print(f"{'sensors':>7} {'rows':>8} {'write':<16} {'rows written':>12} {'seconds':>8}")
+    for n_sensors in (int(v) for v in args.sensors.split(",")):
+        base = history(n_sensors, start, end)
+        daily = pd.concat([base, history(n_sensors, end + pd.Timedelta(days=1), end + pd.Timedelta(days=1))],
+                          ignore_index=True)
+        for mode in ("insert", "upsert"):
+            with tempfile.TemporaryDirectory() as tmp:
+                store = feature_store.LocalFeatureStore(os.path.join(tmp, "store"))
+                fg = store.get_or_create_feature_group("air_quality", 1, primary_key=KEYS, event_time="date")
+                index_dir = os.path.join(tmp, "index")
+                upserts.upsert(fg, base, index_dir=index_dir)
+                for run in ("daily", "re-run"):
+                    if mode == "insert":
+                        written, seconds = timed(lambda: (fg.insert(daily), len(daily))[1])
+                    else:
+                        result, seconds = timed(lambda: upserts.upsert(fg, daily, index_dir=index_dir))
+                        written = result.written
+                    print(f"{n_sensors:>7} {len(daily):>8} {mode + ' ' + run:<16} {written:>12} {seconds:>8.3f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sensors", default="10,100", help="Comma separated sensor counts")
+    ap.add_argument("--years", type=int, default=3)
+    main(ap.parse_args())
@@ -1,8 +1,10 @@
 import os
 import json
 import argparse
+import sys
 import pandas as pd
-import matplotlib.pyplot as plt
+sys.path.append(".")
+from air_quality import plotting
 
 def load_city_config(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -20,19 +22,18 @@ def main(args):
     df = pd.read_csv(pred_path, parse_dates=["date"])
     sensors = sorted(df["sensor_id"].dropna().unique().tolist())
 
-    for sid in sensors:
-        sub = df[df["sensor_id"] == sid].sort_values("date")
-        plt.figure()
-        plt.plot(sub["date"], sub["pm2_5_pred"], label="Predicted PM2.5")
-        if "pm2_5" in sub.columns and not sub["pm2_5"].isna().all():
-            plt.scatter(sub["date"], sub["pm2_5"], s=12, label="Observed PM2.5")
-        plt.title(f"{city} — PM2.5 Forecast & Hindcast (Sensor {sid})")
-        plt.xlabel("Date")
-        plt.ylabel("PM2.5 (µg/m³)")
-        plt.legend()
-        out_png = os.path.join(args.out_dir, f"pm25_{sid}.png")
-        plt.savefig(out_png, bbox_inches="tight", dpi=160)
-        plt.close()
+    # One chart per sensor, rendered in a process pool; charts whose data did not change are skipped
+    jobs = []
+    for sid, sub in df.groupby("sensor_id", sort=True, observed=True):
+        sub = sub.sort_values("date").rename(columns={"pm2_5_pred": "predicted_pm25"})
+        jobs.append({
+            "city": city,
+            "street": f"Sensor {sid}",
+            "df": sub,
+            "file_path": os.path.join(args.out_dir, f"pm25_{sid}.png"),
+            "hindcast": "pm2_5" in sub.columns and not sub["pm2_5"].isna().all(),
+        })
+    plotting.render_many(jobs, max_workers=args.workers)
 
     # Minimal HTML without inline CSS braces to avoid tooling issues
     with open(os.path.join(args.out_dir, "index.html"), "w", encoding="utf-8") as f:
@@ -47,5 +48,6 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--city-config", required=True)
     ap.add_argument("--out-dir", required=True)
+    ap.add_argument("--workers", type=int, default=None, help="Rendering processes (default: one per CPU)")
     args = ap.parse_args()
     main(args)
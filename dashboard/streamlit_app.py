@@ -1,16 +1,13 @@
 import streamlit as st
 import pandas as pd
-import hopsworks
 import json
 import os
-from xgboost import XGBRegressor
-import matplotlib.pyplot as plt
 from pathlib import Path
 import datetime
 import pytz
 import sys
 sys.path.append(".")
-import util
+from air_quality import dashboard_data, feature_store, plotting, tree_model
 
 berlin_tz = pytz.timezone("Europe/Berlin")
 today = pd.Timestamp(datetime.datetime.now().date(), tz=berlin_tz)
@@ -20,20 +17,17 @@ st.title("Air Quality Forecast Dashboard")
 
 HOPSWORKS_API_KEY = os.getenv("HOPSWORKS_API_KEY")
 HOPSWORKS_PROJECT = os.getenv("HOPSWORKS_PROJECT")
+FEATURE_STORE_BACKEND = os.getenv("FEATURE_STORE_BACKEND", "hopsworks")
 
 @st.cache_resource
 def get_hopsworks_project(api_key, project_name):
+    import hopsworks    # only needed (and only paid for) when not running against the local feature store
     return hopsworks.login(project=project_name, api_key_value=api_key)
 
 @st.cache_resource
-def load_model(model_dir):
-    xgb_model = XGBRegressor()
-    xgb_model.load_model(model_dir)
-    return xgb_model
-
-project = get_hopsworks_project(HOPSWORKS_API_KEY, HOPSWORKS_PROJECT)
-fs = project.get_feature_store()
-mr = project.get_model_registry()
+def load_model(model_path):
+    # Compiled NumPy evaluator of model.json, the dashboard does not need the xgboost runtime
+    return tree_model.load_model(model_path)
 
 # Load city configuration
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # directory of this script
@@ -49,9 +43,15 @@ FG_VERSIONS = city_config["fg_versions"]
 model_name = city_config["model_registry"]["name"]
 model_version = city_config["model_registry"]["version"]
 
-# Load model
-retrieved_model = mr.get_model(name=model_name, version=model_version)
-saved_model_dir = retrieved_model.download()
+# Load feature store and model (the local backend runs offline against the committed model)
+if FEATURE_STORE_BACKEND == "local":
+    fs = feature_store.get_feature_store("local")
+    saved_model_dir = os.path.join(BASE_DIR, "../air_quality_model")
+else:
+    project = get_hopsworks_project(HOPSWORKS_API_KEY, HOPSWORKS_PROJECT)
+    fs = feature_store.get_feature_store("hopsworks", project=project)
+    # Downloaded once and reused across reruns (see air_quality/dashboard_data.py)
+    saved_model_dir = dashboard_data.model_dir(project, model_name, model_version)
 
 xgb_model = load_model(Path(saved_model_dir) / "model.json")
 
@@ -59,14 +59,11 @@ xgb_model = load_model(Path(saved_model_dir) / "model.json")
 st.sidebar.header("Forecast Settings")
 forecast_days = st.sidebar.slider("Number of days to forecast", 1, 7, 1)
 
-# Read features
-monitor_fg = fs.get_feature_group(
-    name="aq_predictions", 
-    version=FG_VERSIONS["aq_predictions"]
-    )
+# Read features (cached per feature group commit, so moving the slider does not read again)
+monitor_fg = dashboard_data.get_feature_group(fs, "aq_predictions", FG_VERSIONS["aq_predictions"])
 
 forecast_horizon = forecast_days
-forecast_df = monitor_fg.filter(monitor_fg.days_before_forecast_day <= forecast_days).read().iloc[:forecast_days]
+forecast_df = dashboard_data.forecast(monitor_fg, forecast_days).iloc[:forecast_days]
 forecast_df["city"] = city
 forecast_df["street"] = street
 forecast_df["country"] = country
@@ -76,9 +73,10 @@ forecast_df['date'] = pd.date_range(start=today + pd.Timedelta(days=1), periods=
 forecast_df['date'] = pd.to_datetime(forecast_df['date']).dt.date
 forecast_df['days_before_forecast_day'] = range(1, forecast_horizon + 1)
 
-# Plot forecast
-fig = util.plot_air_quality_forecast(city, street, forecast_df, f"air_quality_model/daily_plots/forecast_{today_str}.png")  # saves the plot
-st.pyplot(fig)
+# Plot forecast (only re-rendered when the data differs from the saved PNG)
+forecast_plot_path = f"air_quality_model/daily_plots/forecast_{today_str}.png"
+plotting.render_chart(city, street, forecast_df, forecast_plot_path)
+st.image(forecast_plot_path)
 
 forecast_df = forecast_df.rename(columns={"date": "Date", "predicted_pm25": "Predicted PM2.5"})
 
@@ -87,18 +85,9 @@ st.dataframe(forecast_df.reset_index(drop=True)[['Date', 'Predicted PM2.5']].sor
 
 if st.checkbox("Show Hindcast (1-day prior predictions vs actual PM2.5 readings)"):
     
-    monitoring_df = monitor_fg.filter(
-        (monitor_fg.days_before_forecast_day == 1)
-    ).read()
-    
-    air_quality_fg = fs.get_feature_group(name="air_quality", version=FG_VERSIONS["air_quality"])
-    air_quality_df = air_quality_fg.read()
-    outcome_df = air_quality_df[['date', 'pm2_5']]
-    outcome_df = outcome_df[outcome_df['date'] < today]  # because there were placeholder values in the original data for future dates, we only want previous values
-    preds_df = monitoring_df[['date', 'predicted_pm25']]
-    
-    hindcast_df = pd.merge(preds_df, outcome_df, on="date", how="inner")
-    hindcast_df = hindcast_df.sort_values(["date"], ascending=True)
+    air_quality_fg = dashboard_data.get_feature_group(fs, "air_quality", FG_VERSIONS["air_quality"])
+    # 1-day prior predictions joined with the observed values, cached until either feature group changes
+    hindcast_df = dashboard_data.hindcast(monitor_fg, air_quality_fg, today)
     hindcast_df['date'] = pd.to_datetime(hindcast_df['date']).dt.date
     hindcast_df = hindcast_df.rename(columns={"date": "Date", "predicted_pm25": "Predicted PM2.5", "pm2_5": "PM2.5"})
     
@@ -106,5 +95,9 @@ if st.checkbox("Show Hindcast (1-day prior predictions vs actual PM2.5 readings)
     st.dataframe(hindcast_df.reset_index(drop=True))
     
     hindcast_df_plot = hindcast_df.rename(columns={"Date": "date", "Predicted PM2.5":"predicted_pm25", "PM2.5":"pm2_5"})
-    fig2 = util.plot_air_quality_forecast(city, street, hindcast_df_plot, f"air_quality_model/daily_plots/hindcast_{today_str}.png", hindcast=True)
-    st.pyplot(fig2)
+    hindcast_plot_path = f"air_quality_model/daily_plots/hindcast_{today_str}.png"
+    plotting.render_chart(city, street, hindcast_df_plot, hindcast_plot_path, hindcast=True)
+    st.image(hindcast_plot_path)
+
+with st.sidebar.expander("Cache"):
+    st.dataframe(dashboard_data.get_cache().metrics())
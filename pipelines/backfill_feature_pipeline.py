@@ -1,185 +1,109 @@
-import hopsworks
+import numpy as np
 import pandas as pd
-import requests
-from datetime import datetime, timedelta
 import os
+import sys
 import json
-import time
-import numpy as np
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
 from dotenv import load_dotenv
-import great_expectations as ge
-
-MAX_RETRIES = 3
-WAIT_SECONDS = 5  # wait between retries
-
-def fetch_json(url):
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            resp = requests.get(url, timeout=60)
-            resp.raise_for_status()  
-            return resp.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Attempt {attempt} failed: {e}")
-            if attempt < MAX_RETRIES:
-                print(f"Retrying in {WAIT_SECONDS} seconds...")
-                time.sleep(WAIT_SECONDS)
-            else:
-                raise RuntimeError(f"Failed to fetch data after {MAX_RETRIES} attempts.")
-            
-def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
-    """Remove whitespaces in beginning of column names to make sure they are compatible with Hopsworks"""
-    df.columns = (
-        df.columns
-        .str.strip()            
-        .str.lower()            # lowercase everything
-        .str.replace(" ", "_")  # replace spaces with underscores
-    )
-    # Hopsworks requires names to start with a letter:
-    df.columns = [
-        col if col[0].isalpha() else f"f_{col.lstrip('_')}"
-        for col in df.columns
+sys.path.append(".")
+from air_quality import csv_exports, dashboard_data, feature_store, ingestion, schema, tracing, upserts, validation
+
+# Last 6 years by default
+START_DATE = "2019-11-06"
+END_DATE = "2025-11-06"
+
+def date_chunks(start_date: str, end_date: str, chunk: str = "month"):
+    """Splits [start_date, end_date] into inclusive (start, end) date strings per month or year."""
+    freq = {"month": "MS", "year": "YS"}[chunk]
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    bounds = [start] + [b for b in pd.date_range(start, end, freq=freq) if b > start] + [end + pd.Timedelta(days=1)]
+    return [
+        (lo.strftime("%Y-%m-%d"), (hi - pd.Timedelta(days=1)).strftime("%Y-%m-%d"))
+        for lo, hi in zip(bounds[:-1], bounds[1:])
     ]
-    return df
-
-def validate_with_expectations(df, expectation_suite, name="dataset"):
-    """
-    Run Great Expectations validation before ingestion.
-    Prints results and raises an error if validation fails.
-    """
-    ge_df = ge.from_pandas(df)
-    validation_result = ge_df.validate(expectation_suite=expectation_suite)
-    
-    if not validation_result.success:
-        print(f"Validation failed for {name}")
-        for res in validation_result.results:
-            if not res.success:
-                print(f" - {res.expectation_config.expectation_type} failed: {res.result}")
-        raise ValueError(f"Validation failed for {name}. Check the data.")
-    else:
-        print(f"Validation passed for {name}")
-
-
-def main():
-    with open("city_config/gothenburg_femman.json") as f:
+
+def chunk_id(chunk):
+    return f"{chunk[0]}:{chunk[1]}"
+
+def group_by_chunk(aq_chunks, chunks):
+    """Splits streamed air quality rows by date chunk ({chunk id: [frames]}); rows outside `chunks` are dropped."""
+    groups = {}
+    if not chunks:
+        return groups
+    starts = pd.DatetimeIndex([c[0] for c in chunks])
+    ends = pd.DatetimeIndex([c[1] for c in chunks]).to_numpy()
+    for df in aq_chunks:
+        dates = df["date"].to_numpy()
+        position = starts.searchsorted(dates, side="right") - 1
+        inside = (position >= 0) & (dates <= ends[position.clip(0)])
+        for i in np.unique(position[inside]):
+            groups.setdefault(chunk_id(chunks[i]), []).append(df[inside & (position == i)])
+    return groups
+
+def load_checkpoint(path, run):
+    """Returns the manifest for `run`, or a fresh one if the file belongs to another run."""
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("run") == run:
+            print(f"Resuming backfill: {len(manifest['completed'])} chunks already committed")
+            return manifest
+        print(f"Checkpoint {path} is for a different backfill run, starting over")
+    return {"run": run, "completed": []}
+
+def save_checkpoint(path, manifest):
+    # Write to a temporary file first so an interrupted run never leaves a corrupt manifest
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def fetch_weather_chunk(city_config, start_date, end_date):
+    """Archive weather for all sensors in the config for one chunk (retried with backoff by the shared client)."""
+    region_df = ingestion.fetch_region(city_config, start_date, end_date, sources=("weather",))
+    weather_df = ingestion.split_sources(region_df)["weather"]
+    return weather_df.drop(columns=["sensor_id"])
+
+def insert_chunk(chunk, weather_df, aq_chunk, weather_fg, air_quality_fg, weather_rules):
+    """Aligns, validates and inserts one chunk. Returns the number of common (sensor, day) rows."""
+    # Align both datasets per sensor and day (keep only rows that are in both dataframes)
+    keys = ["city", "street", "date"]
+    weather_index, aq_index = pd.MultiIndex.from_frame(weather_df[keys]), pd.MultiIndex.from_frame(aq_chunk[keys])
+    weather_df = weather_df[weather_index.isin(aq_index)]
+    aq_chunk = aq_chunk[aq_index.isin(weather_index)]
+    if aq_chunk.empty:
+        return 0
+
+    # Validate the weather locally before ingestion (the air quality rows were validated while parsing)
+    validation.validate_or_raise(weather_df, weather_rules, name=f"weather data {chunk_id(chunk)}")
+
+    with tracing.stage("insert_weather", kind="insert", rows_in=len(weather_df), chunk=chunk_id(chunk)):
+        upserts.upsert(weather_fg, schema.for_insert(weather_df, weather_fg))
+    with tracing.stage("insert_air_quality", kind="insert", rows_in=len(aq_chunk), chunk=chunk_id(chunk)):
+        upserts.upsert(air_quality_fg, schema.for_insert(aq_chunk, air_quality_fg))
+    return len(aq_chunk)
+
+
+def main(args):
+    with open(args.city_config) as f:
         city_config = json.load(f)
 
-    LAT = city_config["city_lat"]
-    LON = city_config["city_lon"]
-    SENSOR = city_config["sensors"][0]  # only one station
+    REGION = city_config.get("city_name", city_config.get("region_name"))
     FG_VERSIONS = city_config["fg_versions"]
 
     load_dotenv()
-    hopsworks_key = os.getenv("HOPSWORKS_API_KEY")
-    hopsworks_project = os.getenv("HOPSWORKS_PROJECT")
-    project = hopsworks.login(project=hopsworks_project, api_key_value=hopsworks_key)  
-    fs = project.get_feature_store()
-
-    # Last 6 years
-    START_DATE = "2019-11-06"
-    END_DATE = "2025-11-06"
-
-    # Features
-    historical_weather_url = (
-        f"https://archive-api.open-meteo.com/v1/archive?"
-        f"latitude={LAT}&longitude={LON}"
-        f"&start_date={START_DATE}"
-        f"&end_date={END_DATE}"
-        f"&daily=wind_speed_10m_max,wind_gusts_10m_max,wind_direction_10m_dominant,temperature_2m_max"
-        "&timezone=Europe%2FBerlin"    # same timezone as Sweden     
-    )
-
-    weather_data = fetch_json(historical_weather_url)
-
-    weather_df = pd.DataFrame(weather_data["daily"])
-    print(f"Fetched {len(weather_df)} weather records")
-    weather_df["date"] = pd.to_datetime(weather_df["time"], yearfirst=True)
-    weather_df["country"] = os.getenv("AQICN_COUNTRY")
-    weather_df["city"] = os.getenv("AQICN_CITY")
-    weather_df["street"] = os.getenv("AQICN_STREET")
-    weather_df.drop(columns=["time"], inplace=True)
-    
-    # Data validation
-    weather_expectation_suite = ge.core.ExpectationSuite(
-        expectation_suite_name="weather_expectation_suite"
-    )
-
-    # Check for null values
-    weather_expectation_suite.add_expectation(
-        ge.core.ExpectationConfiguration(
-            expectation_type="expect_column_values_to_not_be_null",
-            kwargs={"column": "temperature_2m_max"}
-        )
-    )
-
-    # Check for reasonable range
-    weather_expectation_suite.add_expectation(
-        ge.core.ExpectationConfiguration(
-            expectation_type="expect_column_values_to_be_between",
-            kwargs={
-                "column": "temperature_2m_max",
-                "min_value": -60.0,
-                "max_value": 60.0
-            }
-        )
-    )
-
-    aqi_csv_path = "data/goteborg-femman-air-quality.csv"  # CSV for Femman
-    df_aq = (
-    pd.read_csv(aqi_csv_path)
-    .pipe(clean_column_names)
-    )
-    df_aq = df_aq[["date", "pm25"]] 
-    df_aq.rename(columns={"pm25": "pm2_5", "date": "date"}, inplace=True)  
-    
-    # Replace missing rows with nan
-    df_aq["pm2_5"].replace(" ", np.nan, inplace=True)  
-    
-    # Make sure the value is a double
-    df_aq["pm2_5"] = df_aq["pm2_5"].astype(float) 
-    
-    # Missing PM2.5 values are filled from the nearest available measurement
-    # df_aq["pm2_5"].interpolate(method='nearest', inplace=True)
-    df_aq.dropna(inplace=True)
-    df_aq["date"] = pd.to_datetime(df_aq["date"], yearfirst=True)       # convert to datetime   
-    # df_aq.drop(columns=["date"], inplace=True)
-
-    # Add location information as columns
-    df_aq["country"] = os.getenv("AQICN_COUNTRY")
-    df_aq["city"] = os.getenv("AQICN_CITY")
-    df_aq["street"] = os.getenv("AQICN_STREET")   # does not have to be an actual street, just a location
-    
-    # Data validation
-    aq_expectation_suite = ge.core.ExpectationSuite(
-        expectation_suite_name="aq_expectation_suite"
-    )
-    
-    # Check for null values
-    aq_expectation_suite.add_expectation(
-        ge.core.ExpectationConfiguration(
-            expectation_type="expect_column_values_to_not_be_null",
-            kwargs={"column": "pm2_5"}
-        )
-    )
+    fs = feature_store.get_feature_store()   # FEATURE_STORE_BACKEND=local writes to data/feature_store
 
-    # Check for reasonable PM2.5 range
-    aq_expectation_suite.add_expectation(
-        ge.core.ExpectationConfiguration(
-            expectation_type="expect_column_values_to_be_between",
-            kwargs={
-                "column": "pm2_5",
-                "min_value": 0.0,
-                "max_value": 500.0,
-                "strict_min": True
-            }
-        )
-    )     
-    
-    # Align both datasets by overlapping dates (keep only dates that are in both dataframes)
-    common_dates = set(weather_df["date"]).intersection(df_aq["date"])
-    weather_df = weather_df[weather_df["date"].isin(common_dates)]
-    df_aq = df_aq[df_aq["date"].isin(common_dates)]
-    
-    print(f"Aligned datasets: {len(common_dates)} common days found")
+    # Data validation rules from the city config, exported as expectation suites for Hopsworks
+    weather_rules = validation.rules_from_config(city_config, "weather")
+    aq_rules = validation.rules_from_config(city_config, "air_quality")
+    weather_expectation_suite = aq_expectation_suite = None
+    if not isinstance(fs, feature_store.LocalFeatureStore):
+        weather_expectation_suite = validation.to_expectation_suite(weather_rules, "weather_expectation_suite")
+        aq_expectation_suite = validation.to_expectation_suite(aq_rules, "aq_expectation_suite")
 
     # Register as feature groups:
     weather_fg = fs.get_or_create_feature_group(
@@ -193,23 +117,71 @@ def main():
 
     air_quality_fg = fs.get_or_create_feature_group(
         name='air_quality',
-        description=f"Air Quality observations daily for {SENSOR['display_name']}",
+        description=f"Air Quality observations daily for {REGION}",
         version=FG_VERSIONS["air_quality"],
         primary_key=['city', 'street', 'date'],
         expectation_suite = aq_expectation_suite,
         event_time="date",
     )
-    
-    # Validate data locally before ingestion
-    validate_with_expectations(weather_df, weather_expectation_suite, name="weather data")
-    validate_with_expectations(df_aq, aq_expectation_suite, name="air quality data")
-
-    # Backfill historical data:
-    weather_fg.insert(weather_df)
-    air_quality_fg.insert(df_aq)
 
-    print(f"Backfill complete! Feature Groups for {SENSOR['display_name']} registered.")
+    # Chunks that were committed by an earlier (interrupted) run are skipped
+    checkpoint_path = args.checkpoint or f"data/backfill_{Path(args.city_config).stem}.checkpoint.json"
+    run = {"city_config": args.city_config, "start_date": args.start_date, "end_date": args.end_date, "chunk": args.chunk}
+    manifest = load_checkpoint(checkpoint_path, run) if not args.fresh else {"run": run, "completed": []}
+    chunks = [c for c in date_chunks(args.start_date, args.end_date, args.chunk) if chunk_id(c) not in manifest["completed"]]
+    print(f"Backfilling {len(chunks)} {args.chunk} chunks from {args.start_date} to {args.end_date}")
+
+    # Every export matching --aq-csv is parsed (in parallel, streaming) and validated block by block.
+    # The exports are not ordered by date, so all their rows are read before the first insert and held
+    # for the run, split by date chunk; each chunk is concatenated (and released) when it is inserted
+    aq_files = csv_exports.match_files(args.aq_csv, city_config)
+    if not aq_files:
+        raise SystemExit(f"No air quality exports for the sensors of {args.city_config} match {args.aq_csv}")
+    print(f"Reading {len(aq_files)} air quality exports")
+    with tracing.stage("read_air_quality", kind="read"):
+        aq_groups = group_by_chunk(csv_exports.stream_exports(aq_files, rules=aq_rules), chunks)
+
+    # Fetch with bounded concurrency, but validate, insert and checkpoint each chunk as it
+    # arrives, so at most `workers` weather chunks are held in memory at a time
+    total_rows = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        pending = iter(chunks)
+        in_flight = {}
+
+        def submit_next():
+            chunk = next(pending, None)
+            if chunk is not None:
+                in_flight[pool.submit(fetch_weather_chunk, city_config, *chunk)] = chunk
+
+        for _ in range(args.workers):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = in_flight.pop(future)
+                weather_df = future.result()
+                aq_chunk = csv_exports.concat_chunks(aq_groups.pop(chunk_id(chunk), []))
+                rows = insert_chunk(chunk, weather_df, aq_chunk, weather_fg, air_quality_fg, weather_rules)
+                total_rows += rows
+                manifest["completed"].append(chunk_id(chunk))
+                save_checkpoint(checkpoint_path, manifest)
+                print(f"Committed chunk {chunk_id(chunk)}: {rows} common rows")
+                submit_next()
+
+    print(f"Aligned datasets: {total_rows} common rows inserted")
+    dashboard_data.invalidate()
+    print(f"Backfill complete! Feature Groups for {REGION} registered.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--city-config", default="city_config/gothenburg_femman.json")
+    ap.add_argument("--aq-csv", default="data/goteborg-femman-air-quality.csv",
+                    help="Glob of air quality exports, e.g. 'data/*-air-quality.csv'")
+    ap.add_argument("--start-date", default=START_DATE)
+    ap.add_argument("--end-date", default=END_DATE)
+    ap.add_argument("--chunk", choices=["month", "year"], default="month")
+    ap.add_argument("--workers", type=int, default=4, help="Chunks fetched concurrently")
+    ap.add_argument("--checkpoint", help="Checkpoint manifest path (default: data/backfill_<config>.checkpoint.json)")
+    ap.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint and start over")
+    main(ap.parse_args())
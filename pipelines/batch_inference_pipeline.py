@@ -1,10 +1,12 @@
 import os
 import json
 import argparse
+import sys
 from datetime import datetime, timedelta
-import joblib
 import pandas as pd
 import hopsworks
+sys.path.append(".")
+from air_quality import model_cache, schema, spatial, tracing
 
 def load_city_config(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -21,29 +23,39 @@ def main(args):
     fv = fs.get_feature_view(name=fv_name, version=fv_version)
 
     start_time = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d")
-    feat_df = fv.get_batch_data(start_time=start_time)
+    with tracing.stage("get_batch_data", kind="read") as s:
+        feat_df = schema.apply(fv.get_batch_data(start_time=start_time))
+        s.rows_out = len(feat_df)
     if feat_df.empty:
         raise SystemExit("No feature rows to infer on — run feature pipeline.")
 
-    mr = project.get_model_registry()
-    model = mr.get_model("air_quality_model")
-    local_dir = model.download()
-    model_path = os.path.join(local_dir, "xgb_pipeline.pkl")
-    model = joblib.load(model_path)
+    # Each (name, version) is downloaded once into .cache/models and compiled once, however many
+    # sensors it serves. Batches of tree_model.XGBOOST_MIN_ROWS rows or more (every model serving
+    # three or more sensors, at 14 rows each) are predicted by the xgboost booster of its model.json
+    models = model_cache.ModelCache(project.get_model_registry())
+    sensor_models = model_cache.sensor_models(cfg)
 
     pred_df = feat_df.sort_values("date").copy()
-    pred_df = pred_df.groupby(["city_name","sensor_id"], as_index=False, group_keys=False).apply(lambda d: d.tail(14))
+    pred_df = pred_df.groupby(["city_name","sensor_id"], observed=True, as_index=False, group_keys=False).apply(lambda d: d.tail(14))
 
-    feature_cols = [c for c in pred_df.columns if c not in ["pm2_5"]]
-    y_hat = model.predict(pred_df[feature_cols])
+    # Sensors sharing a model are predicted in one batch, different models concurrently
+    with tracing.stage("predict", kind="predict", rows_in=len(pred_df)) as s:
+        y_hat = model_cache.predict_sensors(models, pred_df, sensor_models)
+        s.rows_out = len(y_hat)
     pred_df["pm2_5_pred"] = y_hat
 
     os.makedirs("artifacts", exist_ok=True)
     pred_df.to_csv("artifacts/predictions.csv", index=False)
     print("Wrote artifacts/predictions.csv with columns:", list(pred_df.columns))
 
+    if args.grid_out:
+        # Per-sensor predictions interpolated onto the grid of the city config, one grid per date
+        spatial.forecast_grid(pred_df, cfg, value_column="pm2_5_pred").save(args.grid_out)
+        print(f"Wrote {args.grid_out}")
+
 if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--city-config", required=True)
+    ap.add_argument("--grid-out", default=None, help="Also write the predictions interpolated onto a lat/lon grid (.npz)")
     args = ap.parse_args()
     main(args)
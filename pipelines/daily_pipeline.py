@@ -0,0 +1,294 @@
+"""
+Daily feature, training and batch inference pipeline, in one process.
+
+Runs what the daily workflows used to run as notebooks with nbconvert
+(2_air_quality_feature_pipeline.ipynb and 4_batch_inference_pipeline.ipynb),
+plus the incremental model update, as stages of air_quality/dag.py:
+
+    fetch_air_quality ─┐
+    fetch_weather ─────┼─ validate ─ insert_features ─ update_lags ─ train ─ infer ─ render
+    fetch_forecast ────┘
+    fetch_hourly ─ insert_hourly
+
+Stages whose inputs are ready run in parallel (the four fetches start
+together), stages whose inputs did not change since the last run are skipped
+(.cache/pipeline_runs/daily_<config>/) and the time of every stage is printed
+and appended to runs.jsonl there.
+
+    python pipelines/daily_pipeline.py --city-config city_config/gothenburg_femman.json
+    python pipelines/daily_pipeline.py --city-config city_config/gothenburg_femman.json --only infer,render
+    python pipelines/daily_pipeline.py --city-config city_config/vastra_gotaland.json --skip train --force
+"""
+import os
+import sys
+import json
+import argparse
+import threading
+from datetime import date, timedelta
+from functools import partial
+import pandas as pd
+from dotenv import load_dotenv
+sys.path.append(".")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from air_quality import (dag, dashboard_data, feature_store, features, forecasting, hourly, ingestion, model_cache,
+                         plotting, schema, spatial, upserts, validation)
+import incremental_training_pipeline
+
+LOOKBACK_DAYS = 30
+IMAGES_DIR = "air_quality_model/images"
+GRID_FILE = "air_quality_model/pm25_forecast_grid.npz"
+KEYS = ["city", "street"]
+
+
+def load_city_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class DailyRun:
+    """City config and day of a run, and the Hopsworks project and feature store (logged in to on first use)."""
+
+    def __init__(self, cfg: dict, day: date):
+        self.cfg = cfg
+        self.day = day
+        self.local = os.getenv("FEATURE_STORE_BACKEND", "hopsworks").lower() == "local"
+        self._lock = threading.Lock()
+        self._project = self._fs = self._models = None
+
+    def _connect(self):
+        with self._lock:
+            if self._fs is None:
+                if self.local:
+                    self._fs = feature_store.get_feature_store("local")
+                else:
+                    import hopsworks
+                    self._project = hopsworks.login(project=os.getenv("HOPSWORKS_PROJECT"),
+                                                    api_key_value=os.getenv("HOPSWORKS_API_KEY"))
+                    self._fs = feature_store.get_feature_store("hopsworks", project=self._project)
+                    self._models = model_cache.ModelCache(self._project.get_model_registry())
+
+    @property
+    def project(self):
+        self._connect()
+        return self._project
+
+    @property
+    def fs(self):
+        self._connect()
+        return self._fs
+
+    @property
+    def models(self):
+        self._connect()
+        return self._models
+
+    def feature_group(self, name: str, **kwargs):
+        return self.fs.get_or_create_feature_group(name=name, version=self.cfg["fg_versions"][name], **kwargs)
+
+
+# -- stages --------------------------------------------------------------------
+
+def fetch(run: DailyRun, source: str) -> pd.DataFrame:
+    day = run.day.isoformat()
+    region_df = ingestion.fetch_region(run.cfg, day, day, forecast_days=run.cfg["forecast_days"], sources=(source,))
+    df = ingestion.split_sources(region_df)[source]
+    if source == "forecast":
+        # The forecast feature group is keyed on date only, so it keeps the first sensor's forecast
+        return df[df["sensor_id"] == run.cfg["sensors"][0]["id"]].drop(columns=ingestion.LOCATION_COLUMNS)
+    return df.drop(columns=["sensor_id"])
+
+
+def fetch_hourly(run: DailyRun) -> pd.DataFrame:
+    day = run.day.isoformat()
+    return hourly.compact(ingestion.fetch_region_hourly(run.cfg, day, day).drop(columns=["sensor_id"]))
+
+
+def validate(run: DailyRun, air_quality: pd.DataFrame, weather: pd.DataFrame) -> dict:
+    validation.validate_or_raise(air_quality, validation.rules_from_config(run.cfg, "air_quality"),
+                                 name="air quality data")
+    validation.validate_or_raise(weather, validation.rules_from_config(run.cfg, "weather"), name="weather data")
+    return {"air_quality": len(air_quality), "weather": len(weather)}
+
+
+def insert_features(run: DailyRun, air_quality: pd.DataFrame, weather: pd.DataFrame, forecast: pd.DataFrame,
+                    validated: dict) -> dict:
+    city = run.cfg.get("city_name", run.cfg.get("region_name"))
+    aq_suite = weather_suite = None
+    if not run.local:
+        # The validation rules are also registered as expectation suites on the Hopsworks feature groups
+        aq_suite = validation.to_expectation_suite(validation.rules_from_config(run.cfg, "air_quality"),
+                                                   "aq_expectation_suite")
+        weather_suite = validation.to_expectation_suite(validation.rules_from_config(run.cfg, "weather"),
+                                                        "weather_expectation_suite")
+    groups = [
+        (run.feature_group("air_quality", description=f"Air Quality characteristics of each day for {city}",
+                           primary_key=["city", "date", "street"], expectation_suite=aq_suite, event_time="date"),
+         air_quality),
+        (run.feature_group("weather", description=f"Historical weather data for {city}",
+                           primary_key=["city", "date", "street"], expectation_suite=weather_suite, event_time="date"),
+         weather),
+        (run.feature_group("weather_forecast_features", description=f"7-day weather forecast for {city}",
+                           primary_key=["date"], expectation_suite=weather_suite),
+         forecast),
+    ]
+    written = {}
+    for fg, df in groups:
+        result = upserts.upsert(fg, schema.for_insert(df, fg), write_options={"wait_for_job": False})
+        written[fg.name] = result.written
+    dashboard_data.invalidate()
+    return written
+
+
+def insert_hourly(run: DailyRun, hourly_rows: pd.DataFrame) -> dict:
+    city = run.cfg.get("city_name", run.cfg.get("region_name"))
+    hourly_fg = run.feature_group("air_quality_hourly", description=f"Hourly PM2.5 and weather for {city}",
+                                  primary_key=["city", "street", "date"], event_time="date")
+    aggregates_fg = run.feature_group("air_quality_daily_aggregates",
+                                      description=f"Daily aggregates of the hourly PM2.5 and weather for {city}",
+                                      primary_key=["city", "street", "date"], event_time="date")
+    written = {}
+    for fg, df in ((hourly_fg, hourly_rows), (aggregates_fg, hourly.daily_aggregates(hourly_rows))):
+        written[fg.name] = upserts.upsert(fg, schema.for_insert(df, fg), write_options={"wait_for_job": False}).written
+    dashboard_data.invalidate()
+    return written
+
+
+def update_lags(run: DailyRun, feature_rows: dict) -> pd.DataFrame:
+    air_quality_fg = run.fs.get_feature_group(name="air_quality", version=run.cfg["fg_versions"]["air_quality"])
+    lagged_fg = run.feature_group("air_quality_lagged", description="Air quality with lagged PM2.5 features",
+                                  primary_key=["city", "date", "street"], event_time="date")
+    return features.update_lagged_feature_group(air_quality_fg, lagged_fg)
+
+
+def train(run: DailyRun, lagged: pd.DataFrame) -> dict:
+    try:
+        return incremental_training_pipeline.update_model(run.cfg, run.fs, run.project)
+    except FileNotFoundError as e:
+        print(f"Skipping the incremental update: {e}")
+        model = run.cfg.get("model_registry", model_cache.DEFAULT_MODEL)
+        return {"name": model["name"], "version": None, "model_dir": None, "updated": False}
+
+
+def load_model(run: DailyRun, model: dict):
+    """The model returned by `train`, or the one in the city config if training did not run."""
+    if run.project is None:
+        return model_cache.load_tree_model((model or {}).get("model_dir") or incremental_training_pipeline.LOCAL_MODEL_DIR)
+    if not model or model.get("version") is None:
+        model = run.cfg.get("model_registry", model_cache.DEFAULT_MODEL)
+    return run.models.get(model["name"], model["version"])
+
+
+def infer(run: DailyRun, lagged: pd.DataFrame, model: dict) -> pd.DataFrame:
+    """Forecasts every sensor over the forecast days, from the lagged rows stored after `update_lags`."""
+    predictor = load_model(run, model)
+    versions = run.cfg["fg_versions"]
+    forecast_fg = run.fs.get_feature_group(name="weather_forecast_features", version=versions["weather_forecast_features"])
+    lagged_fg = run.fs.get_feature_group(name="air_quality_lagged", version=versions["air_quality_lagged"])
+    lookback_start = run.day - timedelta(days=LOOKBACK_DAYS)
+    history_df = schema.apply(lagged_fg.filter(lagged_fg.date >= str(lookback_start)).read())
+    predictions_df = forecasting.recursive_forecast(predictor, history_df, schema.apply(forecast_fg.read()),
+                                                    horizon=run.cfg["forecast_days"])
+
+    monitor_fg = run.feature_group("aq_predictions", description="Air Quality prediction monitoring",
+                                   primary_key=["city", "street", "date", "days_before_forecast_day"], event_time="date")
+    upserts.upsert(monitor_fg, schema.for_insert(predictions_df, monitor_fg), wait=True)
+    dashboard_data.invalidate()
+    if run.cfg.get("grid"):
+        # Only regional configs define a map grid
+        spatial.forecast_grid(predictions_df, run.cfg).save(GRID_FILE)
+    return predictions_df.sort_values(KEYS + ["date"]).reset_index(drop=True)
+
+
+def _chart_name(prefix: str, city: str, street: str, single: bool) -> str:
+    if single:
+        return os.path.join(IMAGES_DIR, f"{prefix}.png")
+    slug = "".join(c if c.isalnum() else "_" for c in f"{city}_{street}".lower())
+    return os.path.join(IMAGES_DIR, f"{prefix}_{slug}.png")
+
+
+def render(run: DailyRun, predictions: pd.DataFrame) -> list:
+    """Forecast and 1-day hindcast charts of every sensor; returns the chart files."""
+    versions = run.cfg["fg_versions"]
+    monitor_fg = run.fs.get_feature_group(name="aq_predictions", version=versions["aq_predictions"])
+    air_quality_fg = run.fs.get_feature_group(name="air_quality", version=versions["air_quality"])
+    lookback_start = str(run.day - timedelta(days=LOOKBACK_DAYS))
+    monitoring_df = schema.apply(monitor_fg.filter(
+        (monitor_fg.days_before_forecast_day == 1) & (monitor_fg.date >= lookback_start)).read())
+    outcome_df = schema.apply(air_quality_fg.filter(air_quality_fg.date >= lookback_start).read())
+    hindcast_df = pd.DataFrame(columns=KEYS + ["date", forecasting.PREDICTION, "pm2_5"])
+    if not monitoring_df.empty and not outcome_df.empty:
+        hindcast_df = monitoring_df[KEYS + ["date", forecasting.PREDICTION]].merge(
+            outcome_df[KEYS + ["date", "pm2_5"]], on=KEYS + ["date"], how="inner")
+
+    sensors = predictions.groupby(KEYS, observed=True)
+    single = sensors.ngroups == 1
+    jobs = []
+    for (city, street), df in sensors:
+        jobs.append({"city": city, "street": street, "df": df.sort_values("date"),
+                     "file_path": _chart_name("pm25_forecast", city, street, single)})
+        sensor_hindcast = hindcast_df[(hindcast_df["city"] == city) & (hindcast_df["street"] == street)]
+        if not sensor_hindcast.empty:
+            jobs.append({"city": city, "street": street, "df": sensor_hindcast.sort_values("date"),
+                         "file_path": _chart_name("pm25_hindcast_1day", city, street, single), "hindcast": True})
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    plotting.render_many(jobs)
+
+    if run.project is not None:
+        dataset_api = run.project.get_dataset_api()
+        if not dataset_api.exists("Resources/airquality"):
+            dataset_api.mkdir("Resources/airquality")
+        for job in jobs:
+            dataset_api.upload(job["file_path"], f"Resources/airquality/{job['city']}_{job['street']}_{run.day.isoformat()}",
+                               overwrite=True)
+    return [job["file_path"] for job in jobs]
+
+
+def build_pipeline(run: DailyRun, config_name: str) -> dag.Pipeline:
+    day = {"day": run.day.isoformat(), "sensors": run.cfg["sensors"]}
+    Stage = dag.Stage
+    return dag.Pipeline(f"daily_{config_name}", [
+        Stage("fetch_air_quality", partial(fetch, run, "air_quality"), outputs=("air_quality",), params=day,
+              kind="fetch"),
+        Stage("fetch_weather", partial(fetch, run, "weather"), outputs=("weather",), params=day, kind="fetch"),
+        # The forecast changes during the day, so it is fetched again on every run
+        Stage("fetch_forecast", partial(fetch, run, "forecast"), outputs=("forecast",), params=day, kind="fetch",
+              cache=False),
+        Stage("fetch_hourly", partial(fetch_hourly, run), outputs=("hourly_rows",), params=day, kind="fetch"),
+        Stage("validate", partial(validate, run), inputs=("air_quality", "weather"), outputs=("validated",),
+              params={"validation": run.cfg.get("validation")}, kind="validate"),
+        Stage("insert_features", partial(insert_features, run), inputs=("air_quality", "weather", "forecast", "validated"),
+              outputs=("feature_rows",), params={"fg_versions": run.cfg["fg_versions"]}, kind="insert"),
+        Stage("insert_hourly", partial(insert_hourly, run), inputs=("hourly_rows",), outputs=("hourly_written",),
+              params={"fg_versions": run.cfg["fg_versions"]}, kind="insert"),
+        Stage("update_lags", partial(update_lags, run), inputs=("feature_rows",), outputs=("lagged",), kind="insert"),
+        Stage("train", partial(train, run), inputs=("lagged",), outputs=("model",),
+              params={"model_registry": run.cfg.get("model_registry")}, kind="train"),
+        Stage("infer", partial(infer, run), inputs=("lagged", "model"), outputs=("predictions",),
+              params={"forecast_days": run.cfg["forecast_days"], "grid": run.cfg.get("grid")}, kind="predict"),
+        Stage("render", partial(render, run), inputs=("predictions",), outputs=("charts",), kind="plot"),
+    ])
+
+
+def _stage_names(value):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else None
+
+
+def main(args):
+    load_dotenv()
+    cfg = load_city_config(args.city_config)
+    day = date.fromisoformat(args.date) if args.date else date.today() - timedelta(days=1)
+    run = DailyRun(cfg, day)
+    pipeline = build_pipeline(run, os.path.splitext(os.path.basename(args.city_config))[0])
+    return pipeline.run(only=_stage_names(args.only), skip=_stage_names(args.skip), force=args.force,
+                        max_workers=args.workers)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--city-config", default="city_config/gothenburg_femman.json")
+    ap.add_argument("--date", default=None, help="Day to fetch and insert (YYYY-MM-DD, default: yesterday)")
+    ap.add_argument("--only", default=None, help="Comma separated stages to run (default: all)")
+    ap.add_argument("--skip", default=None, help="Comma separated stages not to run")
+    ap.add_argument("--force", action="store_true", help="Run stages even if their inputs did not change")
+    ap.add_argument("--workers", type=int, default=dag.MAX_WORKERS, help="Stages run in parallel")
+    main(ap.parse_args())
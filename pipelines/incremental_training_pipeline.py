@@ -0,0 +1,143 @@
+"""
+Daily incremental model update.
+
+Loads the latest registered model, continues boosting it on the rows added since
+its recorded training cutoff (training_metadata.json), compares it with the
+previous model on the most recent days and registers it only if it is not worse.
+A full retrain with hyperparameter search stays in 3_air_quality_training_pipeline.ipynb.
+
+    python pipelines/incremental_training_pipeline.py --city-config city_config/gothenburg_femman.json
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+from dotenv import load_dotenv
+sys.path.append(".")
+from air_quality import feature_store, model_cache, tracing, training
+
+LOCAL_MODEL_DIR = "air_quality_model"
+HOLDOUT_DAYS = 7
+
+
+def load_city_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def latest_registry_model(project, name):
+    mr = project.get_model_registry()
+    models = mr.get_models(name)
+    if not models:
+        raise SystemExit(f"No registered model named {name}. Run the training pipeline first.")
+    return mr, max(models, key=lambda m: m.version)
+
+
+def read_rows_since(fs, fg_versions, start):
+    """Lagged air quality joined with weather for dates after `start`, like the feature view query."""
+    lagged_fg = fs.get_feature_group(name="air_quality_lagged", version=fg_versions["air_quality_lagged"])
+    weather_fg = fs.get_feature_group(name="weather", version=fg_versions["weather"])
+    lagged_df = lagged_fg.select(["pm2_5"] + training.LAG_COLUMNS + ["date", "city", "street"]).filter(
+        lagged_fg.date > start).read()
+    weather_df = weather_fg.filter(weather_fg.date > start).read()
+    df = lagged_df.merge(weather_df, on=["city", "street", "date"], how="inner")
+    return df.dropna(subset=[training.LABEL]).sort_values("date").reset_index(drop=True)
+
+
+def update_model(cfg, fs, project=None, model_dir=None, rounds=training.INCREMENTAL_ROUNDS,
+                 holdout_days=HOLDOUT_DAYS, tolerance=training.TOLERANCE) -> dict:
+    """
+    Updates the latest model of cfg["model_registry"] (or the model in `model_dir`
+    without a project, for the local backend). Returns the model to predict with
+    afterwards: {"name", "version", "model_dir", "updated"}.
+    """
+    model_name = cfg["model_registry"]["name"]
+    if project is None:
+        registry_model = None
+        model_dir = model_dir or LOCAL_MODEL_DIR
+        parent = os.path.abspath(model_dir)
+    else:
+        mr, registry_model = latest_registry_model(project, model_name)
+        model_dir = model_cache.ModelCache(mr).path(model_name, registry_model.version)
+        parent = f"{model_name}/{registry_model.version}"
+    current = {"name": model_name, "version": getattr(registry_model, "version", None), "model_dir": model_dir,
+               "updated": False}
+
+    meta = training.read_metadata(model_dir)
+    cutoff = meta["training_cutoff"]
+    print(f"Model {parent} was trained on data up to {cutoff.date()}")
+
+    with tracing.stage("read_new_rows", kind="read") as s:
+        df = read_rows_since(fs, cfg["fg_versions"], cutoff)
+        s.rows_out = len(df)
+    train_df, holdout_df = training.split_new_rows(df, cutoff, holdout_days)
+    if train_df.empty or holdout_df.empty:
+        print(f"Not enough new data since {cutoff.date()} ({len(df)} rows), keeping the current model")
+        return current
+
+    previous = training.load_model(model_dir)
+    X_new = training.prepare_features(train_df.drop(columns=[training.LABEL]))
+    y_new = train_df.loc[X_new.index, training.LABEL]
+    X_holdout = training.prepare_features(holdout_df.drop(columns=[training.LABEL]))
+    y_holdout = holdout_df.loc[X_holdout.index, training.LABEL]
+
+    updated = training.warm_start_update(previous, X_new, y_new, n_rounds=rounds)
+    with tracing.stage("compare_on_holdout", kind="predict", rows_in=len(X_holdout)):
+        result = training.compare_on_holdout(previous, updated, X_holdout, y_holdout, tolerance=tolerance)
+    print(f"Holdout MSE over the last {holdout_days} days: previous {result['previous_mse']:.3f}, "
+          f"updated {result['updated_mse']:.3f} ({len(train_df)} new training rows)")
+    if not result["accept"]:
+        print("The updated model is worse on the holdout, keeping the current model")
+        return current
+
+    new_cutoff = pd.to_datetime(train_df["date"], utc=True).max()
+    metrics = {"MSE": str(result["updated_mse"]), "previous MSE": str(result["previous_mse"])}
+    out_dir = model_dir if project is None else tempfile.mkdtemp()
+    if project is not None:
+        # Keep the other artifacts (images) of the previous version
+        shutil.copytree(model_dir, out_dir, dirs_exist_ok=True)
+    updated.save_model(os.path.join(out_dir, training.MODEL_FILE))
+    training.write_metadata(out_dir, new_cutoff, training.fingerprint(X_new, y_new), len(X_new),
+                            mode="incremental", parent=parent, metrics=metrics)
+
+    version = None
+    if project is not None:
+        fv = fs.get_feature_view(name=cfg["feature_view"]["name"], version=cfg["feature_view"]["version"])
+        aq_model = mr.python.create_model(
+            name=model_name,
+            metrics=metrics,
+            feature_view=fv,
+            description=f"Air Quality (PM2.5) predictor, incremental update of version {registry_model.version}",
+        )
+        with tracing.stage("register_model", kind="insert"):
+            aq_model.save(out_dir)
+        version = aq_model.version
+    print(f"Registered the updated model, trained on data up to {new_cutoff.date()}")
+    return {"name": model_name, "version": version, "model_dir": out_dir, "updated": True}
+
+
+def main(args):
+    load_dotenv()
+    cfg = load_city_config(args.city_config)
+    if os.getenv("FEATURE_STORE_BACKEND", "hopsworks").lower() == "local":
+        project, fs = None, feature_store.get_feature_store("local")
+    else:
+        import hopsworks
+        project = hopsworks.login(project=os.getenv("HOPSWORKS_PROJECT"), api_key_value=os.getenv("HOPSWORKS_API_KEY"))
+        fs = feature_store.get_feature_store("hopsworks", project=project)
+    update_model(cfg, fs, project, model_dir=args.model_dir, rounds=args.rounds, holdout_days=args.holdout_days,
+                 tolerance=args.tolerance)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--city-config", required=True)
+    ap.add_argument("--model-dir", help="Model directory for the local backend (default: air_quality_model)")
+    ap.add_argument("--rounds", type=int, default=training.INCREMENTAL_ROUNDS, help="Boosting rounds to add")
+    ap.add_argument("--holdout-days", type=int, default=HOLDOUT_DAYS)
+    ap.add_argument("--tolerance", type=float, default=training.TOLERANCE,
+                    help="Relative holdout MSE increase still accepted")
+    main(ap.parse_args())